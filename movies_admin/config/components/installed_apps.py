@@ -5,5 +5,6 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'movies.apps.MoviesConfig',
 ]
\ No newline at end of file
@@ -1,4 +1,6 @@
 MIDDLEWARE = [
+    # Первым, чтобы учитывать и запросы остальных middleware.
+    'movies.profiling.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -0,0 +1,33 @@
+"""Настройки профилирования запросов к БД."""
+
+import os
+
+# Доля HTTP-запросов, запросы к БД которых профилируются: 0 - выключено, 1 - все.
+SQL_PROFILING_SAMPLE_RATE = float(os.environ.get('SQL_PROFILING_SAMPLE_RATE', 0.01))
+SQL_PROFILING_SLOW_QUERY_MS = float(os.environ.get('SQL_PROFILING_SLOW_QUERY_MS', 100))
+# Столько одинаковых с точностью до значений запросов в одном HTTP-запросе - признак N+1.
+SQL_PROFILING_DUPLICATE_THRESHOLD = int(os.environ.get('SQL_PROFILING_DUPLICATE_THRESHOLD', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        # Сообщение профиля - уже JSON, и сборщик логов разбирает его сам.
+        'json': {
+            'format': '{"time": "%(asctime)s", "level": "%(levelname)s", "logger": "%(name)s", "profile": %(message)s}',
+        },
+    },
+    'handlers': {
+        'profiling': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'movies.profiling': {
+            'handlers': ['profiling'],
+            'level': os.environ.get('SQL_PROFILING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -41,6 +41,10 @@ include(
     'components/middleware.py'
 )
 
+include(
+    'components/profiling.py'
+)
+
 ROOT_URLCONF = 'config.urls'
 
 include(
@@ -15,8 +15,11 @@ Examples:
         2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+from movies.profiling import sql_metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/v1/', include('movies.urls')),
+    path('metrics/sql/', sql_metrics_view),
 ]
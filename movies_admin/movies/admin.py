@@ -1,12 +1,23 @@
 """Настройки админки для приложения movies."""
 
 from django.contrib import admin
-from movies.models import (Filmwork, Genre, GenreFilmwork, Person,
+from django.db.models import QuerySet
+from django.forms import ModelForm
+from django.http import HttpRequest
+from django.utils.translation import gettext_lazy as _
+from movies.filters import (CreationYearFilter, FirstLetterFilter,
+                            GenreFilter, RatingFilter, invalidate_facets)
+from movies.inlines import BulkInlineMixin
+from movies.models import (FILM_WORK_SEARCH_VECTOR, PERSON_SEARCH_VECTOR,
+                           Filmwork, Genre, GenreFilmwork, Person,
                            PersonFilmwork)
+from movies.pagination import KeysetPaginationMixin
+from movies.search import FullTextSearchMixin
+from movies.transfer import TransferMixin
 
 
 @admin.register(Genre)
-class GenreAdmin(admin.ModelAdmin):
+class GenreAdmin(KeysetPaginationMixin, TransferMixin, admin.ModelAdmin):
     """Настройки для модели Genre."""
 
     list_display = ('name', 'description', 'created', 'modified')
@@ -14,13 +25,13 @@ class GenreAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description', 'id')
 
 
-class GenreFilmworkInline(admin.TabularInline):
+class GenreFilmworkInline(BulkInlineMixin, admin.TabularInline):
     """Создаёт поля ввода жанра при редактировании кинопроизведения."""
 
     model = GenreFilmwork
 
 
-class PersonFilmworkInline(admin.TabularInline):
+class PersonFilmworkInline(BulkInlineMixin, admin.TabularInline):
     """Создаёт поля ввода актёра при редактировании кинопроизведения."""
 
     model = PersonFilmwork
@@ -28,7 +39,7 @@ class PersonFilmworkInline(admin.TabularInline):
 
 
 @admin.register(Filmwork)
-class FilmworkAdmin(admin.ModelAdmin):
+class FilmworkAdmin(KeysetPaginationMixin, FullTextSearchMixin, TransferMixin, admin.ModelAdmin):
     """Настройки для модели Filmwork."""
 
     inlines = (GenreFilmworkInline, PersonFilmworkInline)
@@ -37,17 +48,90 @@ class FilmworkAdmin(admin.ModelAdmin):
         'type',
         'creation_date',
         'rating',
+        'genres',
+        'directors',
+        'persons_count',
         'created',
         'modified',
     )
-    list_filter = ('type', 'rating')
+    list_filter = ('type', GenreFilter, RatingFilter, CreationYearFilter)
     search_fields = ('title', 'description', 'id')
+    search_vector = FILM_WORK_SEARCH_VECTOR
+    trigram_field = 'title'
+
+    def save_related(self, request: HttpRequest, form: ModelForm, formsets: list, change: bool) -> None:
+        """
+        Сохраняет жанры и участников и сбрасывает количества фильтра по жанру.
+
+        Встроенные формы пишут связи пакетными запросами без сигналов моделей.
+
+        Args:
+            request: запрос
+            form: форма кинопроизведения
+            formsets: наборы встроенных форм
+            change: кинопроизведение изменяется, а не создаётся
+        """
+        super().save_related(request, form, formsets, change)
+        invalidate_facets(GenreFilmwork)
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        """
+        Кинопроизведения вместе со сводкой по жанрам и участникам.
+
+        Args:
+            request: запрос
+
+        Returns:
+            QuerySet: выборка кинопроизведений
+        """
+        return super().get_queryset(request).select_related('summary')
+
+    @admin.display(description=_('genres'), ordering='summary__genres_count')
+    def genres(self, obj: Filmwork) -> str:
+        """
+        Жанры кинопроизведения из сводки.
+
+        Args:
+            obj: кинопроизведение
+
+        Returns:
+            str: жанры через запятую
+        """
+        return ', '.join(obj.summary.genres) if hasattr(obj, 'summary') else ''
+
+    @admin.display(description=_('directors'))
+    def directors(self, obj: Filmwork) -> str:
+        """
+        Режиссёры кинопроизведения из сводки.
+
+        Args:
+            obj: кинопроизведение
+
+        Returns:
+            str: имена через запятую
+        """
+        return ', '.join(obj.summary.directors) if hasattr(obj, 'summary') else ''
+
+    @admin.display(description=_('persons count'), ordering='summary__persons_count')
+    def persons_count(self, obj: Filmwork) -> int:
+        """
+        Количество участников кинопроизведения из сводки.
+
+        Args:
+            obj: кинопроизведение
+
+        Returns:
+            int: количество участников
+        """
+        return obj.summary.persons_count if hasattr(obj, 'summary') else 0
 
 
 @admin.register(Person)
-class PersonAdmin(admin.ModelAdmin):
+class PersonAdmin(KeysetPaginationMixin, FullTextSearchMixin, TransferMixin, admin.ModelAdmin):
     """Настройки для модели Person."""
 
     list_display = ('full_name', 'modified')
-    list_filter = ('full_name',)
+    list_filter = (FirstLetterFilter,)
     search_fields = ('full_name', 'id')
+    search_vector = PERSON_SEARCH_VECTOR
+    trigram_field = 'full_name'
@@ -1,12 +1,33 @@
 """Настроки приложения movies."""
 
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import pre_migrate
 from django.utils.translation import gettext_lazy as _
 
 
+def create_content_schema(using: str, **kwargs) -> None:
+    """
+    Создаёт схему content перед миграциями, если её ещё нет.
+
+    На базе, созданной по schema_design/movies_database.ddl, схема уже есть,
+    а тестовую базу Django создаёт пустой, и миграциям негде создать таблицы.
+
+    Args:
+        using: алиас мигрируемой БД
+        kwargs: аргументы сигнала
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE SCHEMA IF NOT EXISTS content;')
+
+
 class MoviesConfig(AppConfig):
     """Описывает настройки приложения movies."""
 
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movies'
     verbose_name = _('movies')
+
+    def ready(self) -> None:
+        """Подключает создание схемы content к сигналу pre_migrate."""
+        pre_migrate.connect(create_content_schema, sender=self)
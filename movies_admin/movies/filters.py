@@ -0,0 +1,346 @@
+"""Фильтры админки по корзинам значений с кешированными количествами."""
+
+import datetime
+
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Q, QuerySet
+from django.db.models.expressions import Combinable
+from django.db.models.functions import ExtractYear, Floor, Substr, Upper
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpRequest
+from django.utils.translation import gettext_lazy as _
+
+from movies.models import Filmwork, Genre, GenreFilmwork, Person
+
+# Количества устаревают не позже чем через это время, даже если записи менялись в обход ORM.
+FACET_CACHE_TIMEOUT = 300
+RATING_BUCKET_WIDTH = 1
+# Модели, чьи количества зависят от изменённой модели, кроме неё самой:
+# фильтр по жанру кинопроизведений считается по жанрам и таблице связей.
+FACET_DEPENDENCIES = {
+    Genre: (Filmwork,),
+    GenreFilmwork: (Filmwork,),
+}
+
+
+def facet_cache_key(model: type) -> str:
+    """
+    Ключ кеша количеств всех фильтров модели.
+
+    Args:
+        model: модель
+
+    Returns:
+        str: ключ кеша
+    """
+    return 'movies:facets:{label}'.format(label=model._meta.label_lower)
+
+
+def invalidate_facets(model: type) -> None:
+    """
+    Сбрасывает кешированные количества модели и зависящих от неё моделей.
+
+    Args:
+        model: изменённая модель
+    """
+    cache.delete_many([facet_cache_key(dependent) for dependent in (model, *FACET_DEPENDENCIES.get(model, ()))])
+
+
+# Приёмник post_delete у таблицы связей отключил бы быстрое удаление её строк
+# одним запросом, поэтому пакетные изменения связей сбрасывают кеш сами.
+@receiver(post_save, sender=GenreFilmwork)
+@receiver((post_save, post_delete), sender=Genre)
+@receiver((post_save, post_delete), sender=Person)
+@receiver((post_save, post_delete), sender=Filmwork)
+def invalidate_facet_counts(sender: type, **kwargs) -> None:
+    """
+    Сбрасывает кешированные количества после изменения объекта через ORM.
+
+    Args:
+        sender: модель изменённого объекта
+        kwargs: аргументы сигнала
+    """
+    invalidate_facets(sender)
+
+
+class FacetFilter(admin.SimpleListFilter):
+    """
+    Фильтр по корзинам значений с количеством объектов в каждой.
+
+    Количества всех корзин считаются одним запросом с GROUP BY по выражению
+    bucket (или своим запросом в count_buckets) и кешируются на cache_timeout
+    секунд или до сохранения либо удаления объекта модели. Поэтому боковая
+    панель не читает таблицу при каждом открытии списка. Выбранная корзина
+    отбирается условием bucket_filter, которое должно работать по самой
+    колонке, чтобы Postgres мог использовать индекс.
+    """
+
+    cache_timeout = FACET_CACHE_TIMEOUT
+
+    def bucket(self) -> Combinable:
+        """
+        Выражение, значение которого - корзина объекта.
+
+        Raises:
+            NotImplementedError: метод должен быть переопределён
+        """
+        raise NotImplementedError
+
+    def bucket_filter(self, value: str) -> Q:
+        """
+        Условие отбора объектов корзины.
+
+        Args:
+            value: корзина из строки запроса
+
+        Raises:
+            NotImplementedError: метод должен быть переопределён
+        """
+        raise NotImplementedError
+
+    def bucket_label(self, value: object) -> str:
+        """
+        Подпись корзины.
+
+        Args:
+            value: значение выражения bucket
+
+        Returns:
+            str: подпись
+        """
+        return str(value)
+
+    def bucket_value(self, value: object) -> str:
+        """
+        Значение корзины для строки запроса.
+
+        Args:
+            value: значение выражения bucket
+
+        Returns:
+            str: значение параметра parameter_name
+        """
+        return str(value)
+
+    def bucket_counts(self, queryset: QuerySet) -> list:
+        """
+        Количество объектов в каждой непустой корзине.
+
+        Args:
+            queryset: все объекты списка
+
+        Returns:
+            list: пары (значение bucket, количество) по возрастанию значения
+        """
+        key = facet_cache_key(queryset.model)
+        facets = cache.get(key) or {}
+        if self.parameter_name not in facets:
+            facets[self.parameter_name] = self.count_buckets(queryset)
+            cache.set(key, facets, self.cache_timeout)
+        return facets[self.parameter_name]
+
+    def count_buckets(self, queryset: QuerySet) -> list:
+        """
+        Считает объекты в корзинах одним запросом с GROUP BY, минуя кеш.
+
+        Args:
+            queryset: все объекты списка
+
+        Returns:
+            list: пары (значение bucket, количество) по возрастанию значения
+        """
+        return list(
+            queryset.order_by().annotate(bucket=self.bucket()).filter(bucket__isnull=False)
+            .values_list('bucket').annotate(count=Count('pk')).order_by('bucket'),
+        )
+
+    def lookups(self, request: HttpRequest, model_admin: admin.ModelAdmin) -> list:
+        """
+        Варианты фильтра с количествами.
+
+        Args:
+            request: запрос
+            model_admin: настройки модели в админке
+
+        Returns:
+            list: пары (значение параметра, подпись)
+        """
+        return [
+            (self.bucket_value(value), '{label} ({count})'.format(label=self.bucket_label(value), count=count))
+            for value, count in self.bucket_counts(model_admin.get_queryset(request))
+        ]
+
+    def queryset(self, request: HttpRequest, queryset: QuerySet) -> QuerySet:
+        """
+        Отбирает объекты выбранной корзины.
+
+        Args:
+            request: запрос
+            queryset: выборка списка
+
+        Returns:
+            QuerySet: отфильтрованная выборка
+
+        Raises:
+            IncorrectLookupParameters: значение корзины некорректно
+        """
+        if self.value() is None:
+            return queryset
+        try:
+            return queryset.filter(self.bucket_filter(self.value()))
+        except (ValueError, OverflowError, ValidationError) as error:
+            raise IncorrectLookupParameters(error)
+
+
+class RatingFilter(FacetFilter):
+    """Фильтр по диапазонам рейтинга шириной RATING_BUCKET_WIDTH."""
+
+    title = _('rating')
+    parameter_name = 'rating_range'
+    width = RATING_BUCKET_WIDTH
+
+    def bucket(self) -> Combinable:
+        """
+        Номер диапазона рейтинга.
+
+        Returns:
+            Combinable: FLOOR(rating / width)
+        """
+        return Floor(F('rating') / self.width)
+
+    def bucket_value(self, value: object) -> str:
+        """
+        Номер диапазона для строки запроса.
+
+        Args:
+            value: номер диапазона
+
+        Returns:
+            str: целый номер диапазона
+        """
+        return str(int(value))
+
+    def bucket_label(self, value: object) -> str:
+        """
+        Границы диапазона.
+
+        Args:
+            value: номер диапазона
+
+        Returns:
+            str: нижняя и верхняя граница
+        """
+        return '{lower:g}–{upper:g}'.format(lower=value * self.width, upper=(value + 1) * self.width)
+
+    def bucket_filter(self, value: str) -> Q:
+        """
+        Условие на рейтинг внутри диапазона.
+
+        Args:
+            value: номер диапазона
+
+        Returns:
+            Q: lower <= rating < upper, по индексу film_work_rating_idx
+        """
+        lower = int(value) * self.width
+        return Q(rating__gte=lower, rating__lt=lower + self.width)
+
+
+class CreationYearFilter(FacetFilter):
+    """Фильтр по году создания кинопроизведения."""
+
+    title = _('creation date')
+    parameter_name = 'creation_year'
+
+    def bucket(self) -> Combinable:
+        """
+        Год создания.
+
+        Returns:
+            Combinable: EXTRACT(YEAR FROM creation_date)
+        """
+        return ExtractYear('creation_date')
+
+    def bucket_filter(self, value: str) -> Q:
+        """
+        Условие на дату создания внутри года.
+
+        Args:
+            value: год
+
+        Returns:
+            Q: диапазон дат года, по индексу film_work_creation_date_idx
+        """
+        year = int(value)
+        return Q(creation_date__gte=datetime.date(year, 1, 1), creation_date__lt=datetime.date(year + 1, 1, 1))
+
+
+class GenreFilter(FacetFilter):
+    """Фильтр по жанру кинопроизведения."""
+
+    title = _('Genre')
+    parameter_name = 'genre'
+
+    def count_buckets(self, queryset: QuerySet) -> list:
+        """
+        Считает кинопроизведения каждого жанра по таблице связей.
+
+        Args:
+            queryset: все объекты списка
+
+        Returns:
+            list: пары (название жанра, количество) по алфавиту
+        """
+        return list(
+            GenreFilmwork.objects.filter(film_work__in=queryset.order_by().values('pk'))
+            .values_list('genre__name').annotate(count=Count('film_work', distinct=True)).order_by('genre__name'),
+        )
+
+    def bucket_filter(self, value: str) -> Q:
+        """
+        Условие на жанр в сводке кинопроизведения.
+
+        Args:
+            value: название жанра
+
+        Returns:
+            Q: массив жанров сводки содержит жанр, по нему используется GIN-индекс
+        """
+        return Q(summary__genres__contains=[value])
+
+
+class FirstLetterFilter(FacetFilter):
+    """Фильтр по первой букве полного имени."""
+
+    title = _('full name')
+    parameter_name = 'full_name_letter'
+
+    def bucket(self) -> Combinable:
+        """
+        Первая буква имени в верхнем регистре.
+
+        Returns:
+            Combinable: UPPER(SUBSTRING(full_name, 1, 1))
+        """
+        return Upper(Substr('full_name', 1, 1))
+
+    def bucket_filter(self, value: str) -> Q:
+        """
+        Условие на начало имени.
+
+        Args:
+            value: буква
+
+        Returns:
+            Q: имя начинается с буквы в любом регистре
+
+        Raises:
+            ValueError: передана не одна буква
+        """
+        if len(value) != 1:
+            raise ValueError('Expected a single letter, got {value!r}'.format(value=value))
+        return Q(full_name__startswith=value.upper()) | Q(full_name__startswith=value.lower())
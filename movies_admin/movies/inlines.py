@@ -0,0 +1,313 @@
+"""Встроенные формы админки, число запросов которых не зависит от количества строк."""
+
+from typing import Iterable, Iterator, Optional
+
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.db.models import Model, QuerySet
+from django.forms import BaseInlineFormSet, ModelChoiceField, ModelForm
+from django.forms.models import ModelChoiceIterator
+from django.http import HttpRequest
+from django.utils.functional import cached_property
+
+
+class RelatedObjectCache(object):
+    """Объекты, доступные полю выбора всех форм набора, по строковому значению ключа."""
+
+    def __init__(self) -> None:
+        """Init метод."""
+        self.objects: dict = {}
+        self.choices: Optional[list] = None
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    """Варианты выбора, которые читаются из базы один раз на все формы набора."""
+
+    def __iter__(self) -> Iterator:
+        """
+        Перебирает варианты выбора.
+
+        Список сохраняется, только если его дочитали до конца: виджету Select
+        для атрибута required нужен лишь первый вариант, и ради него не стоит
+        читать всю таблицу.
+
+        Yields:
+            tuple: значение и подпись варианта
+        """
+        cache = self.field.cache
+        if cache.choices is not None:
+            yield from cache.choices
+            return
+        choices = []
+        for choice in super().__iter__():
+            choices.append(choice)
+            yield choice
+        cache.choices = choices
+
+
+class CachedModelChoiceField(ModelChoiceField):
+    """
+    Поле выбора объекта, которое берёт объекты из общего для набора форм кеша.
+
+    Формы набора получают глубокие копии поля, а кеш при копировании не
+    копируется, поэтому он общий для всех строк. Объекты, которых нет в кеше,
+    ищутся запросом, как в ModelChoiceField.
+    """
+
+    iterator = CachedModelChoiceIterator
+
+    def __init__(self, queryset: QuerySet, *, cache: Optional[RelatedObjectCache] = None, **kwargs) -> None:
+        """
+        Init метод.
+
+        Args:
+            queryset: объекты, из которых можно выбирать
+            cache: кеш объектов; по умолчанию у поля свой кеш
+            kwargs: именованные аргументы ModelChoiceField
+        """
+        self.cache = RelatedObjectCache() if cache is None else cache
+        super().__init__(queryset, **kwargs)
+
+    @property
+    def key(self) -> str:
+        """
+        Поле объекта, значение которого передаётся в форме.
+
+        Returns:
+            str: имя поля
+        """
+        return self.to_field_name or 'pk'
+
+    def add(self, objects: Iterable[Model]) -> None:
+        """
+        Кладёт объекты в кеш.
+
+        Args:
+            objects: объекты модели поля
+        """
+        for obj in objects:
+            self.cache.objects[str(getattr(obj, self.key))] = obj
+
+    def prefetch(self, values: Iterable) -> None:
+        """
+        Загружает одним запросом объекты, которых ещё нет в кеше.
+
+        Args:
+            values: значения ключа из форм; пустые и некорректные пропускаются
+        """
+        missing = {
+            str(value) for value in values
+            if value not in self.empty_values and str(value) not in self.cache.objects
+        }
+        if not missing:
+            return
+        try:
+            self.add(self.queryset.filter(**{'{key}__in'.format(key=self.key): missing}))
+        except (ValueError, TypeError, ValidationError):
+            # Ошибку в значении покажет проверка формы.
+            return
+
+    def to_python(self, value: object) -> Optional[Model]:
+        """
+        Возвращает объект по значению из формы.
+
+        Args:
+            value: значение ключа
+
+        Returns:
+            Optional[Model]: объект или None для пустого значения
+        """
+        if value not in self.empty_values:
+            obj = self.cache.objects.get(str(value))
+            if obj is not None:
+                return obj
+        return super().to_python(value)
+
+
+class CachedAutocompleteSelect(AutocompleteSelect):
+    """Виджет автодополнения, который берёт подписи выбранных объектов из кеша поля."""
+
+    def optgroups(self, name: str, value: list, attr: Optional[dict] = None) -> list:
+        """
+        Строит варианты для выбранных значений.
+
+        Args:
+            name: имя поля
+            value: выбранные значения
+            attr: атрибуты вариантов
+
+        Returns:
+            list: группы вариантов; если какого-то объекта нет в кеше, они строятся запросом
+        """
+        field = self.choices.field
+        cache = getattr(field, 'cache', None)
+        selected = [str(key) for key in value if str(key) not in field.empty_values]
+        if cache is None or any(key not in cache.objects for key in selected):
+            return super().optgroups(name, value, attr)
+        options: list = []
+        if not self.is_required and not self.allow_multiple_selected:
+            options.append(self.create_option(name, '', '', False, 0))
+        for key in selected:
+            options.append(self.create_option(
+                name, key, field.label_from_instance(cache.objects[key]), True, len(options),
+            ))
+        return [(None, options, 0)]
+
+
+class BulkInlineForm(ModelForm):
+    """Форма строки набора, которая не проверяет внешние ключи повторным запросом."""
+
+    def _get_validation_exclusions(self) -> list:
+        exclude = super()._get_validation_exclusions()
+        # Поле выбора уже нашло объект в своём queryset с учётом limit_choices_to,
+        # а ForeignKey.validate сделал бы ещё один запрос на каждую строку.
+        exclude.extend(
+            name for name, field in self.fields.items()
+            if isinstance(field, CachedModelChoiceField) and name not in exclude
+        )
+        return exclude
+
+
+class BulkInlineFormSet(BaseInlineFormSet):
+    """
+    Набор встроенных форм с общими вариантами выбора и пакетным сохранением.
+
+    Связанные объекты всех строк загружаются одним запросом на поле, а
+    сохранение выполняет по одному DELETE, UPDATE и INSERT на набор. Сигналы
+    pre_save и post_save при этом не отправляются, а собственные
+    many-to-many поля у моделей строк не поддерживаются.
+    """
+
+    @cached_property
+    def forms(self) -> list:
+        """
+        Формы набора с заполненным кешем связанных объектов.
+
+        Returns:
+            list: формы
+        """
+        forms = super().forms
+        for name, field in self.form.base_fields.items():
+            if not isinstance(field, CachedModelChoiceField):
+                continue
+            model_field = self.model._meta.get_field(name)
+            field.add(
+                model_field.get_cached_value(form.instance) for form in forms if model_field.is_cached(form.instance)
+            )
+            field.prefetch(
+                form[name].value() for form in forms
+            )
+        return forms
+
+    def add_fields(self, form, index: Optional[int]) -> None:
+        """
+        Добавляет служебные поля и подменяет поле первичного ключа на кешируемое.
+
+        Args:
+            form: форма строки
+            index: номер формы
+        """
+        super().add_fields(form, index)
+        pk_name = self._pk_field.name
+        field = form.fields[pk_name]
+        if isinstance(field, ModelChoiceField) and not isinstance(field, CachedModelChoiceField):
+            form.fields[pk_name] = CachedModelChoiceField(
+                field.queryset, cache=self._pk_cache, initial=field.initial, required=False, widget=field.widget,
+            )
+
+    @cached_property
+    def _pk_cache(self) -> RelatedObjectCache:
+        # Строки набора уже прочитаны для initial-форм, поэтому первичные ключи проверяются без запросов.
+        cache = RelatedObjectCache()
+        cache.objects = {str(obj.pk): obj for obj in self.get_queryset()}
+        return cache
+
+    def save(self, commit: bool = True) -> list:
+        """
+        Сохраняет изменения всех строк пакетными запросами.
+
+        Args:
+            commit: записать изменения в БД; иначе - поведение BaseInlineFormSet
+
+        Returns:
+            list: изменённые и созданные объекты
+        """
+        if not commit:
+            return super().save(commit=False)
+        self.new_objects, self.changed_objects, self.deleted_objects = [], [], []
+        changed_fields = set()
+        deleted_forms = self.deleted_forms
+        for form in self.initial_forms:
+            obj = form.instance
+            if obj.pk is None:
+                continue
+            if form in deleted_forms:
+                self.deleted_objects.append(obj)
+            elif form.has_changed():
+                self.changed_objects.append((obj, form.changed_data))
+                changed_fields.update(form.changed_data)
+        for form in self.extra_forms:
+            if not form.has_changed() or (self.can_delete and self._should_delete_form(form)):
+                continue
+            setattr(form.instance, self.fk.name, self.instance)
+            self.new_objects.append(form.instance)
+
+        manager = self.model._default_manager
+        if self.deleted_objects:
+            manager.filter(pk__in=[obj.pk for obj in self.deleted_objects]).delete()
+        fields = [
+            field.name for field in self.model._meta.concrete_fields
+            if field.name in changed_fields and not field.primary_key
+        ]
+        changed = [obj for obj, _ in self.changed_objects]
+        if changed and fields:
+            manager.bulk_update(changed, fields)
+        if self.new_objects:
+            manager.bulk_create(self.new_objects)
+        return changed + self.new_objects
+
+
+class BulkInlineMixin(object):
+    """
+    Подключает к InlineModelAdmin BulkInlineFormSet.
+
+    Связанные объекты строк читаются вместе со строками через select_related,
+    а поля внешних ключей и автодополнения используют общий кеш набора форм.
+    Собственная форма инлайна должна наследоваться от BulkInlineForm.
+    """
+
+    form = BulkInlineForm
+    formset = BulkInlineFormSet
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        """
+        Строки набора вместе со связанными объектами, кроме родительского.
+
+        Args:
+            request: запрос
+
+        Returns:
+            QuerySet: выборка строк
+        """
+        related = [
+            field.name for field in self.model._meta.concrete_fields
+            if field.many_to_one and field.related_model is not self.parent_model
+        ]
+        return super().get_queryset(request).select_related(*related)
+
+    def formfield_for_foreignkey(self, db_field, request: HttpRequest, **kwargs) -> Optional[ModelChoiceField]:
+        """
+        Создаёт кешируемое поле выбора для внешнего ключа.
+
+        Args:
+            db_field: внешний ключ модели
+            request: запрос
+            kwargs: именованные аргументы поля
+
+        Returns:
+            Optional[ModelChoiceField]: поле формы
+        """
+        if 'widget' not in kwargs and db_field.name in self.get_autocomplete_fields(request):
+            kwargs['widget'] = CachedAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        kwargs.setdefault('form_class', CachedModelChoiceField)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -0,0 +1,73 @@
+"""
+Замер времени ответа API на странице наибольшего размера.
+
+Запросы идут в настроенную БД, поэтому замер имеет смысл на базе с реальным
+объёмом данных, а не в модульных тестах: там число запросов к БД проверяет
+assertNumQueries, а время ответа зависит от машины.
+
+Запуск:
+    python manage.py benchmark_api [--samples N] [--check]
+"""
+
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import resolve
+
+from movies.views import LATENCY_TARGET_MS, MAX_PAGE_SIZE
+
+LIST_URL = '/api/v1/movies/'
+DEFAULT_SAMPLES = 20
+
+
+class Command(BaseCommand):
+    """Замеряет p50 и p95 времени ответа списка кинопроизведений при page_size = MAX_PAGE_SIZE."""
+
+    help = 'Measure the latency of the largest movies API page against LATENCY_TARGET_MS.'
+
+    def add_arguments(self, parser) -> None:
+        """
+        Добавляет аргументы команды.
+
+        Args:
+            parser: разборщик аргументов
+        """
+        parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='number of timed requests')
+        parser.add_argument('--check', action='store_true', help='fail if p95 exceeds LATENCY_TARGET_MS')
+
+    def handle(self, *args, **options) -> None:
+        """
+        Выполняет замер.
+
+        Args:
+            args: позиционные аргументы
+            options: аргументы командной строки
+
+        Raises:
+            CommandError: API ответил ошибкой, замеров меньше двух или, с --check, p95 превышает LATENCY_TARGET_MS
+        """
+        if options['samples'] < 2:
+            raise CommandError('--samples must be at least 2')
+        view = resolve(LIST_URL).func
+        request = RequestFactory().get(LIST_URL, {'page_size': MAX_PAGE_SIZE})
+        # Первый запрос прогревает соединение и кеши процесса и в замер не входит.
+        response = view(request)
+        if response.status_code != 200:
+            raise CommandError('{url} answered {status}'.format(url=LIST_URL, status=response.status_code))
+        rows = len(json.loads(response.content)['results'])
+        if rows < MAX_PAGE_SIZE:
+            self.stderr.write('Only {rows} film works in the database, the page is not full'.format(rows=rows))
+        durations = []
+        for _ in range(options['samples']):
+            started = time.perf_counter()
+            view(request)
+            durations.append((time.perf_counter() - started) * 1000)
+        p95 = statistics.quantiles(durations, n=20)[-1]
+        self.stdout.write('rows={rows} p50={p50:.1f}ms p95={p95:.1f}ms max={max:.1f}ms target={target}ms'.format(
+            rows=rows, p50=statistics.median(durations), p95=p95, max=max(durations), target=LATENCY_TARGET_MS,
+        ))
+        if options['check'] and p95 > LATENCY_TARGET_MS:
+            raise CommandError('p95 {p95:.1f}ms exceeds {target}ms'.format(p95=p95, target=LATENCY_TARGET_MS))
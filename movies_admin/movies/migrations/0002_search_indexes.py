@@ -0,0 +1,40 @@
+# Generated by Django 3.2 on 2026-10-18 15:33
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # Индексы строятся без блокировки записи в таблицы, а CREATE INDEX CONCURRENTLY не работает в транзакции.
+    atomic = False
+
+    dependencies = [
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='filmwork',
+            index=GinIndex(
+                SearchVector('title', config='simple', weight='A')
+                + SearchVector('description', config='simple', weight='B'),
+                name='film_work_search_idx',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='filmwork',
+            index=GinIndex(fields=['title'], name='film_work_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='person',
+            index=GinIndex(SearchVector('full_name', config='simple'), name='person_search_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='person',
+            index=GinIndex(fields=['full_name'], name='person_full_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
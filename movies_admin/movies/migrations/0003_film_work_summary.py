@@ -0,0 +1,206 @@
+# Generated by Django 3.2 on 2026-10-18 15:42
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Сводка пересчитывается целиком для затронутых кинопроизведений: запись в
+# таблицы связей обычно идёт пачками, и триггеры уровня оператора получают все
+# изменённые строки сразу через таблицы переходов.
+FILM_WORK_SUMMARY_SQL = '''
+ALTER TABLE content.film_work_summary
+    ADD CONSTRAINT film_work_summary_film_work_id_fk
+    FOREIGN KEY (film_work_id) REFERENCES content.film_work (id) ON DELETE CASCADE;
+
+CREATE FUNCTION content.refresh_film_work_summary(film_work_ids uuid[]) RETURNS void AS $$
+BEGIN
+    -- Пересчёты одного кинопроизведения из разных транзакций идут по очереди:
+    -- иначе последняя из них записала бы сводку, не видя изменений другой.
+    PERFORM 1 FROM content.film_work WHERE id = ANY(film_work_ids) ORDER BY id FOR NO KEY UPDATE;
+    INSERT INTO content.film_work_summary AS summary (
+        film_work_id, genres, actors, directors, writers, genres_count, persons_count, refreshed
+    )
+    WITH film_genres AS (
+        SELECT
+            gfw.film_work_id,
+            array_agg(DISTINCT g.name ORDER BY g.name) AS genres,
+            count(DISTINCT g.id) AS genres_count
+        FROM content.genre_film_work gfw
+        JOIN content.genre g ON g.id = gfw.genre_id
+        WHERE gfw.film_work_id = ANY(film_work_ids)
+        GROUP BY gfw.film_work_id
+    ), film_persons AS (
+        SELECT
+            pfw.film_work_id,
+            array_agg(DISTINCT p.full_name ORDER BY p.full_name) FILTER (WHERE pfw.role = 'actor') AS actors,
+            array_agg(DISTINCT p.full_name ORDER BY p.full_name) FILTER (WHERE pfw.role = 'director') AS directors,
+            array_agg(DISTINCT p.full_name ORDER BY p.full_name) FILTER (WHERE pfw.role = 'writer') AS writers,
+            count(DISTINCT p.id) AS persons_count
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = ANY(film_work_ids)
+        GROUP BY pfw.film_work_id
+    )
+    SELECT
+        fw.id,
+        COALESCE(g.genres, '{}'),
+        COALESCE(p.actors, '{}'),
+        COALESCE(p.directors, '{}'),
+        COALESCE(p.writers, '{}'),
+        COALESCE(g.genres_count, 0),
+        COALESCE(p.persons_count, 0),
+        now()
+    FROM content.film_work fw
+    LEFT JOIN film_genres g ON g.film_work_id = fw.id
+    LEFT JOIN film_persons p ON p.film_work_id = fw.id
+    WHERE fw.id = ANY(film_work_ids)
+    ON CONFLICT (film_work_id) DO UPDATE SET
+        genres = EXCLUDED.genres,
+        actors = EXCLUDED.actors,
+        directors = EXCLUDED.directors,
+        writers = EXCLUDED.writers,
+        genres_count = EXCLUDED.genres_count,
+        persons_count = EXCLUDED.persons_count,
+        refreshed = EXCLUDED.refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION content.film_work_summary_film_work_inserted() RETURNS trigger AS $$
+BEGIN
+    PERFORM content.refresh_film_work_summary(ARRAY(SELECT id FROM new_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION content.film_work_summary_link_changed() RETURNS trigger AS $$
+DECLARE
+    film_work_ids uuid[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        film_work_ids := ARRAY(SELECT DISTINCT film_work_id FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        film_work_ids := ARRAY(SELECT DISTINCT film_work_id FROM old_rows);
+    ELSE
+        film_work_ids := ARRAY(SELECT film_work_id FROM new_rows UNION SELECT film_work_id FROM old_rows);
+    END IF;
+    PERFORM content.refresh_film_work_summary(film_work_ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION content.film_work_summary_genre_renamed() RETURNS trigger AS $$
+BEGIN
+    PERFORM content.refresh_film_work_summary(ARRAY(
+        SELECT DISTINCT gfw.film_work_id
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        JOIN content.genre_film_work gfw ON gfw.genre_id = n.id
+        WHERE n.name IS DISTINCT FROM o.name
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION content.film_work_summary_person_renamed() RETURNS trigger AS $$
+BEGIN
+    PERFORM content.refresh_film_work_summary(ARRAY(
+        SELECT DISTINCT pfw.film_work_id
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        JOIN content.person_film_work pfw ON pfw.person_id = n.id
+        WHERE n.full_name IS DISTINCT FROM o.full_name
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Таблицы переходов нельзя объявить у триггера сразу на несколько событий.
+CREATE TRIGGER film_work_summary_insert AFTER INSERT ON content.film_work
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_summary_film_work_inserted();
+
+CREATE TRIGGER film_work_summary_insert AFTER INSERT ON content.genre_film_work
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_summary_link_changed();
+CREATE TRIGGER film_work_summary_update AFTER UPDATE ON content.genre_film_work
+    REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_summary_link_changed();
+CREATE TRIGGER film_work_summary_delete AFTER DELETE ON content.genre_film_work
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_summary_link_changed();
+
+CREATE TRIGGER film_work_summary_insert AFTER INSERT ON content.person_film_work
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_summary_link_changed();
+CREATE TRIGGER film_work_summary_update AFTER UPDATE ON content.person_film_work
+    REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_summary_link_changed();
+CREATE TRIGGER film_work_summary_delete AFTER DELETE ON content.person_film_work
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_summary_link_changed();
+
+CREATE TRIGGER film_work_summary_update AFTER UPDATE ON content.genre
+    REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_summary_genre_renamed();
+CREATE TRIGGER film_work_summary_update AFTER UPDATE ON content.person
+    REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_summary_person_renamed();
+
+SELECT content.refresh_film_work_summary(ARRAY(SELECT id FROM content.film_work));
+'''
+
+DROP_FILM_WORK_SUMMARY_SQL = '''
+DROP TRIGGER film_work_summary_update ON content.person;
+DROP TRIGGER film_work_summary_update ON content.genre;
+DROP TRIGGER film_work_summary_delete ON content.person_film_work;
+DROP TRIGGER film_work_summary_update ON content.person_film_work;
+DROP TRIGGER film_work_summary_insert ON content.person_film_work;
+DROP TRIGGER film_work_summary_delete ON content.genre_film_work;
+DROP TRIGGER film_work_summary_update ON content.genre_film_work;
+DROP TRIGGER film_work_summary_insert ON content.genre_film_work;
+DROP TRIGGER film_work_summary_insert ON content.film_work;
+DROP FUNCTION content.film_work_summary_person_renamed();
+DROP FUNCTION content.film_work_summary_genre_renamed();
+DROP FUNCTION content.film_work_summary_link_changed();
+DROP FUNCTION content.film_work_summary_film_work_inserted();
+DROP FUNCTION content.refresh_film_work_summary(uuid[]);
+ALTER TABLE content.film_work_summary DROP CONSTRAINT film_work_summary_film_work_id_fk;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilmworkSummary',
+            fields=[
+                ('film_work', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='summary', serialize=False, to='movies.filmwork', verbose_name='Filmwork')),
+                ('genres', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None, verbose_name='genres')),
+                ('actors', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None, verbose_name='actors')),
+                ('directors', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None, verbose_name='directors')),
+                ('writers', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None, verbose_name='writers')),
+                ('genres_count', models.IntegerField(default=0, verbose_name='genres count')),
+                ('persons_count', models.IntegerField(default=0, verbose_name='persons count')),
+                ('refreshed', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Filmwork summary',
+                'verbose_name_plural': 'Filmwork summaries',
+                'db_table': 'content"."film_work_summary',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='filmworksummary',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['genres'], name='film_work_summary_genres_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmworksummary',
+            index=models.Index(fields=['persons_count'], name='film_work_summary_persons_idx'),
+        ),
+        migrations.RunSQL(FILM_WORK_SUMMARY_SQL, DROP_FILM_WORK_SUMMARY_SQL),
+    ]
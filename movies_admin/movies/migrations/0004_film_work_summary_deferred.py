@@ -0,0 +1,63 @@
+# Generated by Django 3.2 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+# Загрузчики из SQLite пишут таблицы связей несколькими процессами и фиксируют
+# по несколько пачек в транзакции. Немедленный пересчёт сводки блокирует строки
+# film_work до фиксации, поэтому два процесса, затронувшие одни кинопроизведения
+# в разном порядке, взаимно блокировались бы, а сводка пересчитывалась бы после
+# каждой пачки. Сессия с movies.film_work_summary = 'deferred' только запоминает
+# затронутые кинопроизведения, а refresh_pending_film_work_summaries пересчитывает
+# их одним проходом в конце загрузки. Админка и CDC пересчитывают сразу.
+DEFERRED_SUMMARY_SQL = '''
+CREATE TABLE content.film_work_summary_pending (film_work_id uuid NOT NULL);
+
+ALTER FUNCTION content.refresh_film_work_summary(uuid[]) RENAME TO compute_film_work_summary;
+
+CREATE FUNCTION content.refresh_film_work_summary(film_work_ids uuid[]) RETURNS void AS $$
+BEGIN
+    IF current_setting('movies.film_work_summary', true) = 'deferred' THEN
+        INSERT INTO content.film_work_summary_pending SELECT unnest(film_work_ids);
+    ELSE
+        PERFORM content.compute_film_work_summary(film_work_ids);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION content.refresh_pending_film_work_summaries() RETURNS void AS $$
+DECLARE
+    film_work_ids uuid[];
+BEGIN
+    WITH pending AS (
+        DELETE FROM content.film_work_summary_pending RETURNING film_work_id
+    )
+    SELECT array_agg(DISTINCT film_work_id) INTO film_work_ids FROM pending;
+    IF film_work_ids IS NOT NULL THEN
+        PERFORM content.compute_film_work_summary(film_work_ids);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+DROP_DEFERRED_SUMMARY_SQL = '''
+SELECT content.refresh_pending_film_work_summaries();
+DROP FUNCTION content.refresh_pending_film_work_summaries();
+DROP FUNCTION content.refresh_film_work_summary(uuid[]);
+ALTER FUNCTION content.compute_film_work_summary(uuid[]) RENAME TO refresh_film_work_summary;
+DROP TABLE content.film_work_summary_pending;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_film_work_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filmworksummary',
+            index=models.Index(fields=['genres_count'], name='film_work_summary_gen_cnt_idx'),
+        ),
+        migrations.RunSQL(DEFERRED_SUMMARY_SQL, DROP_DEFERRED_SUMMARY_SQL),
+    ]
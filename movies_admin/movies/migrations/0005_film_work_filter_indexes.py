@@ -0,0 +1,21 @@
+# Generated by Django 3.2 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_film_work_summary_deferred'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['rating'], name='film_work_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['creation_date'], name='film_work_creation_date_idx'),
+        ),
+    ]
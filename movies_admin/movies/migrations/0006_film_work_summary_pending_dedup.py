@@ -0,0 +1,53 @@
+# Generated by Django 3.2 on 2026-10-18 19:40
+
+from django.db import migrations
+
+# Каждая пачка таблицы связей добавляла в очередь все свои кинопроизведения,
+# и очередь росла на число записанных связей, а не кинопроизведений. Теперь
+# id, уже стоящие в очереди, не добавляются повторно; проверка идёт по индексу.
+# Уникальный ключ здесь не подходит: вставка id, добавленного незафиксированной
+# транзакцией другого загрузчика, ждала бы её фиксации, и загрузчики снова
+# блокировали бы друг друга. Такие редкие повторы убирает DISTINCT при разборе
+# очереди в refresh_pending_film_work_summaries.
+DEDUP_PENDING_SQL = '''
+CREATE INDEX film_work_summary_pending_idx ON content.film_work_summary_pending (film_work_id);
+
+CREATE OR REPLACE FUNCTION content.refresh_film_work_summary(film_work_ids uuid[]) RETURNS void AS $$
+BEGIN
+    IF current_setting('movies.film_work_summary', true) = 'deferred' THEN
+        INSERT INTO content.film_work_summary_pending
+        SELECT DISTINCT new_id FROM unnest(film_work_ids) AS new_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM content.film_work_summary_pending pending WHERE pending.film_work_id = new_id
+        );
+    ELSE
+        PERFORM content.compute_film_work_summary(film_work_ids);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+RESTORE_PENDING_SQL = '''
+CREATE OR REPLACE FUNCTION content.refresh_film_work_summary(film_work_ids uuid[]) RETURNS void AS $$
+BEGIN
+    IF current_setting('movies.film_work_summary', true) = 'deferred' THEN
+        INSERT INTO content.film_work_summary_pending SELECT unnest(film_work_ids);
+    ELSE
+        PERFORM content.compute_film_work_summary(film_work_ids);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP INDEX content.film_work_summary_pending_idx;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_film_work_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DEDUP_PENDING_SQL, RESTORE_PENDING_SQL),
+    ]
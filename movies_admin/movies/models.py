@@ -2,10 +2,22 @@
 
 import uuid
 
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+# Конфигурация без стемминга: в каталоге названия и имена и на русском, и на английском.
+SEARCH_CONFIG = 'simple'
+# Выражения индексов полнотекстового поиска: запрос должен строить их так же, чтобы Postgres выбрал индекс.
+FILM_WORK_SEARCH_VECTOR = (
+    SearchVector('title', config=SEARCH_CONFIG, weight='A')
+    + SearchVector('description', config=SEARCH_CONFIG, weight='B')
+)
+PERSON_SEARCH_VECTOR = SearchVector('full_name', config=SEARCH_CONFIG)
+
 
 class TimeStampedMixin(models.Model):
     """Миксина для добавления полей created и modified."""
@@ -92,6 +104,12 @@ class Filmwork(TimeStampedMixin, UUIDMixin):
         db_table = "content\".\"film_work"
         verbose_name = _('Filmwork')
         verbose_name_plural = _('Filmworks')
+        indexes = [
+            GinIndex(FILM_WORK_SEARCH_VECTOR, name='film_work_search_idx'),
+            GinIndex(fields=['title'], name='film_work_title_trgm_idx', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['rating'], name='film_work_rating_idx'),
+            models.Index(fields=['creation_date'], name='film_work_creation_date_idx'),
+        ]
 
     def __str__(self):
         """
@@ -114,6 +132,10 @@ class Person(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"person"
         verbose_name = _('Person')
         verbose_name_plural = _('Persons')
+        indexes = [
+            GinIndex(PERSON_SEARCH_VECTOR, name='person_search_idx'),
+            GinIndex(fields=['full_name'], name='person_full_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         """
@@ -154,3 +176,42 @@ class PersonFilmwork(UUIDMixin):
         db_table = "content\".\"person_film_work"
         verbose_name = _('Filmwork person')
         verbose_name_plural = _('Filmwork persons')
+
+
+class FilmworkSummary(models.Model):
+    """
+    Описывает сводку по кинопроизведению для списков: жанры, участников по ролям и их количество.
+
+    Таблицу заполняют триггеры Postgres при изменении кинопроизведений, их
+    жанров и участников, в том числе при пакетной записи и загрузке из SQLite,
+    которые не отправляют сигналы Django. Через ORM она только читается.
+    """
+
+    film_work = models.OneToOneField(
+        'Filmwork',
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        related_name='summary',
+        # Внешний ключ с ON DELETE CASCADE создаёт миграция.
+        db_constraint=False,
+        verbose_name=_('Filmwork'),
+    )
+    genres = ArrayField(models.TextField(), default=list, verbose_name=_('genres'))
+    actors = ArrayField(models.TextField(), default=list, verbose_name=_('actors'))
+    directors = ArrayField(models.TextField(), default=list, verbose_name=_('directors'))
+    writers = ArrayField(models.TextField(), default=list, verbose_name=_('writers'))
+    genres_count = models.IntegerField(_('genres count'), default=0)
+    persons_count = models.IntegerField(_('persons count'), default=0)
+    refreshed = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """Дополнительные настройки."""
+
+        db_table = "content\".\"film_work_summary"
+        verbose_name = _('Filmwork summary')
+        verbose_name_plural = _('Filmwork summaries')
+        indexes = [
+            GinIndex(fields=['genres'], name='film_work_summary_genres_idx'),
+            models.Index(fields=['persons_count'], name='film_work_summary_persons_idx'),
+            models.Index(fields=['genres_count'], name='film_work_summary_gen_cnt_idx'),
+        ]
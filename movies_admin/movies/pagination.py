@@ -0,0 +1,295 @@
+"""Подсчёт и постраничный вывод списков админки для больших таблиц."""
+
+import base64
+import json
+import operator
+from functools import reduce
+from typing import Optional
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.http import HttpRequest
+from django.utils.functional import cached_property
+
+# До этого количества строк результат считается точно, дальше - оценивается.
+EXACT_COUNT_LIMIT = 10000
+CURSOR_VAR = 'cursor'
+# Оценка планировщика, пересчитанная на текущий размер таблицы, как это делает сам Postgres.
+TABLE_ESTIMATE_QUERY = """
+SELECT (CASE WHEN relpages > 0
+    THEN reltuples / relpages * (pg_relation_size(oid) / current_setting('block_size')::int)
+    ELSE reltuples END)::bigint
+FROM pg_class WHERE oid = %s::regclass;
+"""
+
+
+def table_row_estimate(queryset: QuerySet) -> int:
+    """
+    Оценивает количество строк таблицы модели по статистике pg_class.
+
+    Args:
+        queryset: выборка из таблицы
+
+    Returns:
+        int: оценка; -1, если таблица ещё не анализировалась
+    """
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        cursor.execute(TABLE_ESTIMATE_QUERY, [connection.ops.quote_name(queryset.model._meta.db_table)])
+        return cursor.fetchone()[0]
+
+
+def plan_row_estimate(queryset: QuerySet) -> int:
+    """
+    Оценивает количество строк выборки по плану запроса, не выполняя его.
+
+    Args:
+        queryset: выборка
+
+    Returns:
+        int: ожидаемое планировщиком количество строк
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) {sql}'.format(sql=sql), params)
+        return int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+
+
+def estimate_count(queryset: QuerySet, exact_limit: int = EXACT_COUNT_LIMIT) -> tuple:
+    """
+    Считает строки выборки точно, если их не больше exact_limit, иначе оценивает.
+
+    Количество строк всей таблицы берётся из pg_class. Отфильтрованная выборка
+    считается с LIMIT exact_limit + 1, поэтому подсчёт большой выборки стоит не
+    дороже чтения exact_limit строк, после чего количество оценивается по плану запроса.
+
+    Args:
+        queryset: выборка
+        exact_limit: наибольшее количество строк, которое считается точно
+
+    Returns:
+        tuple: количество строк и признак того, что это оценка
+    """
+    queryset = queryset.order_by()
+    if not queryset.query.where:
+        estimate = table_row_estimate(queryset)
+        if estimate > exact_limit:
+            return estimate, True
+    count = queryset[:exact_limit + 1].count()
+    if count <= exact_limit:
+        return count, False
+    return max(plan_row_estimate(queryset), count), True
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, который оценивает количество строк больших выборок вместо COUNT(*)."""
+
+    exact_count_limit = EXACT_COUNT_LIMIT
+    is_estimate = False
+
+    @cached_property
+    def count(self) -> int:
+        """
+        Количество строк выборки.
+
+        Returns:
+            int: точное количество или оценка, если строк больше exact_count_limit
+        """
+        count, self.is_estimate = estimate_count(self.object_list, self.exact_count_limit)
+        return count
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Список объектов админки с переходом на соседние страницы по ключу.
+
+    Ссылки на предыдущую и следующую страницу несут значения колонок сортировки
+    крайней строки текущей страницы, и соседняя страница выбирается условием по
+    ним, а не OFFSET, поэтому глубина страницы не влияет на время запроса.
+    Сортировка должна заканчиваться уникальной колонкой, а все её колонки -
+    быть полями модели без NULL; иначе, как и переход по номеру страницы, используется OFFSET.
+    Количество строк больших выборок оценивается, см. estimate_count.
+    """
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        """
+        Строит выборку списка, убирая курсор из параметров фильтрации.
+
+        Args:
+            request: запрос
+
+        Returns:
+            QuerySet: отфильтрованная и упорядоченная выборка
+        """
+        # Курсор относится только к текущей странице: ссылки фильтров и сортировки его не наследуют.
+        self.cursor = self.params.pop(CURSOR_VAR, None)
+        return super().get_queryset(request)
+
+    def get_results(self, request: HttpRequest) -> None:
+        """
+        Выбирает строки текущей страницы.
+
+        Args:
+            request: запрос
+
+        Raises:
+            IncorrectLookupParameters: номер страницы или курсор некорректны
+        """
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        result_count = paginator.count
+        if self.model_admin.show_full_result_count:
+            full_result_count, self.full_result_count_is_estimate = estimate_count(
+                self.root_queryset, getattr(paginator, 'exact_count_limit', EXACT_COUNT_LIMIT),
+            )
+        else:
+            full_result_count, self.full_result_count_is_estimate = None, False
+        can_show_all = result_count <= self.list_max_show_all
+        multi_page = result_count > self.list_per_page
+        self.keyset = self.get_keyset(self.queryset)
+
+        if (self.show_all and can_show_all) or not multi_page:
+            result_list = self.queryset._clone()
+        elif self.cursor and self.keyset:
+            result_list = self.seek(self.cursor)
+        else:
+            try:
+                result_list = paginator.page(self.page_num).object_list
+            except InvalidPage:
+                raise IncorrectLookupParameters
+
+        self.result_count = result_count
+        self.result_count_is_estimate = getattr(paginator, 'is_estimate', False)
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.show_admin_actions = not self.show_full_result_count or bool(full_result_count)
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
+
+    def get_keyset(self, queryset: QuerySet) -> Optional[list]:
+        """
+        Определяет колонки сортировки, по которым можно искать соседнюю страницу.
+
+        Args:
+            queryset: упорядоченная выборка списка
+
+        Returns:
+            Optional[list]: пары (поле, по убыванию) или None, если сортировка для этого не подходит
+        """
+        keyset = []
+        for ordering in queryset.query.order_by:
+            if not isinstance(ordering, str):
+                return None
+            name = ordering.lstrip('-')
+            try:
+                field = self.lookup_opts.pk if name == 'pk' else self.lookup_opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.is_relation or field.null:
+                return None
+            keyset.append((field, ordering.startswith('-')))
+            if field.unique:
+                return keyset
+        return None
+
+    def seek(self, cursor: str) -> QuerySet:
+        """
+        Выбирает страницу, соседнюю со строкой из курсора.
+
+        Args:
+            cursor: курсор из ссылки на предыдущую или следующую страницу
+
+        Returns:
+            QuerySet: строки страницы в порядке списка
+
+        Raises:
+            IncorrectLookupParameters: курсор повреждён или построен для другой сортировки
+        """
+        try:
+            token = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            fields = [field.name for field, _ in self.keyset]
+            if token['fields'] != fields:
+                raise ValueError('Cursor was built for ordering {fields}'.format(fields=token['fields']))
+            values = [field.to_python(value) for (field, _), value in zip(self.keyset, token['values'])]
+            self.page_num = int(token['page'])
+        except (ValueError, TypeError, KeyError, ValidationError) as error:
+            raise IncorrectLookupParameters(error)
+        before = token['before']
+        conditions = []
+        equal = Q()
+        for (field, descending), value in zip(self.keyset, values):
+            lookup = 'lt' if descending != before else 'gt'
+            conditions.append(equal & Q(**{'{name}__{lookup}'.format(name=field.attname, lookup=lookup): value}))
+            equal &= Q(**{field.attname: value})
+        page = self.queryset.filter(reduce(operator.or_, conditions))
+        if not before:
+            return page[:self.list_per_page]
+        # Предыдущая страница - первые строки в обратном порядке, но показываются они в прямом.
+        return self.queryset.filter(pk__in=page.reverse().values('pk')[:self.list_per_page])
+
+    @cached_property
+    def previous_page_url(self) -> Optional[str]:
+        """
+        Ссылка на предыдущую страницу по ключу первой строки текущей.
+
+        Returns:
+            Optional[str]: ссылка или None на первой странице
+        """
+        if not self.keyset or self.page_num <= 1:
+            return None
+        if self.page_num == 2:
+            return self.get_query_string(remove=[PAGE_VAR])
+        rows = list(self.result_list)
+        return self._cursor_url(rows[0], self.page_num - 1, before=True) if rows else None
+
+    @cached_property
+    def next_page_url(self) -> Optional[str]:
+        """
+        Ссылка на следующую страницу по ключу последней строки текущей.
+
+        Returns:
+            Optional[str]: ссылка или None на последней странице
+        """
+        if not self.keyset or not self.multi_page:
+            return None
+        rows = list(self.result_list)
+        if len(rows) < self.list_per_page:
+            return None
+        if not self.result_count_is_estimate and self.page_num * self.list_per_page >= self.result_count:
+            return None
+        return self._cursor_url(rows[-1], self.page_num + 1, before=False)
+
+    def _cursor_url(self, row: object, page_num: int, before: bool) -> str:
+        token = {
+            'page': page_num,
+            'before': before,
+            'fields': [field.name for field, _ in self.keyset],
+            # value_to_string сохраняет микросекунды дат, в отличие от DjangoJSONEncoder.
+            'values': [field.value_to_string(row) for field, _ in self.keyset],
+        }
+        cursor = base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+        return self.get_query_string({PAGE_VAR: page_num, CURSOR_VAR: cursor})
+
+
+class KeysetPaginationMixin(object):
+    """Подключает к ModelAdmin оценку количества строк и переход по страницам по ключу."""
+
+    paginator = EstimatedCountPaginator
+
+    def get_changelist(self, request: HttpRequest, **kwargs) -> type:
+        """
+        Возвращает класс списка объектов.
+
+        Args:
+            request: запрос
+            kwargs: именованные аргументы ModelAdmin.get_changelist
+
+        Returns:
+            type: KeysetChangeList
+        """
+        return KeysetChangeList
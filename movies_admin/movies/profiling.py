@@ -0,0 +1,353 @@
+"""Профилирование запросов к БД при обработке HTTP-запросов: количество, время, повторы и медленные запросы."""
+
+import functools
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import HttpRequest, HttpResponse, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+# Значения по умолчанию для настроек SQL_PROFILING_*.
+SAMPLE_RATE = 0.0
+SLOW_QUERY_MS = 100.0
+DUPLICATE_THRESHOLD = 5
+FINGERPRINT_CACHE_SIZE = 2 ** 12
+# Сколько разных повторяющихся запросов хранится для одного представления.
+MAX_FINGERPRINTS = 20
+SQL_LOG_LENGTH = 1000
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+# Списки IN разной длины и VALUES пакетной вставки дают один отпечаток.
+PLACEHOLDER_LIST_RE = re.compile(r'%s(?:\s*,\s*%s)*')
+ROW_LIST_RE = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))*')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def fingerprint(sql: str) -> str:
+    """
+    Приводит SQL к виду, одинаковому для запросов, которые отличаются только значениями.
+
+    Args:
+        sql: текст запроса с плейсхолдерами
+
+    Returns:
+        str: отпечаток запроса
+    """
+    sql = STRING_LITERAL_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_LIST_RE.sub('?', sql)
+    sql = ROW_LIST_RE.sub('(?)', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder(object):
+    """
+    Обёртка connection.execute_wrapper, которая считает запросы одного HTTP-запроса.
+
+    На каждый запрос к БД тратится два вызова perf_counter и поиск отпечатка в
+    кеше, параметры запросов не сохраняются.
+    """
+
+    def __init__(self, slow_query_ms: float) -> None:
+        """
+        Init метод.
+
+        Args:
+            slow_query_ms: запросы дольше этого времени в миллисекундах считаются медленными
+        """
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints: Counter = Counter()
+        self.fingerprint_seconds: Counter = Counter()
+        self.slow: list = []
+
+    def __call__(self, execute: Callable, sql: str, params, many: bool, context: dict):
+        """
+        Выполняет запрос и учитывает его.
+
+        Args:
+            execute: следующая обёртка или выполнение запроса
+            sql: текст запроса
+            params: параметры
+            many: executemany
+            context: соединение и курсор
+
+        Returns:
+            object: результат execute
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            key = fingerprint(sql)
+            self.count += 1
+            self.seconds += seconds
+            self.fingerprints[key] += 1
+            self.fingerprint_seconds[key] += seconds
+            if seconds >= self.slow_query_seconds:
+                self.slow.append((key, seconds, context['connection'].alias))
+
+    def duplicates(self, threshold: int) -> list:
+        """
+        Запросы, повторённые не меньше threshold раз: признак N+1.
+
+        Args:
+            threshold: наименьшее число повторов
+
+        Returns:
+            list: пары (отпечаток, количество) по убыванию количества
+        """
+        return [(key, count) for key, count in self.fingerprints.most_common() if count >= threshold]
+
+
+@dataclass
+class ViewMetrics:
+    """Накопленные метрики запросов к БД одного представления."""
+
+    requests: int = 0
+    queries: int = 0
+    db_seconds: float = 0.0
+    max_queries: int = 0
+    slow_queries: int = 0
+    duplicate_requests: int = 0
+    duplicates: Counter = field(default_factory=Counter)
+
+
+class SqlMetrics(object):
+    """
+    Метрики профилированных запросов процесса по представлениям.
+
+    Каждый процесс сервера копит свои метрики; эндпоинт отдаёт метрики того
+    процесса, который его обслужил.
+    """
+
+    def __init__(self) -> None:
+        """Init метод."""
+        self.lock = threading.Lock()
+        self.views: dict = {}
+
+    def observe(self, view: str, recorder: QueryRecorder, duplicates: list) -> None:
+        """
+        Учитывает один профилированный запрос.
+
+        Args:
+            view: имя представления
+            recorder: запросы к БД
+            duplicates: повторяющиеся запросы
+        """
+        with self.lock:
+            metrics = self.views.setdefault(view, ViewMetrics())
+            metrics.requests += 1
+            metrics.queries += recorder.count
+            metrics.db_seconds += recorder.seconds
+            metrics.max_queries = max(metrics.max_queries, recorder.count)
+            metrics.slow_queries += len(recorder.slow)
+            if duplicates:
+                metrics.duplicate_requests += 1
+            for key, count in duplicates:
+                if key in metrics.duplicates or len(metrics.duplicates) < MAX_FINGERPRINTS:
+                    metrics.duplicates[key] += count
+
+    def summary(self) -> dict:
+        """
+        Собирает метрики в словарь, пригодный для сериализации в JSON.
+
+        Returns:
+            dict: {имя представления: метрики}
+        """
+        with self.lock:
+            return {
+                view: {
+                    'requests': metrics.requests,
+                    'queries': metrics.queries,
+                    'mean_queries': metrics.queries / metrics.requests,
+                    'max_queries': metrics.max_queries,
+                    'db_seconds': metrics.db_seconds,
+                    'slow_queries': metrics.slow_queries,
+                    'duplicate_requests': metrics.duplicate_requests,
+                    'duplicates': dict(metrics.duplicates.most_common()),
+                }
+                for view, metrics in sorted(self.views.items())
+            }
+
+    def prometheus(self) -> str:
+        """
+        Метрики в текстовом формате Prometheus.
+
+        Returns:
+            str: текст метрик
+        """
+        counters = (
+            ('django_sql_profiled_requests_total', 'Profiled requests.', 'requests'),
+            ('django_sql_queries_total', 'Queries issued by profiled requests.', 'queries'),
+            ('django_sql_seconds_total', 'Time spent in the database by profiled requests.', 'db_seconds'),
+            ('django_sql_slow_queries_total', 'Queries slower than SQL_PROFILING_SLOW_QUERY_MS.', 'slow_queries'),
+            ('django_sql_duplicate_requests_total', 'Profiled requests with repeated queries.', 'duplicate_requests'),
+        )
+        summary = self.summary()
+        lines = []
+        for name, description, key in counters:
+            lines.append('# HELP {name} {description}'.format(name=name, description=description))
+            lines.append('# TYPE {name} counter'.format(name=name))
+            for view, metrics in summary.items():
+                lines.append('{name}{{view="{view}"}} {value}'.format(name=name, view=view, value=metrics[key]))
+        return '\n'.join(lines) + '\n'
+
+
+sql_metrics = SqlMetrics()
+
+
+class QueryProfilingMiddleware(object):
+    """
+    Профилирует запросы к БД случайной доли HTTP-запросов.
+
+    Доля задаётся SQL_PROFILING_SAMPLE_RATE; остальные запросы обходятся одним
+    вызовом random. По каждому профилированному запросу в лог movies.profiling
+    пишется JSON с количеством запросов к БД, их временем, повторяющимися
+    запросами (не меньше SQL_PROFILING_DUPLICATE_THRESHOLD раз) и запросами
+    дольше SQL_PROFILING_SLOW_QUERY_MS, а метрики копятся в SqlMetrics. Для
+    потоковых ответов учитываются и запросы, выполненные при отдаче тела.
+    """
+
+    def __init__(self, get_response: Callable) -> None:
+        """
+        Init метод.
+
+        Args:
+            get_response: следующий обработчик
+        """
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Обрабатывает запрос, профилируя его с вероятностью SQL_PROFILING_SAMPLE_RATE.
+
+        Args:
+            request: запрос
+
+        Returns:
+            HttpResponse: ответ
+        """
+        sample_rate = getattr(settings, 'SQL_PROFILING_SAMPLE_RATE', SAMPLE_RATE)
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return self.get_response(request)
+        recorder = QueryRecorder(getattr(settings, 'SQL_PROFILING_SLOW_QUERY_MS', SLOW_QUERY_MS))
+        start = time.perf_counter()
+        with self.recording(recorder):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.record_stream(
+                request, response, response.streaming_content, recorder, start,
+            )
+        else:
+            self.report(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    def recording(self, recorder: QueryRecorder) -> ExitStack:
+        """
+        Подключает recorder ко всем соединениям с БД.
+
+        Args:
+            recorder: обёртка запросов
+
+        Returns:
+            ExitStack: контекст, на время которого запросы учитываются
+        """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def record_stream(
+        self, request: HttpRequest, response: HttpResponse, content: Iterator[bytes], recorder: QueryRecorder,
+        start: float,
+    ) -> Iterator[bytes]:
+        """
+        Отдаёт тело потокового ответа, учитывая запросы при его формировании.
+
+        Args:
+            request: запрос
+            response: потоковый ответ
+            content: исходное тело ответа
+            recorder: обёртка запросов
+            start: время начала обработки запроса
+
+        Yields:
+            bytes: кусок тела
+        """
+        try:
+            with self.recording(recorder):
+                yield from content
+        finally:
+            self.report(request, response, recorder, time.perf_counter() - start)
+
+    def report(self, request: HttpRequest, response: HttpResponse, recorder: QueryRecorder, seconds: float) -> None:
+        """
+        Пишет профиль запроса в лог и метрики.
+
+        Args:
+            request: запрос
+            response: ответ
+            recorder: учтённые запросы к БД
+            seconds: время обработки запроса
+        """
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        duplicates = recorder.duplicates(getattr(settings, 'SQL_PROFILING_DUPLICATE_THRESHOLD', DUPLICATE_THRESHOLD))
+        sql_metrics.observe(view, recorder, duplicates)
+        profile = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'duration_ms': round(seconds * 1000, 3),
+            'queries': recorder.count,
+            'db_ms': round(recorder.seconds * 1000, 3),
+            'duplicates': [
+                {
+                    'sql': key[:SQL_LOG_LENGTH],
+                    'count': count,
+                    'db_ms': round(recorder.fingerprint_seconds[key] * 1000, 3),
+                }
+                for key, count in duplicates
+            ],
+            'slow': [
+                {'sql': key[:SQL_LOG_LENGTH], 'db_ms': round(query_seconds * 1000, 3), 'database': alias}
+                for key, query_seconds, alias in recorder.slow
+            ],
+        }
+        level = logging.WARNING if duplicates or recorder.slow else logging.INFO
+        logger.log(level, json.dumps(profile, ensure_ascii=False))
+
+
+@staff_member_required
+def sql_metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Отдаёт метрики профилированных запросов этого процесса.
+
+    Args:
+        request: запрос; с format=prometheus метрики отдаются в формате Prometheus
+
+    Returns:
+        HttpResponse: метрики в JSON или Prometheus
+    """
+    if request.GET.get('format') == 'prometheus':
+        return HttpResponse(sql_metrics.prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+    return JsonResponse({'views': sql_metrics.summary()}, json_dumps_params={'ensure_ascii': False})
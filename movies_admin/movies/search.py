@@ -0,0 +1,100 @@
+"""Поиск в админке по полнотекстовым и триграммным индексам Postgres."""
+
+import uuid
+from typing import Optional
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import Q, QuerySet, TextField
+from django.db.models.expressions import Combinable
+from django.db.models.lookups import IContains, Lookup
+from django.http import HttpRequest
+
+from movies.models import SEARCH_CONFIG
+
+# Триграммный индекс помогает поиску подстроки только начиная с трёх символов.
+TRIGRAM_MIN_LENGTH = 3
+
+
+@TextField.register_lookup
+class ILikeContains(IContains):
+    """
+    Поиск подстроки без учёта регистра через ILIKE.
+
+    Стандартный icontains строит UPPER(поле) LIKE UPPER(шаблон), а такое
+    выражение не покрывается индексом gin_trgm_ops по самому полю.
+    """
+
+    lookup_name = 'ilike'
+
+    def as_sql(self, compiler, connection):
+        """
+        Строит условие поле ILIKE '%подстрока%'.
+
+        Args:
+            compiler: компилятор запроса
+            connection: соединение с БД
+
+        Returns:
+            tuple: SQL и параметры
+        """
+        lhs, lhs_params = Lookup.process_lhs(self, compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '{lhs} ILIKE {rhs}'.format(lhs=lhs, rhs=rhs), lhs_params + rhs_params
+
+
+def parse_uuid(term: str) -> Optional[uuid.UUID]:
+    """
+    Распознаёт в строке поиска UUID.
+
+    Args:
+        term: строка поиска
+
+    Returns:
+        Optional[uuid.UUID]: UUID или None, если строка им не является
+    """
+    try:
+        return uuid.UUID(term)
+    except ValueError:
+        return None
+
+
+class FullTextSearchMixin(object):
+    """
+    Заменяет поиск админки по search_fields на поиск по индексам.
+
+    UUID ищется по первичному ключу. Остальные строки ищутся по словам через
+    search_vector, по подстроке и с опечатками через триграммы trigram_field.
+    Результаты упорядочены по убыванию релевантности, если пользователь не
+    выбрал сортировку по колонке. search_fields остаются нужны админке для
+    отображения строки поиска и autocomplete_fields.
+    """
+
+    search_vector: Optional[Combinable] = None
+    trigram_field: Optional[str] = None
+
+    def get_search_results(self, request: HttpRequest, queryset: QuerySet, search_term: str) -> tuple:
+        """
+        Отбирает строки, подходящие под строку поиска.
+
+        Args:
+            request: запрос
+            queryset: исходная выборка
+            search_term: строка поиска
+
+        Returns:
+            tuple: выборка и признак возможных дублей, всегда False
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        pk = parse_uuid(term)
+        if pk is not None:
+            return queryset.filter(pk=pk), False
+        query = SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+        condition = Q(search_vector=query) | Q(**{'{field}__trigram_similar'.format(field=self.trigram_field): term})
+        if len(term) >= TRIGRAM_MIN_LENGTH:
+            condition |= Q(**{'{field}__ilike'.format(field=self.trigram_field): term})
+        queryset = queryset.alias(search_vector=self.search_vector).filter(condition).annotate(
+            search_rank=SearchRank(self.search_vector, query) + TrigramSimilarity(self.trigram_field, term),
+        )
+        return queryset.order_by('-search_rank'), False
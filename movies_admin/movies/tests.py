@@ -1 +1,701 @@
 """Тесты для приложения movies."""
+
+import base64
+import datetime
+import json
+import uuid
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+from movies.filters import CreationYearFilter, GenreFilter, RatingFilter, facet_cache_key
+from movies.models import Filmwork, FilmworkSummary, Genre, GenreFilmwork, Person, PersonFilmwork
+from movies.pagination import CURSOR_VAR, EstimatedCountPaginator, estimate_count
+from movies.profiling import QueryRecorder, fingerprint, sql_metrics
+from movies.search import parse_uuid
+from movies.transfer import CatalogueImporter
+from movies.views import MAX_PAGE_SIZE
+
+# Количество страниц и их запрос; не зависит от размера страницы.
+LIST_QUERIES = 2
+DETAIL_QUERIES = 1
+
+
+class MoviesApiTest(TestCase):
+    """Тесты API кинопроизведений."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Создаёт кинопроизведения с жанрами и участниками всех ролей."""
+        genres = Genre.objects.bulk_create(Genre(name='Genre {index}'.format(index=index)) for index in range(3))
+        persons = Person.objects.bulk_create(
+            Person(full_name='Person {index}'.format(index=index)) for index in range(6)
+        )
+        cls.films = Filmwork.objects.bulk_create(
+            Filmwork(
+                title='Film {index}'.format(index=index),
+                creation_date=datetime.date(2000, 1, 1),
+                rating=5,
+                type='movies',
+            )
+            for index in range(30)
+        )
+        GenreFilmwork.objects.bulk_create(
+            GenreFilmwork(film_work=film, genre=genre) for film in cls.films for genre in genres[:2]
+        )
+        PersonFilmwork.objects.bulk_create(
+            PersonFilmwork(film_work=film, person=person, role=role)
+            for film in cls.films
+            for person, role in zip(persons, ('actor', 'actor', 'director', 'writer', 'writer', 'writer'))
+        )
+        cls.empty = Filmwork.objects.create(title='Empty', creation_date=datetime.date(2000, 1, 1), rating=0)
+
+    def test_list_query_count_does_not_depend_on_page_size(self) -> None:
+        """Страница любого размера выбирается одним и тем же числом запросов."""
+        for page_size in (1, 10, MAX_PAGE_SIZE):
+            with self.subTest(page_size=page_size), self.assertNumQueries(LIST_QUERIES):
+                response = self.client.get('/api/v1/movies/', {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), min(page_size, len(self.films) + 1))
+
+    def test_list_pages(self) -> None:
+        """Страницы покрывают все кинопроизведения без повторов."""
+        ids = []
+        page = 1
+        while page:
+            data = self.client.get('/api/v1/movies/', {'page': page, 'page_size': 7}).json()
+            ids.extend(film['id'] for film in data['results'])
+            page = data['next']
+        self.assertEqual(data['count'], len(self.films) + 1)
+        self.assertEqual(data['total_pages'], 5)
+        self.assertCountEqual(ids, [str(film.pk) for film in [*self.films, self.empty]])
+
+    def test_list_rejects_bad_page(self) -> None:
+        """Некорректные номер и размер страницы дают 400."""
+        for params in ({'page': 100}, {'page': 'x'}, {'page_size': 0}, {'page_size': MAX_PAGE_SIZE + 1}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/v1/movies/', params).status_code, 400)
+
+    def test_detail(self) -> None:
+        """Кинопроизведение отдаётся одним запросом с жанрами и участниками по ролям."""
+        film = self.films[0]
+        with self.assertNumQueries(DETAIL_QUERIES):
+            data = self.client.get('/api/v1/movies/{pk}/'.format(pk=film.pk)).json()
+        self.assertEqual(data['title'], film.title)
+        self.assertEqual(data['genres'], ['Genre 0', 'Genre 1'])
+        self.assertEqual(data['actors'], ['Person 0', 'Person 1'])
+        self.assertEqual(data['directors'], ['Person 2'])
+        self.assertEqual(data['writers'], ['Person 3', 'Person 4', 'Person 5'])
+
+    def test_detail_without_links(self) -> None:
+        """У кинопроизведения без жанров и участников списки пустые."""
+        data = self.client.get('/api/v1/movies/{pk}/'.format(pk=self.empty.pk)).json()
+        self.assertEqual((data['genres'], data['actors'], data['directors'], data['writers']), ([], [], [], []))
+
+    def test_etag(self) -> None:
+        """Повторный запрос с ETag получает 304, а после изменения - новый ответ."""
+        url = '/api/v1/movies/{pk}/'.format(pk=self.films[0].pk)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Filmwork.objects.filter(pk=self.films[0].pk).update(title='Renamed')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class TransferTest(TestCase):
+    """Тесты выгрузки и загрузки в админке."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Создаёт администратора и жанры."""
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.genres = Genre.objects.bulk_create(
+            Genre(name='Genre {index}'.format(index=index), description='') for index in range(5)
+        )
+
+    def setUp(self) -> None:
+        """Входит в админку."""
+        self.client.force_login(self.user)
+
+    def test_export_csv(self) -> None:
+        """Выгрузка всей таблицы содержит заголовок и все строки."""
+        response = self.client.get('/admin/movies/genre/export/', {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,description')
+        self.assertEqual(len(lines), len(self.genres) + 1)
+
+    def test_export_selected_ndjson(self) -> None:
+        """Действие выгружает только выбранные объекты."""
+        response = self.client.post('/admin/movies/genre/', {
+            'action': 'export_ndjson',
+            '_selected_action': [str(self.genres[0].pk)],
+        })
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, [{'id': str(self.genres[0].pk), 'name': 'Genre 0', 'description': ''}])
+
+    @translation.override('en')
+    def test_import_upserts_and_reports_errors(self) -> None:
+        """Загрузка обновляет существующие строки, добавляет новые и сообщает об ошибочных."""
+        lines = [
+            json.dumps({'id': str(self.genres[0].pk), 'name': 'Renamed'}),
+            json.dumps({'name': 'New'}),
+            'not json',
+            json.dumps({'name': ''}),
+        ]
+        upload = SimpleUploadedFile('genres.ndjson', '\n'.join(lines).encode())
+        response = self.client.post('/admin/movies/genre/import/', {'file': upload, 'format': 'ndjson'})
+        log = b''.join(response.streaming_content).decode()
+        self.assertIn('Line 3:', log)
+        self.assertIn('Line 4:', log)
+        self.genres[0].refresh_from_db()
+        self.assertEqual(self.genres[0].name, 'Renamed')
+        self.assertTrue(Genre.objects.filter(name='New').exists())
+        self.assertEqual(Genre.objects.count(), len(self.genres) + 1)
+
+    def test_import_keeps_missing_columns(self) -> None:
+        """Загрузка файла без части колонок не меняет эти колонки у существующих строк."""
+        genre = Genre.objects.create(name='Drama', description='Serious films')
+        content = 'id,name\n{pk},Dramas\n'.format(pk=genre.pk)
+        importer = CatalogueImporter(Genre)
+        list(importer.run(SimpleUploadedFile('genres.csv', content.encode()), 'csv', len(content)))
+        genre.refresh_from_db()
+        self.assertEqual((genre.name, genre.description), ('Dramas', 'Serious films'))
+
+    def test_import_batches(self) -> None:
+        """Каждая пачка записывается одним запросом."""
+        content = 'name\n' + ''.join('Imported {index}\n'.format(index=index) for index in range(25))
+        importer = CatalogueImporter(Genre, batch_size=10)
+        with self.assertNumQueries(3 * 3):
+            list(importer.run(SimpleUploadedFile('genres.csv', content.encode()), 'csv', len(content)))
+        self.assertEqual((importer.report.rows, importer.report.saved, importer.report.error_count), (25, 25, 0))
+
+
+class ProfilingTest(TestCase):
+    """Тесты профилирования запросов к БД."""
+
+    def test_fingerprint(self) -> None:
+        """Запросы, отличающиеся только значениями и длиной списков, дают один отпечаток."""
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND name = 'a' LIMIT 21"),
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'b''c' LIMIT 1"),
+        )
+        self.assertEqual(
+            fingerprint('INSERT INTO t (a, b) VALUES (%s, %s)'),
+            fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+        )
+
+    def test_recorder_flags_repeated_queries(self) -> None:
+        """Один и тот же запрос в цикле отмечается как повторяющийся."""
+        genres = Genre.objects.bulk_create(Genre(name='Genre {index}'.format(index=index)) for index in range(5))
+        recorder = QueryRecorder(slow_query_ms=0)
+        with connection.execute_wrapper(recorder):
+            for genre in genres:
+                Genre.objects.get(pk=genre.pk)
+        self.assertEqual(recorder.count, len(genres))
+        self.assertEqual(len(recorder.slow), len(genres))
+        [(_, count)] = recorder.duplicates(threshold=len(genres))
+        self.assertEqual(count, len(genres))
+
+    @override_settings(SQL_PROFILING_SAMPLE_RATE=1)
+    def test_middleware_logs_and_aggregates(self) -> None:
+        """Профилированный запрос попадает в лог и в метрики представления."""
+        view = 'movies.views.MoviesListApi'
+        before = sql_metrics.summary().get(view, {}).get('requests', 0)
+        with self.assertLogs('movies.profiling', 'INFO') as logs, CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/v1/movies/')
+        profile = json.loads(logs.records[0].getMessage())
+        self.assertEqual((profile['view'], profile['queries']), (view, len(queries)))
+        self.assertEqual(sql_metrics.summary()[view]['requests'], before + 1)
+
+    @override_settings(SQL_PROFILING_SAMPLE_RATE=0)
+    def test_middleware_skips_unsampled_requests(self) -> None:
+        """Без выборки запросы не профилируются."""
+        before = sql_metrics.summary()
+        self.client.get('/api/v1/movies/')
+        self.assertEqual(sql_metrics.summary(), before)
+
+
+def has_extension(name: str) -> bool:
+    """
+    Проверяет, установлено ли расширение Postgres в тестовой БД.
+
+    Args:
+        name: имя расширения
+
+    Returns:
+        bool: True, если расширение установлено
+    """
+    with connection.cursor() as curs:
+        curs.execute('SELECT 1 FROM pg_extension WHERE extname = %s', [name])
+        return curs.fetchone() is not None
+
+
+class SearchTest(TestCase):
+    """Тесты поиска в админке по индексам."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Создаёт кинопроизведения, совпадающие со строкой поиска в разных полях."""
+        cls.in_title = Filmwork.objects.create(title='Star Wars', description='Space opera', rating=8)
+        cls.in_description = Filmwork.objects.create(title='Spaceballs', description='A star wars parody', rating=7)
+        cls.unrelated = Filmwork.objects.create(title='Casablanca', description='Drama', rating=9)
+        cls.model_admin = admin.site._registry[Filmwork]
+
+    def search(self, term: str) -> list:
+        """
+        Ищет кинопроизведения так же, как список изменений админки.
+
+        Args:
+            term: строка поиска
+
+        Returns:
+            list: найденные кинопроизведения в порядке выдачи
+        """
+        queryset, may_have_duplicates = self.model_admin.get_search_results(None, Filmwork.objects.all(), term)
+        self.assertFalse(may_have_duplicates)
+        return list(queryset)
+
+    def require_trigram(self) -> None:
+        """Пропускает тест, если в БД нет расширения pg_trgm, на котором строится поиск по словам."""
+        if not has_extension('pg_trgm'):
+            self.skipTest('pg_trgm is not installed')
+
+    def test_uuid_looks_up_primary_key(self) -> None:
+        """UUID ищется одним запросом по первичному ключу, без полнотекстового поиска."""
+        self.assertIsNone(parse_uuid('Star Wars'))
+        for term in (str(self.in_title.pk), ' {pk} '.format(pk=str(self.in_title.pk).upper())):
+            with self.subTest(term=term), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.search(term), [self.in_title])
+            [query] = queries
+            self.assertNotIn('to_tsvector', query['sql'])
+        self.assertEqual(self.search(str(uuid.uuid4())), [])
+
+    def test_ranks_title_above_description(self) -> None:
+        """Совпадение в названии выше совпадения в описании, остальные строки не попадают в выдачу."""
+        self.require_trigram()
+        self.assertEqual(self.search('star wars'), [self.in_title, self.in_description])
+
+    def test_trigram_finds_typos(self) -> None:
+        """Опечатка, не совпадающая ни с одним словом, находится по триграммному сходству."""
+        self.require_trigram()
+        self.assertEqual(self.search('Star Warz'), [self.in_title])
+
+    def test_trigram_finds_substring(self) -> None:
+        """Подстрока из середины слов находится через ILIKE."""
+        self.require_trigram()
+        self.assertEqual(self.search('ar Wa'), [self.in_title])
+
+
+class KeysetPaginationTest(TestCase):
+    """Тесты постраничного вывода списков админки по ключу."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Создаёт администратора и персон с повторяющимися именами."""
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.persons = Person.objects.bulk_create(
+            Person(full_name='Person {index}'.format(index=index // 3)) for index in range(23)
+        )
+
+    def setUp(self) -> None:
+        """Входит в админку и уменьшает размер страницы."""
+        self.client.force_login(self.user)
+        patcher = mock.patch.object(admin.site._registry[Person], 'list_per_page', 5)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_page(self, query: str = '') -> object:
+        """
+        Открывает страницу списка персон, отсортированного по имени.
+
+        Args:
+            query: строка запроса страницы; без неё открывается первая
+
+        Returns:
+            KeysetChangeList: список объектов страницы
+        """
+        response = self.client.get('/admin/movies/person/{query}'.format(query=query or '?o=1'))
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def decode_cursor(self, url: str) -> dict:
+        """
+        Достаёт курсор из ссылки на страницу.
+
+        Args:
+            url: ссылка на страницу
+
+        Returns:
+            dict: содержимое курсора
+        """
+        cursor = QueryDict(url.lstrip('?'))[CURSOR_VAR]
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+    def test_cursor_carries_edge_row(self) -> None:
+        """Курсоры соседних страниц хранят номер страницы и ключ крайней строки текущей."""
+        first = self.get_page()
+        self.assertEqual([field.name for field, _ in first.keyset], ['full_name', 'id'])
+        self.assertIsNone(first.previous_page_url)
+        last_row = list(first.result_list)[-1]
+        self.assertEqual(self.decode_cursor(first.next_page_url), {
+            'page': 2,
+            'before': False,
+            'fields': ['full_name', 'id'],
+            'values': [last_row.full_name, str(last_row.pk)],
+        })
+        second = self.get_page(first.next_page_url)
+        self.assertEqual(second.page_num, 2)
+        self.assertEqual(second.previous_page_url, '?o=1')
+        third = self.get_page(second.next_page_url)
+        token = self.decode_cursor(third.previous_page_url)
+        self.assertEqual((token['page'], token['before']), (2, True))
+        self.assertEqual(token['values'][1], str(list(third.result_list)[0].pk))
+
+    def test_pages_have_no_duplicates_or_gaps(self) -> None:
+        """Переход вперёд и назад по курсорам проходит все строки в порядке сортировки по одному разу."""
+        expected = [person.pk for person in Person.objects.order_by('full_name', '-pk')]
+        pages = [self.get_page()]
+        while pages[-1].next_page_url:
+            pages.append(self.get_page(pages[-1].next_page_url))
+        forward = [[person.pk for person in page.result_list] for page in pages]
+        self.assertEqual(sum(forward, []), expected)
+        self.assertEqual([len(rows) for rows in forward], [5, 5, 5, 5, 3])
+        page = pages[-1]
+        backward = []
+        while page.previous_page_url:
+            page = self.get_page(page.previous_page_url)
+            backward.insert(0, [person.pk for person in page.result_list])
+        self.assertEqual(backward, forward[:-1])
+
+    def test_seek_after_concurrent_insert(self) -> None:
+        """Строка, добавленная перед курсором, не сдвигает следующую страницу."""
+        first = self.get_page()
+        second = self.get_page(first.next_page_url)
+        Person.objects.create(full_name='Person 0')
+        self.assertEqual(list(self.get_page(first.next_page_url).result_list), list(second.result_list))
+
+    def test_rejects_bad_cursor(self) -> None:
+        """Повреждённый курсор и курсор другой сортировки дают страницу ошибки."""
+        foreign = base64.urlsafe_b64encode(json.dumps({
+            'page': 2, 'before': False, 'fields': ['modified', 'id'], 'values': ['x', 'y'],
+        }).encode()).decode()
+        for cursor in ('broken', foreign):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/admin/movies/person/', {'o': 1, 'p': 2, CURSOR_VAR: cursor})
+                self.assertRedirects(response, '/admin/movies/person/?e=1', fetch_redirect_response=False)
+
+    def test_estimate_count(self) -> None:
+        """Выборка больше порога считается по статистике, меньше - точно."""
+        with connection.cursor() as curs:
+            curs.execute('ANALYZE content.person')
+        persons = Person.objects.all()
+        self.assertEqual(estimate_count(persons, exact_limit=100), (len(self.persons), False))
+        count, is_estimate = estimate_count(persons, exact_limit=10)
+        self.assertTrue(is_estimate)
+        self.assertGreater(count, 10)
+        filtered = Person.objects.filter(full_name__startswith='Person')
+        with self.assertNumQueries(2):
+            count, is_estimate = estimate_count(filtered, exact_limit=10)
+        self.assertTrue(is_estimate)
+        self.assertGreaterEqual(count, 11)
+        self.assertEqual(estimate_count(Person.objects.filter(full_name='Person 1'), exact_limit=10), (3, False))
+
+    def test_paginator_uses_estimate(self) -> None:
+        """Paginator отмечает оценённое количество строк."""
+        paginator = EstimatedCountPaginator(Person.objects.order_by('pk'), 5)
+        paginator.exact_count_limit = 10
+        with connection.cursor() as curs:
+            curs.execute('ANALYZE content.person')
+        self.assertGreater(paginator.count, 10)
+        self.assertTrue(paginator.is_estimate)
+        self.assertEqual(len(paginator.page(2).object_list), 5)
+
+
+class BulkInlineTest(TestCase):
+    """Тесты числа запросов встроенных форм кинопроизведения."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Создаёт администратора, жанры, персон и кинопроизведения с разным числом связей."""
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.genres = Genre.objects.bulk_create(Genre(name='Genre {index}'.format(index=index)) for index in range(12))
+        cls.persons = Person.objects.bulk_create(
+            Person(full_name='Person {index}'.format(index=index)) for index in range(12)
+        )
+        cls.films = {}
+        for size in (2, 10):
+            film = Filmwork.objects.create(
+                title='Film {size}'.format(size=size), creation_date=datetime.date(2000, 1, 1), rating=5,
+                type='movies',
+            )
+            GenreFilmwork.objects.bulk_create(GenreFilmwork(film_work=film, genre=genre) for genre in cls.genres[:size])
+            PersonFilmwork.objects.bulk_create(
+                PersonFilmwork(film_work=film, person=person, role='actor') for person in cls.persons[:size]
+            )
+            cls.films[size] = film
+
+    def setUp(self) -> None:
+        """Входит в админку."""
+        self.client.force_login(self.user)
+
+    def change_url(self, film: Filmwork) -> str:
+        """
+        Адрес страницы изменения кинопроизведения.
+
+        Args:
+            film: кинопроизведение
+
+        Returns:
+            str: адрес
+        """
+        return '/admin/movies/filmwork/{pk}/change/'.format(pk=film.pk)
+
+    def edit_data(self, film: Filmwork) -> tuple:
+        """
+        Данные отправки страницы изменения, которые меняют, удаляют и добавляют строки связей.
+
+        Всем участникам меняется роль, первый жанр удаляется, а в пустую строку
+        добавляется последний жанр.
+
+        Args:
+            film: кинопроизведение
+
+        Returns:
+            tuple: данные формы и удаляемый жанр
+        """
+        response = self.client.get(self.change_url(film))
+        form = response.context['adminform'].form
+        data = {form.add_prefix(name): form[name].value() for name in form.fields}
+        for inline in response.context['inline_admin_formsets']:
+            formset = inline.formset
+            data.update({formset.management_form.add_prefix(name): value
+                         for name, value in formset.management_form.initial.items()})
+            for row in formset.initial_forms:
+                data.update({row.add_prefix(name): row[name].value() for name in row.fields if name != 'DELETE'})
+            if formset.model is PersonFilmwork:
+                for row in formset.initial_forms:
+                    data[row.add_prefix('role')] = 'writer'
+            else:
+                deleted = formset.initial_forms[0].instance.genre
+                data[formset.initial_forms[0].add_prefix('DELETE')] = 'on'
+                data[formset.extra_forms[0].add_prefix('genre')] = self.genres[-1].pk
+                data[formset.management_form.add_prefix('TOTAL_FORMS')] = formset.initial_form_count() + 1
+        return {key: '' if value is None else value for key, value in data.items()}, deleted
+
+    def test_change_page_query_count_does_not_depend_on_rows(self) -> None:
+        """Страница изменения открывается одним и тем же числом запросов при любом числе связей."""
+        # Первый запрос заполняет кеши процесса, например ContentType, и делает лишние запросы.
+        self.client.get(self.change_url(self.films[2]))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.change_url(self.films[2])).status_code, 200)
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(self.client.get(self.change_url(self.films[10])).status_code, 200)
+
+    def test_save_query_count_does_not_depend_on_rows(self) -> None:
+        """Сохранение изменённых, удалённых и новых строк связей не делает запросов на каждую строку."""
+        expected = None
+        for size, film in self.films.items():
+            data, deleted = self.edit_data(film)
+            with CaptureQueriesContext(connection) as queries:
+                if expected is None:
+                    response = self.client.post(self.change_url(film), data)
+                else:
+                    with self.assertNumQueries(expected):
+                        response = self.client.post(self.change_url(film), data)
+            expected = len(queries)
+            self.assertRedirects(response, '/admin/movies/filmwork/', fetch_redirect_response=False)
+            self.assertEqual(set(film.personfilmwork_set.values_list('role', flat=True)), {'writer'})
+            self.assertCountEqual(
+                film.genrefilmwork_set.values_list('genre', flat=True),
+                [genre.pk for genre in self.genres[:size] if genre != deleted] + [self.genres[-1].pk],
+            )
+
+
+class FacetFilterTest(TestCase):
+    """Тесты фильтров списка кинопроизведений с кешированными количествами."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Создаёт администратора и кинопроизведения на границах корзин."""
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.drama, cls.comedy = Genre.objects.bulk_create([Genre(name='Drama'), Genre(name='Comedy')])
+        cls.films = Filmwork.objects.bulk_create(
+            Filmwork(title=title, creation_date=creation_date, rating=rating, type='movies')
+            for title, creation_date, rating in (
+                ('Low', datetime.date(2000, 1, 1), 5),
+                ('Middle', datetime.date(2000, 12, 31), 5.9),
+                ('High', datetime.date(2001, 1, 1), 6),
+            )
+        )
+        GenreFilmwork.objects.bulk_create([
+            GenreFilmwork(film_work=cls.films[0], genre=cls.drama),
+            GenreFilmwork(film_work=cls.films[1], genre=cls.drama),
+            GenreFilmwork(film_work=cls.films[1], genre=cls.comedy),
+        ])
+
+    def setUp(self) -> None:
+        """Входит в админку и очищает кеш количеств."""
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def get_list(self, params: dict = None) -> object:
+        """
+        Открывает список кинопроизведений.
+
+        Args:
+            params: параметры строки запроса
+
+        Returns:
+            KeysetChangeList: список объектов
+        """
+        response = self.client.get('/admin/movies/filmwork/', params or {})
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def facets(self, changelist: object) -> dict:
+        """
+        Варианты фильтров списка с количествами.
+
+        Args:
+            changelist: список объектов
+
+        Returns:
+            dict: варианты по классу фильтра
+        """
+        return {type(spec): spec.lookup_choices for spec in changelist.filter_specs if hasattr(spec, 'lookup_choices')}
+
+    def test_counts(self) -> None:
+        """Количества считаются по корзинам, а пустые корзины не показываются."""
+        facets = self.facets(self.get_list())
+        self.assertEqual(facets[RatingFilter], [('5', '5–6 (2)'), ('6', '6–7 (1)')])
+        self.assertEqual(facets[CreationYearFilter], [('2000', '2000 (2)'), ('2001', '2001 (1)')])
+        self.assertEqual(facets[GenreFilter], [('Comedy', 'Comedy (1)'), ('Drama', 'Drama (2)')])
+
+    def test_counts_are_cached(self) -> None:
+        """Повторное открытие списка не пересчитывает количества."""
+        with CaptureQueriesContext(connection) as first:
+            self.get_list()
+        self.assertEqual(set(cache.get(facet_cache_key(Filmwork))), {'genre', 'rating_range', 'creation_year'})
+        with self.assertNumQueries(len(first) - 3):
+            self.get_list()
+
+    def test_changes_invalidate_counts(self) -> None:
+        """Изменение кинопроизведения, жанра или связи сбрасывает количества кинопроизведений."""
+        changes = (
+            lambda: Filmwork.objects.create(title='New', creation_date=datetime.date(2001, 6, 1), rating=6.5),
+            lambda: GenreFilmwork.objects.create(film_work=self.films[2], genre=self.comedy),
+            lambda: Genre.objects.filter(pk=self.comedy.pk).get().delete(),
+        )
+        for change in changes:
+            self.get_list()
+            self.assertIsNotNone(cache.get(facet_cache_key(Filmwork)))
+            change()
+            self.assertIsNone(cache.get(facet_cache_key(Filmwork)))
+        facets = self.facets(self.get_list())
+        self.assertEqual(facets[RatingFilter], [('5', '5–6 (2)'), ('6', '6–7 (2)')])
+        self.assertEqual(facets[GenreFilter], [('Drama', 'Drama (2)')])
+
+    def test_inline_save_refreshes_counts(self) -> None:
+        """После сохранения жанров в админке количества фильтра по жанру актуальны."""
+        self.get_list()
+        film = self.films[0]
+        link = film.genrefilmwork_set.get()
+        response = self.client.post('/admin/movies/filmwork/{pk}/change/'.format(pk=film.pk), {
+            'title': film.title, 'description': '', 'creation_date': '2000-01-01', 'rating': '5', 'type': 'movies',
+            'genrefilmwork_set-TOTAL_FORMS': 1, 'genrefilmwork_set-INITIAL_FORMS': 1,
+            'genrefilmwork_set-0-id': link.pk, 'genrefilmwork_set-0-film_work': film.pk,
+            'genrefilmwork_set-0-genre': self.comedy.pk,
+            'personfilmwork_set-TOTAL_FORMS': 0, 'personfilmwork_set-INITIAL_FORMS': 0,
+        })
+        self.assertRedirects(response, '/admin/movies/filmwork/', fetch_redirect_response=False)
+        self.assertEqual(
+            self.facets(self.get_list())[GenreFilter], [('Comedy', 'Comedy (2)'), ('Drama', 'Drama (1)')],
+        )
+
+    def test_bucket_filters(self) -> None:
+        """Выбранная корзина отбирает кинопроизведения с учётом её границ."""
+        low, middle, high = self.films
+        for params, expected in (
+            ({'rating_range': 5}, [low, middle]),
+            ({'rating_range': 6}, [high]),
+            ({'creation_year': 2000}, [low, middle]),
+            ({'creation_year': 2001}, [high]),
+            ({'genre': 'Comedy'}, [middle]),
+            ({'genre': 'Drama', 'rating_range': 5}, [low, middle]),
+        ):
+            with self.subTest(params=params):
+                self.assertCountEqual(self.get_list(params).result_list, expected)
+
+    def test_bucket_filters_reject_bad_values(self) -> None:
+        """Некорректное значение корзины даёт страницу ошибки."""
+        for params in ({'rating_range': 'x'}, {'creation_year': '99999'}):
+            with self.subTest(params=params):
+                response = self.client.get('/admin/movies/filmwork/', params)
+                self.assertRedirects(response, '/admin/movies/filmwork/?e=1', fetch_redirect_response=False)
+
+
+class FilmworkSummaryTest(TestCase):
+    """Тесты сводки кинопроизведений, которую заполняют триггеры."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Создаёт жанры и кинопроизведения без связей."""
+        cls.drama, cls.comedy = Genre.objects.bulk_create([Genre(name='Drama'), Genre(name='Comedy')])
+        cls.films = Filmwork.objects.bulk_create(
+            Filmwork(title=title, creation_date=datetime.date(2000, 1, 1), rating=5, type='movies')
+            for title in ('First', 'Second')
+        )
+
+    def genres(self) -> list:
+        """
+        Жанры кинопроизведений из сводки.
+
+        Returns:
+            list: жанры каждого кинопроизведения в порядке self.films
+        """
+        summaries = FilmworkSummary.objects.in_bulk([film.pk for film in self.films])
+        return [summaries[film.pk].genres for film in self.films]
+
+    def pending(self) -> list:
+        """
+        Очередь отложенного пересчёта.
+
+        Returns:
+            list: id кинопроизведений в очереди
+        """
+        with connection.cursor() as curs:
+            curs.execute('SELECT film_work_id FROM content.film_work_summary_pending')
+            return [row[0] for row in curs.fetchall()]
+
+    def test_refreshed_immediately(self) -> None:
+        """Без отложенного режима сводка пересчитывается при записи связей."""
+        GenreFilmwork.objects.bulk_create(
+            GenreFilmwork(film_work=film, genre=genre) for film in self.films for genre in (self.drama, self.comedy)
+        )
+        self.assertEqual(self.genres(), [['Comedy', 'Drama'], ['Comedy', 'Drama']])
+        self.assertEqual(self.pending(), [])
+
+    def test_deferred_until_refresh(self) -> None:
+        """В отложенном режиме связи только ставят кинопроизведения в очередь, каждое один раз."""
+        first, second = self.films
+        with connection.cursor() as curs:
+            curs.execute("SET LOCAL movies.film_work_summary TO 'deferred'")
+        GenreFilmwork.objects.bulk_create([
+            GenreFilmwork(film_work=first, genre=self.drama), GenreFilmwork(film_work=second, genre=self.drama),
+        ])
+        GenreFilmwork.objects.create(film_work=first, genre=self.comedy)
+        GenreFilmwork.objects.filter(film_work=second).delete()
+        self.assertEqual(self.genres(), [[], []])
+        self.assertCountEqual(self.pending(), [first.pk, second.pk])
+        with connection.cursor() as curs:
+            curs.execute('SELECT content.refresh_pending_film_work_summaries()')
+        self.assertEqual(self.genres(), [['Comedy', 'Drama'], []])
+        self.assertEqual(self.pending(), [])
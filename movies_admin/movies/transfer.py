@@ -0,0 +1,486 @@
+"""Потоковые выгрузка и загрузка объектов админки в CSV и NDJSON."""
+
+import csv
+import io
+import itertools
+import json
+from typing import IO, Iterable, Iterator, Optional
+
+from django import forms
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import Model, QuerySet
+from django.http import Http404, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.html import escape
+from django.utils.translation import gettext
+from django.utils.translation import gettext_lazy as _
+
+from movies.filters import invalidate_facets
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+FORMATS = (
+    (FORMAT_CSV, 'CSV'),
+    (FORMAT_NDJSON, 'NDJSON'),
+)
+CONTENT_TYPES = {
+    FORMAT_CSV: 'text/csv; charset=utf-8',
+    FORMAT_NDJSON: 'application/x-ndjson; charset=utf-8',
+}
+# Строк в одном fetch серверного курсора и в одном куске ответа.
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 1000
+# Дальше ошибки только считаются, чтобы отчёт о битом файле не разрастался.
+MAX_REPORTED_ERRORS = 1000
+IMPORT_TEMPLATE = 'admin/movies/import.html'
+# Место в отрендеренной странице загрузки, куда потоком пишется ход загрузки.
+LOG_MARKER = '\x00import-log\x00'
+UPSERT_QUERY = 'INSERT INTO {table} ({columns}) VALUES {rows} ON CONFLICT ({pk}) DO UPDATE SET {assignments}'
+
+
+def transfer_fields(model: type) -> list:
+    """
+    Поля модели, которые выгружаются и загружаются.
+
+    Args:
+        model: модель
+
+    Returns:
+        list: первичный ключ и редактируемые поля; created и modified заполняются при записи
+    """
+    return [field for field in model._meta.concrete_fields if field.editable or field.primary_key]
+
+
+def export_rows(queryset: QuerySet, export_format: str) -> Iterator[str]:
+    """
+    Выгружает выборку кусками по EXPORT_CHUNK_SIZE строк.
+
+    Строки читаются серверным курсором Postgres, поэтому память не зависит от
+    размера выборки. Порядок строк не задаётся: сортировка всей таблицы
+    дороже, чем последовательное чтение.
+
+    Args:
+        queryset: выборка
+        export_format: FORMAT_CSV или FORMAT_NDJSON
+
+    Yields:
+        str: кусок файла
+    """
+    fields = transfer_fields(queryset.model)
+    names = [field.name for field in fields]
+    rows = queryset.order_by().values_list(*[field.attname for field in fields]).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE,
+    )
+    buffer = io.StringIO()
+    if export_format == FORMAT_CSV:
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        write = writer.writerow
+    else:
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+        def write(row: tuple) -> None:
+            buffer.write(encoder.encode(dict(zip(names, row))))
+            buffer.write('\n')
+
+    for index, row in enumerate(rows, 1):
+        write(row)
+        if index % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_response(queryset: QuerySet, export_format: str) -> StreamingHttpResponse:
+    """
+    Строит потоковый ответ с файлом выгрузки.
+
+    Args:
+        queryset: выборка
+        export_format: FORMAT_CSV или FORMAT_NDJSON
+
+    Returns:
+        StreamingHttpResponse: ответ с вложением
+    """
+    response = StreamingHttpResponse(export_rows(queryset, export_format), content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = 'attachment; filename="{name}.{ext}"'.format(
+        name=queryset.model._meta.model_name, ext=export_format,
+    )
+    return response
+
+
+def read_records(stream: IO[bytes], import_format: str) -> Iterator[tuple]:
+    """
+    Читает записи файла загрузки по одной.
+
+    Args:
+        stream: бинарный файл в UTF-8
+        import_format: FORMAT_CSV или FORMAT_NDJSON
+
+    Yields:
+        tuple: номер строки файла, запись (словарь или None) и текст ошибки разбора или None
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if import_format == FORMAT_CSV else None)
+    if import_format == FORMAT_CSV:
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield line_number, None, str(error)
+            continue
+        if isinstance(record, dict):
+            yield line_number, record, None
+        else:
+            yield line_number, None, gettext('Expected a JSON object')
+
+
+def build_instance(model: type, fields: dict, record: dict) -> Model:
+    """
+    Создаёт и проверяет объект по записи файла.
+
+    Args:
+        model: модель
+        fields: загружаемые поля модели по имени
+        record: запись
+
+    Returns:
+        Model: объект, прошедший full_clean
+
+    Raises:
+        ValidationError: в записи неизвестные колонки или некорректные значения
+    """
+    unknown = [str(name) for name in record if name not in fields]
+    if unknown:
+        raise ValidationError(gettext('Unknown columns: {columns}').format(columns=', '.join(unknown)))
+    values = {}
+    errors = {}
+    for name, value in record.items():
+        field = fields[name]
+        if value == '' and not field.empty_strings_allowed:
+            # В CSV пустая ячейка - единственный способ записать NULL.
+            value = None
+        try:
+            values[field.attname] = field.to_python(value)
+        except ValidationError as error:
+            errors[name] = error.messages
+    if errors:
+        raise ValidationError(errors)
+    instance = model(**values)
+    instance.full_clean(validate_unique=False)
+    return instance
+
+
+def format_error(error: Exception) -> str:
+    """
+    Текст ошибки для отчёта.
+
+    Args:
+        error: ошибка проверки или записи
+
+    Returns:
+        str: сообщение
+    """
+    if isinstance(error, ValidationError) and hasattr(error, 'error_dict'):
+        return '; '.join(
+            '{field}: {messages}'.format(field=field, messages=' '.join(messages))
+            for field, messages in error.message_dict.items()
+        )
+    if isinstance(error, ValidationError):
+        return ' '.join(error.messages)
+    return str(error).strip()
+
+
+def upsert(model: type, instances: Iterable[Model], using: str, update_fields: Iterable[str]) -> None:
+    """
+    Записывает объекты одним INSERT ... ON CONFLICT DO UPDATE.
+
+    Сигналы не отправляются. У существующих строк меняются только update_fields
+    и поля auto_now, поэтому колонки, которых не было в файле, не затираются
+    значениями по умолчанию.
+
+    Args:
+        model: модель
+        instances: объекты с разными первичными ключами
+        using: псевдоним БД
+        update_fields: имена полей, которые обновляются у существующих строк
+    """
+    update_fields = set(update_fields)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    fields = model._meta.concrete_fields
+    params = []
+    for instance in instances:
+        params.extend(field.get_db_prep_save(field.pre_save(instance, True), connection) for field in fields)
+    row = '({placeholders})'.format(placeholders=', '.join(['%s'] * len(fields)))
+    query = UPSERT_QUERY.format(
+        table=quote(model._meta.db_table),
+        columns=', '.join(quote(field.column) for field in fields),
+        rows=', '.join([row] * (len(params) // len(fields))),
+        pk=quote(model._meta.pk.column),
+        assignments=', '.join(
+            '{column} = EXCLUDED.{column}'.format(column=quote(field.column)) for field in fields
+            if not field.primary_key and (field.name in update_fields or getattr(field, 'auto_now', False))
+        ),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+
+
+class ImportReport(object):
+    """Ход загрузки: прочитанные и записанные строки и ошибки по строкам файла."""
+
+    def __init__(self) -> None:
+        """Init метод."""
+        self.rows = 0
+        self.saved = 0
+        self.error_count = 0
+
+    def progress(self, percent: int) -> str:
+        """
+        Строка о ходе загрузки.
+
+        Args:
+            percent: прочитанная доля файла в процентах
+
+        Returns:
+            str: строка отчёта
+        """
+        return gettext('{percent}%: read {rows} rows, saved {saved}, errors {errors}').format(
+            percent=percent, rows=self.rows, saved=self.saved, errors=self.error_count,
+        )
+
+    def error(self, line_number: int, message: str) -> Optional[str]:
+        """
+        Учитывает ошибку в строке файла.
+
+        Args:
+            line_number: номер строки
+            message: сообщение
+
+        Returns:
+            Optional[str]: строка отчёта или None, если ошибок уже больше MAX_REPORTED_ERRORS
+        """
+        self.error_count += 1
+        if self.error_count > MAX_REPORTED_ERRORS:
+            return None
+        return gettext('Line {line}: {message}').format(line=line_number, message=message)
+
+
+class CatalogueImporter(object):
+    """
+    Загрузка файла CSV или NDJSON в таблицу модели.
+
+    Файл читается потоком, записи проверяются full_clean и пишутся пачками по
+    batch_size строк, каждая в своей транзакции. Если пачку записать не
+    удалось, её строки пишутся по одной, чтобы в отчёт попали именно
+    ошибочные строки. У существующих по первичному ключу объектов обновляются
+    только колонки, которые есть в записи: записи пачки с разным набором
+    колонок пишутся отдельными запросами.
+    """
+
+    def __init__(self, model: type, batch_size: int = IMPORT_BATCH_SIZE) -> None:
+        """
+        Init метод.
+
+        Args:
+            model: модель
+            batch_size: количество строк в пачке
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.fields = {field.name: field for field in transfer_fields(model)}
+        self.using = router.db_for_write(model)
+        self.report = ImportReport()
+
+    def run(self, stream: IO[bytes], import_format: str, size: int) -> Iterator[str]:
+        """
+        Загружает файл, сообщая о ходе загрузки после каждой пачки.
+
+        Args:
+            stream: бинарный файл в UTF-8
+            import_format: FORMAT_CSV или FORMAT_NDJSON
+            size: размер файла в байтах для подсчёта процентов
+
+        Yields:
+            str: строки отчёта
+        """
+        batch: dict = {}
+        try:
+            for line_number, record, parse_error in read_records(stream, import_format):
+                self.report.rows += 1
+                try:
+                    if parse_error is not None:
+                        raise ValidationError(parse_error)
+                    instance = build_instance(self.model, self.fields, record)
+                except ValidationError as error:
+                    yield from self._error(line_number, format_error(error))
+                    continue
+                # Повтор ключа в пачке - последняя версия строки, как и между пачками.
+                batch.pop(instance.pk, None)
+                batch[instance.pk] = (line_number, instance, frozenset(record))
+                if len(batch) >= self.batch_size:
+                    yield from self._save(list(batch.values()))
+                    batch = {}
+                    yield self.report.progress(min(100 * stream.tell() // max(size, 1), 99))
+        except (UnicodeDecodeError, csv.Error) as error:
+            yield from self._error(self.report.rows + 1, format_error(error))
+        if batch:
+            yield from self._save(list(batch.values()))
+        invalidate_facets(self.model)
+        yield self.report.progress(100)
+
+    def _save(self, batch: list) -> Iterator[str]:
+        groups: dict = {}
+        for line_number, instance, columns in batch:
+            groups.setdefault(columns, []).append((line_number, instance))
+        for columns, rows in groups.items():
+            yield from self._upsert(rows, columns)
+
+    def _upsert(self, batch: list, columns: frozenset) -> Iterator[str]:
+        try:
+            with transaction.atomic(using=self.using):
+                upsert(self.model, [instance for _, instance in batch], self.using, columns)
+        except DatabaseError:
+            for line_number, instance in batch:
+                try:
+                    with transaction.atomic(using=self.using):
+                        upsert(self.model, [instance], self.using, columns)
+                except DatabaseError as error:
+                    yield from self._error(line_number, format_error(error))
+                else:
+                    self.report.saved += 1
+        else:
+            self.report.saved += len(batch)
+
+    def _error(self, line_number: int, message: str) -> Iterator[str]:
+        line = self.report.error(line_number, message)
+        if line is not None:
+            yield line
+
+
+class ImportForm(forms.Form):
+    """Форма загрузки файла."""
+
+    file = forms.FileField(label=_('file'))
+    format = forms.ChoiceField(label=_('format'), choices=FORMATS)
+
+
+class TransferMixin(object):
+    """
+    Подключает к ModelAdmin выгрузку и загрузку объектов.
+
+    Действия выгружают выбранные объекты, страница export/?format= - всю
+    таблицу, страница import/ загружает файл и показывает ход загрузки по мере
+    записи пачек.
+    """
+
+    actions = ('export_csv', 'export_ndjson')
+
+    def get_urls(self) -> list:
+        """
+        Добавляет страницы выгрузки и загрузки.
+
+        Returns:
+            list: маршруты модели
+        """
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view), name='{0}_{1}_export'.format(*info)),
+            path('import/', self.admin_site.admin_view(self.import_view), name='{0}_{1}_import'.format(*info)),
+            *super().get_urls(),
+        ]
+
+    @admin.action(description=_('Export selected as CSV'), permissions=['view'])
+    def export_csv(self, request: HttpRequest, queryset: QuerySet) -> StreamingHttpResponse:
+        """
+        Выгружает выбранные объекты в CSV.
+
+        Args:
+            request: запрос
+            queryset: выбранные объекты
+
+        Returns:
+            StreamingHttpResponse: файл
+        """
+        return export_response(queryset, FORMAT_CSV)
+
+    @admin.action(description=_('Export selected as NDJSON'), permissions=['view'])
+    def export_ndjson(self, request: HttpRequest, queryset: QuerySet) -> StreamingHttpResponse:
+        """
+        Выгружает выбранные объекты в NDJSON.
+
+        Args:
+            request: запрос
+            queryset: выбранные объекты
+
+        Returns:
+            StreamingHttpResponse: файл
+        """
+        return export_response(queryset, FORMAT_NDJSON)
+
+    def export_view(self, request: HttpRequest) -> StreamingHttpResponse:
+        """
+        Выгружает всю таблицу.
+
+        Args:
+            request: запрос с параметром format
+
+        Returns:
+            StreamingHttpResponse: файл
+
+        Raises:
+            PermissionDenied: нет права на просмотр
+            Http404: неизвестный формат
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        export_format = request.GET.get('format', FORMAT_CSV)
+        if export_format not in CONTENT_TYPES:
+            raise Http404('Unknown export format {format!r}'.format(format=export_format))
+        return export_response(self.model._default_manager.all(), export_format)
+
+    def import_view(self, request: HttpRequest) -> HttpResponse:
+        """
+        Показывает форму загрузки и загружает файл.
+
+        Args:
+            request: запрос
+
+        Returns:
+            HttpResponse: форма или потоковая страница с ходом загрузки
+
+        Raises:
+            PermissionDenied: нет прав на добавление и изменение
+        """
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        form = ImportForm(request.POST or None, request.FILES or None)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': gettext('Import {name}').format(name=self.model._meta.verbose_name_plural),
+            'form': form,
+        }
+        if not form.is_valid():
+            return TemplateResponse(request, IMPORT_TEMPLATE, context)
+        upload = form.cleaned_data['file']
+        upload.seek(0)
+        importer = CatalogueImporter(self.model)
+        page = TemplateResponse(request, IMPORT_TEMPLATE, {**context, 'log': LOG_MARKER}).render()
+        head, tail = page.content.decode().split(LOG_MARKER)
+        lines = (escape(line) + '\n' for line in importer.run(upload.file, form.cleaned_data['format'], upload.size))
+        response = StreamingHttpResponse(itertools.chain([head], lines, [tail]))
+        # Иначе nginx соберёт весь ответ, прежде чем отдать его браузеру.
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,9 @@
+"""Маршруты API приложения movies."""
+
+from django.urls import path
+from movies.views import MoviesDetailApi, MoviesListApi
+
+urlpatterns = [
+    path('movies/', MoviesListApi.as_view()),
+    path('movies/<uuid:pk>/', MoviesDetailApi.as_view()),
+]
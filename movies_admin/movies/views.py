@@ -1 +1,177 @@
 """Контроллеры приложения movies."""
+
+import hashlib
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Q, QuerySet
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views import View
+
+from movies.models import Filmwork
+
+# Ответ страницы наибольшего размера должен укладываться в это время (p95); проверяется командой benchmark_api.
+LATENCY_TARGET_MS = 200
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Роли участников в person_film_work и ключи их списков в ответе.
+ROLES = (
+    ('actor', 'actors'),
+    ('director', 'directors'),
+    ('writer', 'writers'),
+)
+FILM_WORK_FIELDS = ('id', 'title', 'description', 'creation_date', 'rating', 'type')
+
+
+class MoviesApiMixin(object):
+    """
+    Общая часть API кинопроизведений.
+
+    Кинопроизведение выбирается вместе с жанрами и участниками одним запросом:
+    списки собираются ArrayAgg по связующим таблицам. Ответ получает ETag по
+    своему содержимому, и на запрос с совпадающим If-None-Match возвращается
+    304 без тела.
+    """
+
+    http_method_names = ['get']
+
+    def get_queryset(self) -> QuerySet:
+        """
+        Кинопроизведения с агрегированными жанрами и участниками по ролям.
+
+        Returns:
+            QuerySet: словари с полями FILM_WORK_FIELDS, genres и списками ролей
+        """
+        # Оба соединения идут в одной annotate, поэтому Django не дублирует их,
+        # а DISTINCT убирает повторы от произведения жанров на участников.
+        aggregates = {
+            key: ArrayAgg(
+                'personfilmwork__person__full_name',
+                distinct=True,
+                filter=Q(personfilmwork__role=role),
+                ordering='personfilmwork__person__full_name',
+            )
+            for role, key in ROLES
+        }
+        return Filmwork.objects.values(*FILM_WORK_FIELDS).annotate(
+            genres=ArrayAgg(
+                'genrefilmwork__genre__name',
+                distinct=True,
+                filter=Q(genrefilmwork__isnull=False),
+                ordering='genrefilmwork__genre__name',
+            ),
+            **aggregates,
+        )
+
+    def serialize(self, row: dict) -> dict:
+        """
+        Готовит строку выборки к выводу в JSON.
+
+        Args:
+            row: строка get_queryset
+
+        Returns:
+            dict: кинопроизведение; у списков без строк - пустой список вместо NULL
+        """
+        for key in ('genres', *(key for _, key in ROLES)):
+            row[key] = row[key] or []
+        return row
+
+    def bad_request(self, message: str) -> HttpResponse:
+        """
+        Ответ на запрос с некорректными параметрами.
+
+        Args:
+            message: описание ошибки
+
+        Returns:
+            HttpResponse: 400 с описанием ошибки в detail
+        """
+        return JsonResponse({'detail': message}, status=400)
+
+    def render(self, request: HttpRequest, data: dict) -> HttpResponse:
+        """
+        Строит JSON-ответ с ETag или 304, если клиент уже получал этот ответ.
+
+        Args:
+            request: запрос
+            data: данные ответа
+
+        Returns:
+            HttpResponse: ответ
+        """
+        response = JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+        etag = quote_etag(hashlib.md5(response.content).hexdigest())
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return get_conditional_response(request, etag=etag, response=response) or response
+
+
+class MoviesListApi(MoviesApiMixin, View):
+    """
+    Список кинопроизведений по страницам.
+
+    Параметры: page - номер страницы или last, page_size - размер страницы
+    не больше MAX_PAGE_SIZE. Сначала выбираются ключи строк страницы, затем
+    агрегаты считаются только для них в том же запросе, поэтому запрос страницы
+    не группирует всю таблицу. Отдельным запросом считается общее количество.
+    """
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        """
+        Отдаёт страницу списка.
+
+        Args:
+            request: запрос
+
+        Returns:
+            HttpResponse: count, total_pages, prev, next и results; 400, если номер или размер страницы некорректны
+        """
+        try:
+            page_size = int(request.GET.get('page_size', PAGE_SIZE))
+        except ValueError:
+            return self.bad_request('page_size must be an integer')
+        if not 0 < page_size <= MAX_PAGE_SIZE:
+            return self.bad_request('page_size must be between 1 and {limit}'.format(limit=MAX_PAGE_SIZE))
+        # Первичный ключ задаёт однозначный порядок и читается по индексу.
+        paginator = Paginator(Filmwork.objects.order_by('pk').values('pk'), page_size)
+        page_number = request.GET.get('page', 1)
+        if page_number == 'last':
+            page_number = paginator.num_pages
+        try:
+            page = paginator.page(page_number)
+        except (EmptyPage, PageNotAnInteger) as error:
+            return self.bad_request(str(error))
+        results = self.get_queryset().filter(pk__in=page.object_list).order_by('pk')
+        return self.render(request, {
+            'count': paginator.count,
+            'total_pages': paginator.num_pages,
+            'prev': page.previous_page_number() if page.has_previous() else None,
+            'next': page.next_page_number() if page.has_next() else None,
+            'results': [self.serialize(row) for row in results],
+        })
+
+
+class MoviesDetailApi(MoviesApiMixin, View):
+    """Одно кинопроизведение."""
+
+    def get(self, request: HttpRequest, pk: str) -> HttpResponse:
+        """
+        Отдаёт кинопроизведение.
+
+        Args:
+            request: запрос
+            pk: id кинопроизведения
+
+        Returns:
+            HttpResponse: кинопроизведение с жанрами и участниками
+
+        Raises:
+            Http404: кинопроизведение не найдено
+        """
+        row = self.get_queryset().filter(pk=pk).first()
+        if row is None:
+            raise Http404('Filmwork {pk} not found'.format(pk=pk))
+        return self.render(request, self.serialize(row))
@@ -0,0 +1,198 @@
+"""
+Генератор синтетической SQLite БД со схемой, которую читает SQLiteExtractor.
+
+Запуск из корня репозитория:
+    python -m sqlite_to_postgres.benchmarks.dataset bench.sqlite --films 100000 --persons 200000
+"""
+
+import argparse
+import datetime
+import random
+import sqlite3
+import uuid
+from contextlib import closing
+from typing import Iterator
+
+SCHEMA = '''
+CREATE TABLE film_work (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT,
+    creation_date DATE,
+    file_path TEXT,
+    rating FLOAT,
+    type TEXT NOT NULL,
+    created_at timestamp with time zone,
+    updated_at timestamp with time zone
+);
+CREATE TABLE genre (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    created_at timestamp with time zone,
+    updated_at timestamp with time zone
+);
+CREATE TABLE person (
+    id TEXT PRIMARY KEY,
+    full_name TEXT NOT NULL,
+    created_at timestamp with time zone,
+    updated_at timestamp with time zone
+);
+CREATE TABLE genre_film_work (
+    id TEXT PRIMARY KEY,
+    film_work_id TEXT NOT NULL,
+    genre_id TEXT NOT NULL,
+    created_at timestamp with time zone
+);
+CREATE UNIQUE INDEX film_work_genre ON genre_film_work (film_work_id, genre_id);
+CREATE TABLE person_film_work (
+    id TEXT PRIMARY KEY,
+    film_work_id TEXT NOT NULL,
+    person_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    created_at timestamp with time zone
+);
+CREATE UNIQUE INDEX film_work_person_role ON person_film_work (film_work_id, person_id, role);
+'''
+
+ROLES = ('actor', 'director', 'writer')
+FILM_TYPES = ('movies', 'tv_show')
+EPOCH = datetime.datetime(2021, 6, 16, tzinfo=datetime.timezone.utc)
+
+
+class DatasetGenerator(object):
+    """
+    Заполняет SQLite БД детерминированными случайными данными.
+
+    Количество связей на фильм выбирается равномерно от 1 до 2 * среднего - 1,
+    поэтому среднее значение совпадает с заданным. Строки пишутся потоком,
+    расход памяти не зависит от размера БД, кроме списков id фильмов, жанров и персон.
+    """
+
+    def __init__(
+        self,
+        films: int = 10000,
+        genres: int = 30,
+        persons: int = 20000,
+        genres_per_film: int = 2,
+        persons_per_film: int = 6,
+        seed: int = 0,
+    ) -> None:
+        """
+        Init метод.
+
+        Args:
+            films: количество кинопроизведений
+            genres: количество жанров
+            persons: количество персон
+            genres_per_film: среднее количество жанров у кинопроизведения
+            persons_per_film: среднее количество персон у кинопроизведения
+            seed: начальное значение генератора случайных чисел
+        """
+        self.films = films
+        self.genres = genres
+        self.persons = persons
+        self.genres_per_film = genres_per_film
+        self.persons_per_film = persons_per_film
+        self.random = random.Random(seed)
+
+    def generate(self, db_path: str) -> dict:
+        """
+        Создаёт таблицы и заполняет их.
+
+        Args:
+            db_path: путь к файлу БД
+
+        Returns:
+            dict: количество строк в каждой таблице
+        """
+        film_ids = [self._uuid() for _ in range(self.films)]
+        genre_ids = [self._uuid() for _ in range(self.genres)]
+        person_ids = [self._uuid() for _ in range(self.persons)]
+        with closing(sqlite3.connect(db_path)) as connection:
+            connection.executescript(SCHEMA)
+            connection.executemany('INSERT INTO film_work VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);', self._films(film_ids))
+            connection.executemany('INSERT INTO genre VALUES (?, ?, ?, ?, ?);', self._genres(genre_ids))
+            connection.executemany('INSERT INTO person VALUES (?, ?, ?, ?);', self._persons(person_ids))
+            connection.executemany(
+                'INSERT INTO genre_film_work VALUES (?, ?, ?, ?);',
+                self._relations(film_ids, genre_ids, self.genres_per_film, roles=None),
+            )
+            connection.executemany(
+                'INSERT INTO person_film_work VALUES (?, ?, ?, ?, ?);',
+                self._relations(film_ids, person_ids, self.persons_per_film, roles=ROLES),
+            )
+            connection.commit()
+            return {
+                table: connection.execute('SELECT COUNT(*) FROM {table};'.format(table=table)).fetchone()[0]
+                for table in ('film_work', 'genre', 'person', 'genre_film_work', 'person_film_work')
+            }
+
+    def _uuid(self) -> str:
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def _timestamp(self) -> str:
+        moment = EPOCH + datetime.timedelta(seconds=self.random.randrange(365 * 24 * 3600),
+                                            microseconds=self.random.randrange(1000000))
+        return moment.isoformat(sep=' ')
+
+    def _films(self, film_ids: list) -> Iterator[tuple]:
+        for number, film_id in enumerate(film_ids):
+            created = self._timestamp()
+            yield (
+                film_id,
+                'Film {number}'.format(number=number),
+                'Synthetic description of film {number}.'.format(number=number),
+                (EPOCH.date() - datetime.timedelta(days=self.random.randrange(36500))).isoformat(),
+                None,
+                round(self.random.uniform(0, 10), 1),
+                self.random.choice(FILM_TYPES),
+                created,
+                created,
+            )
+
+    def _genres(self, genre_ids: list) -> Iterator[tuple]:
+        for number, genre_id in enumerate(genre_ids):
+            created = self._timestamp()
+            yield genre_id, 'Genre {number}'.format(number=number), None, created, created
+
+    def _persons(self, person_ids: list) -> Iterator[tuple]:
+        for number, person_id in enumerate(person_ids):
+            created = self._timestamp()
+            yield person_id, 'Person {number}'.format(number=number), created, created
+
+    def _relations(self, film_ids: list, other_ids: list, average: int, roles) -> Iterator[tuple]:
+        upper = min(max(2 * average - 1, 1), len(other_ids))
+        for film_id in film_ids:
+            for other_id in self.random.sample(other_ids, self.random.randint(1, upper)):
+                if roles is None:
+                    yield self._uuid(), film_id, other_id, self._timestamp()
+                else:
+                    yield self._uuid(), film_id, other_id, self.random.choice(roles), self._timestamp()
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Разбирает аргументы командной строки.
+
+    Returns:
+        argparse.Namespace: аргументы
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('db_path')
+    parser.add_argument('--films', type=int, default=10000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--persons', type=int, default=20000)
+    parser.add_argument('--genres-per-film', type=int, default=2)
+    parser.add_argument('--persons-per-film', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    counts = DatasetGenerator(
+        args.films, args.genres, args.persons, args.genres_per_film, args.persons_per_film, args.seed,
+    ).generate(args.db_path)
+    for table_name, count in counts.items():
+        print('{table:<17} {count:>10}'.format(table=table_name, count=count))
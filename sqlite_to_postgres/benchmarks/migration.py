@@ -0,0 +1,232 @@
+"""
+Замер скорости переноса синтетической БД в локальный Postgres со сравнением с сохранённым эталоном.
+
+Запуск из корня репозитория:
+    export BENCH_PG_DSN='dbname=movies_bench user=app password=123qwe host=127.0.0.1 port=5432'
+    python -m sqlite_to_postgres.benchmarks.migration --films 50000 --update-baseline
+    python -m sqlite_to_postgres.benchmarks.migration --films 50000 --check
+
+Все таблицы целевой БД очищаются, поэтому она задаётся явно через --dsn или
+BENCH_PG_DSN. Скрипт пишет только в пустую БД или в БД, которую он уже
+пометил как свою таблицей BENCHMARK_MARKER_TABLE.
+
+Код возврата 1 означает, что скорость какого-либо этапа упала или пик памяти
+вырос больше допустимого относительно эталона, а с --check - ещё и что эталона нет.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+import psycopg2
+
+from sqlite_to_postgres.benchmarks.dataset import DatasetGenerator
+from sqlite_to_postgres.metrics import STAGE_QUEUE, PipelineMetrics
+from sqlite_to_postgres.pipeline import prefetch
+from sqlite_to_postgres.postgres_saver import LOAD_METHOD_COPY, PostgresSaver
+from sqlite_to_postgres.sqlite_extractor import SQLiteExtractor
+from sqlite_to_postgres.summary import defer_summaries, refresh_deferred_summaries
+from sqlite_to_postgres.tables import TABLES
+
+DDL_PATH = Path(__file__).resolve().parents[2] / 'schema_design' / 'movies_database.ddl'
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+BENCHMARK_MARKER_TABLE = 'public.migration_benchmark_target'
+DEFAULT_TOLERANCE = 0.2
+
+
+def claim_target(curs) -> None:
+    """
+    Помечает БД как цель замеров, если в ней нет данных.
+
+    Args:
+        curs: курсор Postgres
+
+    Raises:
+        RuntimeError: БД не помечена как цель замеров, а в перенесённых таблицах есть строки
+    """
+    curs.execute('SELECT to_regclass(%s) IS NOT NULL;', (BENCHMARK_MARKER_TABLE,))
+    if curs.fetchone()[0]:
+        return
+    for table in TABLES:
+        curs.execute('SELECT to_regclass(%s) IS NOT NULL;', ('content.{table}'.format(table=table.name),))
+        if not curs.fetchone()[0]:
+            continue
+        curs.execute('SELECT EXISTS (SELECT 1 FROM content.{table});'.format(table=table.name))
+        if curs.fetchone()[0]:
+            raise RuntimeError('content.{table} has rows and the database is not a benchmark target'.format(
+                table=table.name,
+            ))
+    curs.execute('CREATE TABLE {marker} (created timestamp with time zone DEFAULT now());'.format(
+        marker=BENCHMARK_MARKER_TABLE,
+    ))
+
+
+def prepare_target(pg_conn) -> None:
+    """
+    Создаёт схему content, очищает таблицы перед замером и, как загрузчики,
+    откладывает пересчёт сводок кинопроизведений до конца переноса.
+
+    Args:
+        pg_conn: соединение с Postgres
+    """
+    with pg_conn.cursor() as curs:
+        claim_target(curs)
+        curs.execute(DDL_PATH.read_text())
+        curs.execute('SET search_path TO content, public;')
+        # CASCADE очищает и таблицы, ссылающиеся на перенесённые, например сводку кинопроизведений.
+        curs.execute('TRUNCATE {tables} CASCADE;'.format(tables=', '.join(table.name for table in TABLES)))
+    pg_conn.commit()
+    defer_summaries(pg_conn)
+
+
+def run(db_path: str, dsn: str, load: bool, load_method: str, trace_memory: bool, prefetch_depth: int = 0) -> dict:
+    """
+    Переносит все таблицы и собирает результаты замера.
+
+    Args:
+        db_path: путь к SQLite БД
+        dsn: строка подключения к Postgres
+        load: выполнять запись в Postgres
+        load_method: способ записи пачек
+        trace_memory: отслеживать выделения памяти через tracemalloc
+        prefetch_depth: размер очереди между потоками чтения и записи; 0 - без отдельного потока
+
+    Returns:
+        dict: скорость каждого этапа каждой таблицы, общая скорость и пик памяти
+    """
+    metrics = PipelineMetrics(trace_memory=trace_memory)
+    pg_conn = psycopg2.connect(dsn) if load else None
+    try:
+        with closing(sqlite3.connect(db_path, check_same_thread=False)) as connection:
+            extractor = SQLiteExtractor(connection, metrics=metrics)
+            saver = None
+            if pg_conn:
+                prepare_target(pg_conn)
+                saver = PostgresSaver(pg_conn, load_method, metrics=metrics)
+            started = time.perf_counter()
+            total_rows = 0
+            for table in TABLES:
+                batches = extractor.iter_table(table.name)
+                if prefetch_depth:
+                    batches = prefetch(batches, table.name, prefetch_depth, metrics)
+                for batch in batches:
+                    total_rows += len(batch.rows)
+                    if saver:
+                        saver.save(table.name, batch.rows)
+            if pg_conn:
+                pg_conn.commit()
+                refresh_deferred_summaries(pg_conn)
+            elapsed = time.perf_counter() - started
+    finally:
+        if pg_conn:
+            pg_conn.close()
+
+    summary = metrics.summary()
+    return {
+        'rows_per_second': {
+            '{table}.{stage}'.format(table=table, stage=stage): stage_summary['rows_per_second']
+            for table, stages in summary.items()
+            for stage, stage_summary in stages.items()
+            if stage != STAGE_QUEUE
+        },
+        'total_rows': total_rows,
+        'total_rows_per_second': total_rows / elapsed,
+        'peak_rss_bytes': max(
+            stage_summary['peak_rss_bytes'] for stages in summary.values() for stage_summary in stages.values()
+        ),
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Ищет ухудшения относительно эталона.
+
+    Args:
+        result: результат текущего замера
+        baseline: сохранённый эталон
+        tolerance: допустимое относительное отклонение
+
+    Returns:
+        list: описания найденных ухудшений
+    """
+    regressions = []
+    rates = dict(result['rows_per_second'], total=result['total_rows_per_second'])
+    baseline_rates = dict(baseline['rows_per_second'], total=baseline['total_rows_per_second'])
+    for key, expected in baseline_rates.items():
+        actual = rates.get(key)
+        if actual is not None and actual < expected * (1 - tolerance):
+            regressions.append('{key}: {actual:.0f} rows/s, baseline {expected:.0f} rows/s'.format(
+                key=key, actual=actual, expected=expected,
+            ))
+    if result['peak_rss_bytes'] > baseline['peak_rss_bytes'] * (1 + tolerance):
+        regressions.append('peak RSS: {actual} bytes, baseline {expected} bytes'.format(
+            actual=result['peak_rss_bytes'], expected=baseline['peak_rss_bytes'],
+        ))
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Разбирает аргументы командной строки.
+
+    Returns:
+        argparse.Namespace: аргументы
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='существующая SQLite БД; по умолчанию генерируется синтетическая')
+    parser.add_argument('--films', type=int, default=20000)
+    parser.add_argument('--persons', type=int, default=40000)
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_PG_DSN'), help='целевая БД, её таблицы очищаются')
+    parser.add_argument('--load-method', default=LOAD_METHOD_COPY)
+    parser.add_argument('--skip-load', action='store_true', help='замерить только extract и transform')
+    parser.add_argument('--trace-memory', action='store_true')
+    parser.add_argument('--prefetch-depth', type=int, default=0, help='читать пачки в отдельном потоке')
+    parser.add_argument('--baseline', default=str(BASELINE_PATH))
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--check', action='store_true', help='без эталона завершиться с кодом 1')
+    args = parser.parse_args()
+    if not args.skip_load and not args.dsn:
+        parser.error('--dsn or BENCH_PG_DSN is required unless --skip-load is given')
+    return args
+
+
+def main() -> int:
+    """
+    Выполняет замер и сравнивает его с эталоном.
+
+    Returns:
+        int: код возврата процесса
+    """
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = args.db
+        if db_path is None:
+            db_path = os.path.join(tmp_dir, 'bench.sqlite')
+            DatasetGenerator(films=args.films, persons=args.persons).generate(db_path)
+        result = run(
+            db_path, args.dsn, not args.skip_load, args.load_method, args.trace_memory, args.prefetch_depth,
+        )
+    print(json.dumps(result, indent=2))
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(result, indent=2) + '\n')
+        return 0
+    if not baseline_path.exists():
+        print('No baseline at {path}, run with --update-baseline first.'.format(path=baseline_path))
+        return 1 if args.check else 0
+    regressions = compare(result, json.loads(baseline_path.read_text()), args.tolerance)
+    for regression in regressions:
+        print('REGRESSION {regression}'.format(regression=regression))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
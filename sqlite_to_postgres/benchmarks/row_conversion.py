@@ -0,0 +1,110 @@
+"""
+Замер скорости и пикового расхода памяти на строку при преобразовании строк SQLite.
+
+Сравниваются два пути: прежний (sqlite3.Row -> dataclass -> кортеж для записи)
+и быстрый (кортеж в порядке колонок Postgres прямо из курсора).
+
+Запуск из корня репозитория:
+    python -m sqlite_to_postgres.benchmarks.row_conversion [rows]
+"""
+
+import sqlite3
+import sys
+import time
+import tracemalloc
+from operator import attrgetter
+from typing import Iterator
+
+from sqlite_to_postgres.data_types import PersonFilmwork
+from sqlite_to_postgres.sqlite_extractor import BATCH_SIZE, SQLiteExtractor
+from sqlite_to_postgres.tables import TABLES_BY_NAME
+
+DEFAULT_ROWS = 200000
+TABLE = 'person_film_work'
+
+
+def convert_via_dataclasses(connection: sqlite3.Connection) -> Iterator[list]:
+    """
+    Повторяет прежний путь строки: sqlite3.Row, объект dataclass и кортеж для записи.
+
+    Args:
+        connection: соединение с БД
+
+    Yields:
+        list: пачка кортежей в порядке колонок Postgres
+    """
+    to_tuple = attrgetter(*TABLES_BY_NAME[TABLE].columns)
+    curs = connection.cursor()
+    curs.row_factory = sqlite3.Row
+    curs.execute('SELECT * FROM person_film_work;')
+    while data := curs.fetchmany(BATCH_SIZE):
+        objects = [
+            PersonFilmwork(row['role'], row['created_at'], row['id'], row['person_id'], row['film_work_id'])
+            for row in data
+        ]
+        yield list(map(to_tuple, objects))
+
+
+def convert_via_registry(connection: sqlite3.Connection) -> Iterator[list]:
+    """
+    Быстрый путь: кортежи из реестра таблиц без промежуточных объектов.
+
+    Args:
+        connection: соединение с БД
+
+    Yields:
+        list: пачка кортежей в порядке колонок Postgres
+    """
+    for batch in SQLiteExtractor(connection).iter_table(TABLE):
+        yield batch.rows
+
+
+def measure(convert, connection: sqlite3.Connection) -> tuple:
+    """
+    Замеряет скорость и пиковый объём памяти на строку пачки.
+
+    Args:
+        convert: функция преобразования
+        connection: соединение с БД
+
+    Returns:
+        tuple: строк в секунду и байт на строку
+    """
+    started = time.perf_counter()
+    count = sum(len(batch) for batch in convert(connection))
+    rate = count / (time.perf_counter() - started)
+
+    tracemalloc.start()
+    for _ in convert(connection):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rate, peak / BATCH_SIZE
+
+
+def main(rows: int) -> None:
+    """
+    Запускает замеры на базе в памяти.
+
+    Args:
+        rows: количество строк в тестовой таблице
+    """
+    connection = sqlite3.connect(':memory:')
+    connection.executescript('''
+        CREATE TABLE person_film_work (id TEXT PRIMARY KEY, film_work_id TEXT NOT NULL,
+            person_id TEXT NOT NULL, role TEXT NOT NULL, created_at timestamp with time zone);
+    ''')
+    connection.executemany(
+        'INSERT INTO person_film_work VALUES (?, ?, ?, ?, ?);',
+        (('{0:032x}'.format(i), '{0:032x}'.format(i % 997), '{0:032x}'.format(i % 4999), 'actor',
+          '2021-06-16 20:14:09.221855+00') for i in range(rows)),
+    )
+    for name, convert in (('dataclass', convert_via_dataclasses), ('registry', convert_via_registry)):
+        rate, bytes_per_row = measure(convert, connection)
+        print('{name:<10} {rate:>10.0f} rows/s {size:>8.0f} bytes/row'.format(
+            name=name, rate=rate, size=bytes_per_row,
+        ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS)
@@ -0,0 +1,64 @@
+"""
+Замер скорости чтения таблицы person_film_work из SQLite в зависимости от количества процессов.
+
+Запуск из корня репозитория:
+    python -m sqlite_to_postgres.benchmarks.sharded_read [films]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+from sqlite_to_postgres.benchmarks.dataset import DatasetGenerator
+from sqlite_to_postgres.sharded_extractor import ShardedSQLiteExtractor
+from sqlite_to_postgres.sqlite_extractor import SQLiteExtractor
+
+DEFAULT_FILMS = 80000
+WORKER_COUNTS = (1, 2, 4, 8)
+
+
+def measure(extractor: SQLiteExtractor) -> tuple:
+    """
+    Читает таблицу целиком и замеряет время.
+
+    Args:
+        extractor: объект выгрузки
+
+    Returns:
+        tuple: количество прочитанных строк и затраченное время в секундах
+    """
+    started = time.perf_counter()
+    count = sum(len(batch.rows) for batch in extractor.iter_table('person_film_work'))
+    return count, time.perf_counter() - started
+
+
+def main(films: int) -> None:
+    """
+    Запускает замеры для одного соединения и для разного числа процессов.
+
+    Args:
+        films: количество кинопроизведений в синтетической БД
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'bench.sqlite')
+        rows = DatasetGenerator(films=films).generate(db_path)['person_film_work']
+        print('cpu: {cpu}, rows: {rows}'.format(cpu=os.cpu_count(), rows=rows))
+
+        with closing(sqlite3.connect(db_path)) as connection:
+            count, elapsed = measure(SQLiteExtractor(connection))
+        print('single cursor: {rate:>10.0f} rows/s'.format(rate=count / elapsed))
+
+        for workers in WORKER_COUNTS:
+            extractor = ShardedSQLiteExtractor(db_path, workers=workers, shard_size=rows // (workers * 4) + 1,
+                                               immutable=True)
+            count, elapsed = measure(extractor)
+            extractor.connection.close()
+            assert count == rows
+            print('{workers} workers:    {rate:>10.0f} rows/s'.format(workers=workers, rate=count / elapsed))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILMS)
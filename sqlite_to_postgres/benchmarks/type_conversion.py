@@ -0,0 +1,93 @@
+"""
+Замер преобразования типов на таблицах связей: строки как есть против UUID из кеша и datetime.
+
+Для каждого режима замеряются скорость выгрузки с преобразованием, скорость
+сериализации в формат COPY и объём памяти, который занимает пачка на строку.
+
+Запуск из корня репозитория:
+    python -m sqlite_to_postgres.benchmarks.type_conversion [films]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import closing
+from typing import Optional
+
+from sqlite_to_postgres.benchmarks.dataset import DatasetGenerator
+from sqlite_to_postgres.converters import TypeConverter
+from sqlite_to_postgres.postgres_saver import CopyEncoder
+from sqlite_to_postgres.sqlite_extractor import SQLiteExtractor
+
+DEFAULT_FILMS = 20000
+RELATION_TABLES = ('genre_film_work', 'person_film_work')
+MEMORY_BATCH_SIZE = 10000
+
+
+def measure(db_path: str, type_converter: Optional[TypeConverter]) -> dict:
+    """
+    Выгружает таблицы связей и сериализует их в формат COPY.
+
+    Args:
+        db_path: путь к SQLite БД
+        type_converter: объект преобразования типов или None
+
+    Returns:
+        dict: скорость выгрузки, скорость сериализации и байт на строку пачки
+    """
+    encoder = CopyEncoder('|')
+    rows = 0
+    extract_seconds = 0.0
+    encode_seconds = 0.0
+    with closing(sqlite3.connect(db_path)) as connection:
+        extractor = SQLiteExtractor(connection, type_converter=type_converter)
+        for table in RELATION_TABLES:
+            batches = extractor.iter_table(table)
+            while True:
+                started = time.perf_counter()
+                batch = next(batches, None)
+                extract_seconds += time.perf_counter() - started
+                if batch is None:
+                    break
+                started = time.perf_counter()
+                encoder.encode(batch.rows)
+                encode_seconds += time.perf_counter() - started
+                rows += len(batch.rows)
+
+        tracemalloc.start()
+        extractor = SQLiteExtractor(connection, MEMORY_BATCH_SIZE, type_converter=type_converter)
+        batch = next(extractor.iter_table('person_film_work'))
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'extract': rows / extract_seconds,
+        'encode': rows / encode_seconds,
+        'bytes_per_row': size / len(batch.rows),
+    }
+
+
+def main(films: int) -> None:
+    """
+    Запускает замеры на синтетической БД с большим количеством связей.
+
+    Args:
+        films: количество кинопроизведений
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'bench.sqlite')
+        counts = DatasetGenerator(films=films, persons=films // 4, persons_per_film=10).generate(db_path)
+        print('genre_film_work: {0}, person_film_work: {1}'.format(
+            counts['genre_film_work'], counts['person_film_work'],
+        ))
+        for name, type_converter in (('raw', None), ('converted', TypeConverter())):
+            result = measure(db_path, type_converter)
+            print('{name:<10} extract {extract:>9.0f} rows/s  encode {encode:>9.0f} rows/s  {size:>5.0f} bytes/row'.format(
+                name=name, size=result['bytes_per_row'], **result,
+            ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILMS)
@@ -0,0 +1,434 @@
+"""
+Непрерывный перенос изменений из SQLite в Postgres по журналу изменений.
+
+Триггеры на таблицах SQLite записывают id вставленных, изменённых и удалённых
+строк в таблицу migration_changelog, а демон читает журнал небольшими пачками
+и применяет изменения к Postgres.
+
+Порядок включения:
+    python cdc.py install   # триггеры и журнал в SQLite
+    python load_data.py     # первичный перенос, изменения во время него попадут в журнал
+    python cdc.py run       # демон
+    python cdc.py retry     # вернуть в журнал изменения, которые Postgres отверг
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import signal
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import closing
+from typing import Callable, Optional
+
+import psycopg2
+from psycopg2.extensions import connection as _connection
+
+from checkpoint import ChangelogPositionStore
+from commit_policy import POISON_ERRORS, CommitPolicy, is_transient
+from load_data import SQLITE_PATH, connect_postgres
+from metrics import PipelineMetrics
+from postgres_saver import LOAD_METHOD_VALUES, PostgresSaver
+from sqlite_extractor import SQLiteExtractor
+from tables import TABLES
+
+logger = logging.getLogger(__name__)
+
+CHANGELOG_TABLE = 'migration_changelog'
+REJECTED_TABLE = 'migration_changelog_rejected'
+CHANGELOG_BATCH_SIZE = 500
+POLL_INTERVAL = 1.0
+
+OPERATION_INSERT = 'I'
+OPERATION_UPDATE = 'U'
+OPERATION_DELETE = 'D'
+
+CHANGELOG_DDL = '''
+CREATE TABLE IF NOT EXISTS {changelog} (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+'''.format(changelog=CHANGELOG_TABLE)
+
+# Записи журнала строк, которые Postgres не принял, ждут здесь повторного применения.
+REJECTED_DDL = '''
+CREATE TABLE IF NOT EXISTS {rejected} (
+    seq INTEGER PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    row_id TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    changed_at TEXT NOT NULL,
+    error TEXT NOT NULL
+);
+'''.format(rejected=REJECTED_TABLE)
+
+# Смена id при обновлении записывается как удаление старой строки и изменение новой.
+TRIGGERS_DDL = '''
+CREATE TRIGGER IF NOT EXISTS {table}_cdc_insert AFTER INSERT ON {table}
+BEGIN
+    INSERT INTO {changelog} (table_name, row_id, operation) VALUES ('{table}', NEW.id, 'I');
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_cdc_update AFTER UPDATE ON {table}
+BEGIN
+    INSERT INTO {changelog} (table_name, row_id, operation) SELECT '{table}', OLD.id, 'D' WHERE OLD.id IS NOT NEW.id;
+    INSERT INTO {changelog} (table_name, row_id, operation) VALUES ('{table}', NEW.id, 'U');
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_cdc_delete AFTER DELETE ON {table}
+BEGIN
+    INSERT INTO {changelog} (table_name, row_id, operation) VALUES ('{table}', OLD.id, 'D');
+END;
+'''
+
+CHANGES_QUERY = (
+    'SELECT seq, table_name, row_id, operation, changed_at FROM {changelog} WHERE seq > ? ORDER BY seq LIMIT ?;'
+).format(changelog=CHANGELOG_TABLE)
+
+MOVE_REJECTED_QUERY = '''
+INSERT OR REPLACE INTO {rejected} (seq, table_name, row_id, operation, changed_at, error)
+SELECT seq, table_name, row_id, operation, changed_at, ? FROM {changelog}
+WHERE seq <= ? AND table_name = ? AND row_id = ?;
+'''.format(rejected=REJECTED_TABLE, changelog=CHANGELOG_TABLE)
+
+REQUEUE_QUERY = '''
+INSERT INTO {changelog} (table_name, row_id, operation, changed_at)
+SELECT table_name, row_id, operation, changed_at FROM {rejected} ORDER BY seq;
+'''.format(rejected=REJECTED_TABLE, changelog=CHANGELOG_TABLE)
+
+
+def install_triggers(connection: sqlite3.Connection) -> None:
+    """
+    Создаёт журнал изменений и триггеры на всех таблицах из TABLES.
+
+    Повторный вызов ничего не меняет.
+
+    Args:
+        connection: соединение с SQLite
+    """
+    script = CHANGELOG_DDL + REJECTED_DDL + ''.join(
+        TRIGGERS_DDL.format(table=table.name, changelog=CHANGELOG_TABLE) for table in TABLES
+    )
+    connection.executescript(script)
+    connection.commit()
+
+
+def uninstall_triggers(connection: sqlite3.Connection) -> None:
+    """
+    Удаляет триггеры и журнал изменений.
+
+    Args:
+        connection: соединение с SQLite
+    """
+    script = ''.join(
+        'DROP TRIGGER IF EXISTS {table}_cdc_{operation};'.format(table=table.name, operation=operation)
+        for table in TABLES
+        for operation in ('insert', 'update', 'delete')
+    )
+    connection.executescript(script + 'DROP TABLE IF EXISTS {changelog}; DROP TABLE IF EXISTS {rejected};'.format(
+        changelog=CHANGELOG_TABLE, rejected=REJECTED_TABLE,
+    ))
+    connection.commit()
+
+
+def requeue_rejected(connection: sqlite3.Connection) -> int:
+    """
+    Возвращает отвергнутые изменения в конец журнала, чтобы демон применил их снова.
+
+    Args:
+        connection: соединение с SQLite
+
+    Returns:
+        int: количество возвращённых записей
+    """
+    with connection:
+        connection.execute(REQUEUE_QUERY)
+        return connection.execute('DELETE FROM {rejected};'.format(rejected=REJECTED_TABLE)).rowcount
+
+
+def collapse_changes(changes: list) -> tuple:
+    """
+    Сворачивает записи журнала до последней операции над каждой строкой.
+
+    Args:
+        changes: записи журнала (seq, table_name, row_id, operation, changed_at) в порядке seq
+
+    Returns:
+        tuple: словари {таблица: [id]} строк для записи и строк для удаления
+    """
+    last_operations = {}
+    for _, table_name, row_id, operation, _ in changes:
+        last_operations[table_name, row_id] = operation
+    upserts = defaultdict(list)
+    deletes = defaultdict(list)
+    for (table_name, row_id), operation in last_operations.items():
+        if operation == OPERATION_DELETE:
+            deletes[table_name].append(row_id)
+        else:
+            upserts[table_name].append(row_id)
+    return upserts, deletes
+
+
+class ChangeDataCapture(object):
+    """
+    Применяет журнал изменений SQLite к Postgres.
+
+    Для изменённых строк из SQLite читается их текущее состояние, поэтому повторное
+    применение одной и той же пачки журнала даёт тот же результат. Номер последней
+    применённой записи журнала хранится в cdc_position и фиксируется в одной
+    транзакции с изменениями: после сбоя пачка применяется ещё раз (доставка
+    at-least-once). Применённые записи удаляются из журнала. Записи строк, которые
+    Postgres отверг (например, связь с ещё не перенесённым фильмом), переносятся
+    в migration_changelog_rejected вместе с ошибкой и возвращаются в журнал
+    функцией requeue_rejected (команда retry).
+
+    Пока журнал пуст, демон раз в poll_interval проверяет PRAGMA data_version:
+    значение меняется только при фиксации транзакций другими соединениями,
+    и проверка не читает ни одной таблицы.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        pg_conn: _connection,
+        batch_size: int = CHANGELOG_BATCH_SIZE,
+        poll_interval: float = POLL_INTERVAL,
+        policy: CommitPolicy = CommitPolicy(),
+        metrics: Optional[PipelineMetrics] = None,
+        reconnect: Optional[Callable[[], _connection]] = None,
+    ) -> None:
+        """
+        Init метод.
+
+        Args:
+            connection: соединение с SQLite, в которой установлены триггеры
+            pg_conn: соединение с Postgres
+            batch_size: количество записей журнала, применяемых в одной транзакции
+            poll_interval: пауза между проверками SQLite, пока журнал пуст
+            policy: количество повторов, задержки и файл отказов
+            metrics: сборщик метрик этапов extract и load
+            reconnect: функция открытия нового соединения после обрыва; без неё обрыв не лечится
+        """
+        self.connection = connection
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.policy = policy
+        self.metrics = metrics
+        self.reconnect = reconnect
+        self.extractor = SQLiteExtractor(connection, metrics=metrics)
+        self.applied = 0
+        self.rejected = 0
+        self._rejected_rows: list = []
+        self._stopping = threading.Event()
+        connection.executescript(REJECTED_DDL)
+        self._open(pg_conn)
+
+    def run(self) -> None:
+        """Применяет изменения, пока не будет вызван stop."""
+        logger.info('Change data capture started at %s', self.positions.get(CHANGELOG_TABLE))
+        while not self._stopping.is_set():
+            # Версия читается до журнала, чтобы не пропустить фиксацию во время применения пачки.
+            data_version = self._data_version()
+            if self.apply_once() == self.batch_size:
+                continue
+            while not self._stopping.wait(self.poll_interval) and self._data_version() == data_version:
+                pass
+        logger.info('Change data capture stopped, %s changes applied', self.applied)
+
+    def stop(self) -> None:
+        """Просит run завершиться после текущей пачки."""
+        self._stopping.set()
+
+    def apply_once(self) -> int:
+        """
+        Применяет одну пачку журнала.
+
+        Returns:
+            int: количество применённых записей журнала
+        """
+        curs = self.connection.execute(CHANGES_QUERY, (self.positions.get(CHANGELOG_TABLE), self.batch_size))
+        changes = curs.fetchall()
+        if not changes:
+            return 0
+        last_seq = changes[-1][0]
+        try:
+            self._apply(changes, last_seq)
+        except psycopg2.Error as error:
+            if not is_transient(error):
+                raise
+            self._retry(changes, last_seq, error)
+        # Отказы учитываются только после фиксации: повтор _apply после обрыва не записывает их дважды.
+        for table_name, row, error in self._rejected_rows:
+            self._reject(table_name, row, error)
+        with self.connection:
+            self.connection.executemany(MOVE_REJECTED_QUERY, [
+                (str(error).strip(), last_seq, table_name, row[0]) for table_name, row, error in self._rejected_rows
+            ])
+            self.connection.execute(
+                'DELETE FROM {changelog} WHERE seq <= ?;'.format(changelog=CHANGELOG_TABLE), (last_seq,),
+            )
+        self.applied += len(changes)
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        lag = now - datetime.datetime.fromisoformat(changes[-1][4])
+        logger.info('Applied %s changes up to %s, lag %.1fs', len(changes), last_seq, lag.total_seconds())
+        return len(changes)
+
+    def _open(self, pg_conn: _connection) -> None:
+        self.pg_conn = pg_conn
+        self.saver = PostgresSaver(pg_conn, LOAD_METHOD_VALUES, metrics=self.metrics, upsert=True, only_newer=False)
+        self.positions = ChangelogPositionStore(pg_conn)
+
+    def _retry(self, changes: list, last_seq: int, error: psycopg2.Error) -> None:
+        for attempt in range(1, self.policy.max_retries + 1):
+            logger.warning('Transient error, retry %s of %s: %s', attempt, self.policy.max_retries, error)
+            time.sleep(min(self.policy.backoff_seconds * 2 ** (attempt - 1), self.policy.max_backoff_seconds))
+            try:
+                self._reset()
+                self._apply(changes, last_seq)
+                return
+            except psycopg2.Error as retry_error:
+                if not is_transient(retry_error):
+                    raise
+                error = retry_error
+        raise error
+
+    def _reset(self) -> None:
+        if not self.pg_conn.closed:
+            try:
+                self.pg_conn.rollback()
+                return
+            except psycopg2.Error:
+                logger.warning('Rollback failed, reopening the connection')
+        if self.reconnect is None:
+            raise psycopg2.InterfaceError('Connection is closed and no reconnect function is given')
+        try:
+            self.pg_conn.close()
+        except psycopg2.Error:
+            logger.warning('Closing the broken connection failed', exc_info=True)
+        self._open(self.reconnect())
+
+    def _apply(self, changes: list, last_seq: int) -> None:
+        """
+        Применяет пачку журнала в одной транзакции вместе с сохранением позиции.
+
+        Удаления выполняются от связей к родительским таблицам, записи - в обратном
+        порядке. Строки, которых уже нет в SQLite, удаляются и из Postgres.
+
+        Args:
+            changes: записи журнала в порядке seq
+            last_seq: номер последней записи пачки
+        """
+        self._rejected_rows = []
+        upserts, deletes = collapse_changes(changes)
+        rows = {}
+        for table_name, ids in upserts.items():
+            rows[table_name] = self.extractor.get_rows(table_name, ids)
+            found = {row[0] for row in rows[table_name]}
+            deletes[table_name].extend(row_id for row_id in ids if row_id not in found)
+        with self.pg_conn.cursor() as curs:
+            for table in reversed(TABLES):
+                if deletes.get(table.name):
+                    self._delete(curs, table.name, deletes[table.name])
+        for table in TABLES:
+            if rows.get(table.name):
+                self._save(table.name, rows[table.name])
+        self.positions.save(CHANGELOG_TABLE, last_seq)
+        self.pg_conn.commit()
+
+    def _delete(self, curs, table_name: str, ids: list) -> None:
+        """
+        Удаляет строки вместе со ссылающимися на них строками таблиц связей.
+
+        Каскад выполняется явно и не зависит от ON DELETE у внешних ключей в Postgres.
+
+        Args:
+            curs: курсор Postgres
+            table_name: имя таблицы
+            ids: список id удаляемых строк
+        """
+        for child in TABLES:
+            if table_name in child.depends_on:
+                curs.execute(
+                    'DELETE FROM {child} WHERE {table}_id = ANY(%s::uuid[]);'.format(
+                        child=child.name, table=table_name,
+                    ),
+                    (ids,),
+                )
+        curs.execute('DELETE FROM {table} WHERE id = ANY(%s::uuid[]);'.format(table=table_name), (ids,))
+
+    def _save(self, table_name: str, rows: list) -> None:
+        """
+        Записывает строки, откладывая те, что Postgres не принимает.
+
+        Args:
+            table_name: имя таблицы
+            rows: список кортежей
+        """
+        curs = self.saver.curs
+        curs.execute('SAVEPOINT changes;')
+        try:
+            self.saver.save(table_name, rows)
+        except POISON_ERRORS:
+            curs.execute('ROLLBACK TO SAVEPOINT changes;')
+            # Пачки журнала небольшие, поэтому при ошибке строки записываются по одной.
+            for row in rows:
+                curs.execute('SAVEPOINT changes;')
+                try:
+                    self.saver.save(table_name, [row])
+                except POISON_ERRORS as error:
+                    curs.execute('ROLLBACK TO SAVEPOINT changes;')
+                    self._rejected_rows.append((table_name, row, error))
+                curs.execute('RELEASE SAVEPOINT changes;')
+        curs.execute('RELEASE SAVEPOINT changes;')
+
+    def _data_version(self) -> int:
+        return self.connection.execute('PRAGMA data_version;').fetchone()[0]
+
+    def _reject(self, table_name: str, row: tuple, error: Exception) -> None:
+        self.rejected += 1
+        logger.warning('Rejected row %s in %s: %s', row[0], table_name, error)
+        with open(self.policy.reject_path, 'a') as reject_file:
+            reject_file.write(json.dumps(
+                {'table': table_name, 'row': row, 'error': str(error).strip()}, default=str,
+            ) + '\n')
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Разбирает аргументы командной строки.
+
+    Returns:
+        argparse.Namespace: аргументы
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('install', 'uninstall', 'run', 'retry'))
+    parser.add_argument('--sqlite-path', default=SQLITE_PATH)
+    parser.add_argument('--batch-size', type=int, default=CHANGELOG_BATCH_SIZE)
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    with closing(sqlite3.connect(args.sqlite_path)) as sqlite_conn:
+        if args.command == 'install':
+            install_triggers(sqlite_conn)
+        elif args.command == 'uninstall':
+            uninstall_triggers(sqlite_conn)
+        elif args.command == 'retry':
+            logger.info('Requeued %s rejected changes', requeue_rejected(sqlite_conn))
+        else:
+            cdc = ChangeDataCapture(
+                sqlite_conn, connect_postgres(), args.batch_size, args.poll_interval, reconnect=connect_postgres,
+            )
+            signal.signal(signal.SIGTERM, lambda signum, frame: cdc.stop())
+            signal.signal(signal.SIGINT, lambda signum, frame: cdc.stop())
+            try:
+                cdc.run()
+            finally:
+                cdc.pg_conn.close()
@@ -0,0 +1,189 @@
+"""Хранение контрольных точек переноса данных."""
+
+from typing import Optional
+
+from psycopg2.extensions import connection as _connection
+
+
+class PostgresCheckpointStore(object):
+    """
+    Хранит для каждой таблицы rowid последней перенесённой строки SQLite.
+
+    Контрольная точка записывается в той же транзакции, что и пачка данных,
+    поэтому после сбоя она никогда не опережает реально сохранённые строки.
+    """
+
+    def __init__(self, pg_conn: _connection) -> None:
+        """
+        Init метод.
+
+        Args:
+            pg_conn: соединение с БД, через которое сохраняются данные
+        """
+        self.pg_conn = pg_conn
+        self.curs = self.pg_conn.cursor()
+        self.curs.execute(
+            'CREATE TABLE IF NOT EXISTS migration_checkpoint ('
+            'table_name TEXT PRIMARY KEY, '
+            'last_rowid BIGINT NOT NULL, '
+            'modified timestamp with time zone NOT NULL DEFAULT now());',
+        )
+        self.pg_conn.commit()
+
+    def get(self, table_name: str) -> int:
+        """
+        Возвращает rowid последней перенесённой строки таблицы.
+
+        Args:
+            table_name: имя таблицы
+
+        Returns:
+            int: rowid или 0, если таблица ещё не переносилась
+        """
+        self.curs.execute('SELECT last_rowid FROM migration_checkpoint WHERE table_name = %s;', (table_name,))
+        row = self.curs.fetchone()
+        return row[0] if row else 0
+
+    def save(self, table_name: str, last_rowid: int) -> None:
+        """
+        Записывает контрольную точку в текущую транзакцию, не фиксируя её.
+
+        Args:
+            table_name: имя таблицы
+            last_rowid: rowid последней строки сохранённой пачки
+        """
+        self.curs.execute(
+            'INSERT INTO migration_checkpoint (table_name, last_rowid) VALUES (%s, %s) '
+            'ON CONFLICT (table_name) DO UPDATE SET last_rowid = excluded.last_rowid, modified = now();',
+            (table_name, last_rowid),
+        )
+
+    def commit(self, table_name: str, last_rowid: int) -> None:
+        """
+        Сохраняет контрольную точку и фиксирует транзакцию вместе с записанной пачкой.
+
+        Args:
+            table_name: имя таблицы
+            last_rowid: rowid последней строки сохранённой пачки
+        """
+        self.save(table_name, last_rowid)
+        self.pg_conn.commit()
+
+    def reset(self) -> None:
+        """Удаляет все контрольные точки, чтобы следующий запуск начался с начала таблиц."""
+        self.curs.execute('DELETE FROM migration_checkpoint;')
+        self.pg_conn.commit()
+
+
+class PostgresHighWaterMarkStore(object):
+    """
+    Хранит для каждой таблицы значение колонки версии последней синхронизированной строки.
+
+    Отметка, как и контрольная точка, пишется в транзакции с данными, поэтому
+    следующая синхронизация начинается ровно с первой незафиксированной строки.
+    """
+
+    def __init__(self, pg_conn: _connection) -> None:
+        """
+        Init метод.
+
+        Args:
+            pg_conn: соединение с БД, через которое сохраняются данные
+        """
+        self.pg_conn = pg_conn
+        self.curs = self.pg_conn.cursor()
+        self.curs.execute(
+            'CREATE TABLE IF NOT EXISTS sync_high_water_mark ('
+            'table_name TEXT PRIMARY KEY, '
+            'high_water_mark TEXT NOT NULL, '
+            'modified timestamp with time zone NOT NULL DEFAULT now());',
+        )
+        self.pg_conn.commit()
+
+    def get(self, table_name: str) -> Optional[str]:
+        """
+        Возвращает отметку последней синхронизации таблицы.
+
+        Args:
+            table_name: имя таблицы
+
+        Returns:
+            Optional[str]: значение колонки версии в формате SQLite или None, если таблица не синхронизировалась
+        """
+        self.curs.execute('SELECT high_water_mark FROM sync_high_water_mark WHERE table_name = %s;', (table_name,))
+        row = self.curs.fetchone()
+        return row[0] if row else None
+
+    def save(self, table_name: str, high_water_mark: str) -> None:
+        """
+        Записывает отметку в текущую транзакцию, не фиксируя её.
+
+        Args:
+            table_name: имя таблицы
+            high_water_mark: значение колонки версии последней строки сохранённой пачки
+        """
+        self.curs.execute(
+            'INSERT INTO sync_high_water_mark (table_name, high_water_mark) VALUES (%s, %s) '
+            'ON CONFLICT (table_name) DO UPDATE SET high_water_mark = excluded.high_water_mark, modified = now();',
+            (table_name, high_water_mark),
+        )
+
+    def reset(self) -> None:
+        """Удаляет все отметки, чтобы следующая синхронизация прошла по таблицам целиком."""
+        self.curs.execute('DELETE FROM sync_high_water_mark;')
+        self.pg_conn.commit()
+
+
+class ChangelogPositionStore(object):
+    """
+    Хранит номер последней применённой записи журнала изменений SQLite.
+
+    Позиция лежит в отдельной таблице, поэтому сброс контрольных точек первичной
+    загрузки (PostgresCheckpointStore.reset) не возвращает демон CDC к началу журнала.
+    Как и контрольная точка, номер пишется в транзакции с применёнными изменениями.
+    """
+
+    def __init__(self, pg_conn: _connection) -> None:
+        """
+        Init метод.
+
+        Args:
+            pg_conn: соединение с БД, через которое применяются изменения
+        """
+        self.pg_conn = pg_conn
+        self.curs = self.pg_conn.cursor()
+        self.curs.execute(
+            'CREATE TABLE IF NOT EXISTS cdc_position ('
+            'changelog TEXT PRIMARY KEY, '
+            'last_seq BIGINT NOT NULL, '
+            'modified timestamp with time zone NOT NULL DEFAULT now());',
+        )
+        self.pg_conn.commit()
+
+    def get(self, changelog: str) -> int:
+        """
+        Возвращает номер последней применённой записи журнала.
+
+        Args:
+            changelog: имя таблицы журнала в SQLite
+
+        Returns:
+            int: номер записи или 0, если журнал ещё не применялся
+        """
+        self.curs.execute('SELECT last_seq FROM cdc_position WHERE changelog = %s;', (changelog,))
+        row = self.curs.fetchone()
+        return row[0] if row else 0
+
+    def save(self, changelog: str, last_seq: int) -> None:
+        """
+        Записывает позицию в текущую транзакцию, не фиксируя её.
+
+        Args:
+            changelog: имя таблицы журнала в SQLite
+            last_seq: номер последней записи применённой пачки
+        """
+        self.curs.execute(
+            'INSERT INTO cdc_position (changelog, last_seq) VALUES (%s, %s) '
+            'ON CONFLICT (changelog) DO UPDATE SET last_seq = excluded.last_seq, modified = now();',
+            (changelog, last_seq),
+        )
@@ -0,0 +1,265 @@
+"""Политика фиксации транзакций при записи пачек в postgresql."""
+
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import psycopg2
+from psycopg2.extensions import connection as _connection
+
+from sqlite_to_postgres.checkpoint import (PostgresCheckpointStore,
+                                          PostgresHighWaterMarkStore)
+from sqlite_to_postgres.data_types import Batch
+from sqlite_to_postgres.metrics import STAGE_LOAD, PipelineMetrics
+from sqlite_to_postgres.postgres_saver import LOAD_METHOD_COPY, PostgresSaver
+from sqlite_to_postgres.summary import DEFER_SUMMARIES_QUERY
+
+logger = logging.getLogger(__name__)
+
+# serialization_failure, deadlock_detected, lock_not_available, admin_shutdown, cannot_connect_now
+TRANSIENT_PGCODES = frozenset(('40001', '40P01', '55P03', '57P01', '57P03'))
+
+# Ошибки в данных конкретных строк: такие пачки делятся пополам, пока не найдутся плохие строки.
+POISON_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+
+@dataclass(frozen=True)
+class CommitPolicy:
+    """Настройки фиксации транзакций и повторов."""
+
+    commit_every: int = 10
+    synchronous_commit: str = 'off'
+    max_retries: int = 5
+    backoff_seconds: float = 0.5
+    max_backoff_seconds: float = 30.0
+    reject_path: str = 'rejected_rows.jsonl'
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Проверяет, имеет ли смысл повторить операцию после ошибки.
+
+    Args:
+        error: исключение psycopg2
+
+    Returns:
+        bool: ошибка временная (обрыв соединения, взаимоблокировка и т.п.)
+    """
+    return isinstance(error, psycopg2.OperationalError) or getattr(error, 'pgcode', None) in TRANSIENT_PGCODES
+
+
+class BatchCommitter(object):
+    """
+    Записывает пачки через PostgresSaver и фиксирует транзакцию каждые commit_every пачек.
+
+    Незафиксированные пачки хранятся в памяти: при временной ошибке транзакция
+    откатывается (или соединение открывается заново) и пачки записываются повторно
+    с экспоненциальной задержкой. Каждая пачка пишется внутри SAVEPOINT; если
+    Postgres отвергает данные, пачка делится пополам до отдельных строк, плохие
+    строки попадают в файл reject_path, остальные сохраняются. Отвергнутая строка
+    записывается в файл один раз: при повторе транзакции она пропускается.
+    Контрольные точки пишутся в той же транзакции, что и данные.
+
+    Для bulk-загрузки сессия работает с synchronous_commit = off: при сбое сервера
+    могут потеряться последние фиксации, но вместе с ними теряются и их контрольные
+    точки, поэтому повторный запуск с resume дозагрузит эти пачки. Пересчёт сводок
+    кинопроизведений в сессии откладывается (summary.defer_summaries) до
+    refresh_deferred_summaries в конце загрузки.
+
+    В режиме sync существующие строки обновляются более новыми версиями,
+    а вместо rowid фиксируется отметка колонки версии последней строки.
+    """
+
+    def __init__(
+        self,
+        pg_conn: _connection,
+        policy: CommitPolicy = CommitPolicy(),
+        load_method: str = LOAD_METHOD_COPY,
+        metrics: Optional[PipelineMetrics] = None,
+        resume: bool = False,
+        reconnect: Optional[Callable[[], _connection]] = None,
+        sync: bool = False,
+    ) -> None:
+        """
+        Init метод.
+
+        Args:
+            pg_conn: соединение с Postgres
+            policy: политика фиксации и повторов
+            load_method: способ записи пачек
+            metrics: сборщик метрик этапа load
+            resume: использовать контрольные точки
+            reconnect: функция открытия нового соединения после обрыва; без неё обрыв не лечится
+            sync: синхронизация изменений - upsert и отметки версий вместо контрольных точек rowid
+        """
+        self.policy = policy
+        self.load_method = load_method
+        self.metrics = metrics
+        self.resume = resume
+        self.reconnect = reconnect
+        self.sync = sync
+        self._pending: list = []
+        # id отвергнутых строк незафиксированных пачек: при повторе они не записываются снова.
+        self._rejected_ids: set = set()
+        self._rejected = 0
+        self._open(pg_conn)
+
+    def checkpoint(self, table_name: str) -> int:
+        """
+        Возвращает rowid, с которого нужно продолжить выгрузку таблицы.
+
+        Args:
+            table_name: имя таблицы
+
+        Returns:
+            int: rowid последней зафиксированной строки или 0
+        """
+        return self.checkpoints.get(table_name) if self.checkpoints else 0
+
+    def high_water_mark(self, table_name: str) -> Optional[str]:
+        """
+        Возвращает отметку версии, с которой нужно выгружать изменения таблицы.
+
+        Args:
+            table_name: имя таблицы
+
+        Returns:
+            Optional[str]: отметка последней зафиксированной синхронизации или None
+        """
+        return self.high_water_marks.get(table_name) if self.high_water_marks else None
+
+    def write(self, table_name: str, batch: Batch) -> None:
+        """
+        Записывает пачку и фиксирует транзакцию, если набралось commit_every пачек.
+
+        Args:
+            table_name: имя таблицы
+            batch: пачка кортежей
+        """
+        self._pending.append((table_name, batch))
+        try:
+            self._write_rows(table_name, batch.rows)
+        except psycopg2.Error as error:
+            if not is_transient(error):
+                raise
+            self._retry_transaction(error, commit=False)
+        if len(self._pending) >= self.policy.commit_every:
+            self.commit()
+
+    def commit(self) -> None:
+        """Фиксирует записанные пачки вместе с контрольными точками."""
+        if not self._pending:
+            return
+        try:
+            self._commit_pending()
+        except psycopg2.Error as error:
+            if not is_transient(error):
+                raise
+            self._retry_transaction(error, commit=True)
+        self._pending = []
+        self._rejected_ids.clear()
+
+    @property
+    def rejected(self) -> int:
+        """
+        Количество строк, отправленных в файл отказов.
+
+        Returns:
+            int: количество строк
+        """
+        return self._rejected
+
+    def _open(self, pg_conn: _connection) -> None:
+        self.pg_conn = pg_conn
+        with pg_conn.cursor() as curs:
+            curs.execute('SET synchronous_commit TO %s;', (self.policy.synchronous_commit,))
+            curs.execute(DEFER_SUMMARIES_QUERY)
+        pg_conn.commit()
+        self.saver = PostgresSaver(pg_conn, self.load_method, metrics=self.metrics, upsert=self.sync)
+        self.checkpoints = PostgresCheckpointStore(pg_conn) if self.resume and not self.sync else None
+        self.high_water_marks = PostgresHighWaterMarkStore(pg_conn) if self.sync else None
+
+    def _reset(self) -> None:
+        if not self.pg_conn.closed:
+            try:
+                self.pg_conn.rollback()
+                return
+            except psycopg2.Error:
+                logger.warning('Rollback failed, reopening the connection')
+        if self.reconnect is None:
+            raise psycopg2.InterfaceError('Connection is closed and no reconnect function is given')
+        if not self.pg_conn.closed:
+            self.pg_conn.close()
+        self._open(self.reconnect())
+
+    def _retry_transaction(self, error: psycopg2.Error, commit: bool) -> None:
+        for attempt in range(1, self.policy.max_retries + 1):
+            logger.warning('Transient error, retry %s of %s: %s', attempt, self.policy.max_retries, error)
+            time.sleep(min(self.policy.backoff_seconds * 2 ** (attempt - 1), self.policy.max_backoff_seconds))
+            try:
+                self._reset()
+                for table_name, batch in self._pending:
+                    self._write_rows(table_name, [
+                        row for row in batch.rows if (table_name, row[0]) not in self._rejected_ids
+                    ])
+                if commit:
+                    self._commit_pending()
+                return
+            except psycopg2.Error as retry_error:
+                if not is_transient(retry_error):
+                    raise
+                error = retry_error
+        raise error
+
+    def _commit_pending(self) -> None:
+        if self.checkpoints:
+            last_rowids = {table_name: batch.last_rowid for table_name, batch in self._pending}
+            for table_name, last_rowid in last_rowids.items():
+                self.checkpoints.save(table_name, last_rowid)
+        if self.high_water_marks:
+            marks = {
+                table_name: batch.high_water_mark for table_name, batch in self._pending
+                if batch.high_water_mark is not None
+            }
+            for table_name, high_water_mark in marks.items():
+                self.high_water_marks.save(table_name, high_water_mark)
+        self.pg_conn.commit()
+
+    def _write_rows(self, table_name: str, rows: list) -> None:
+        """
+        Записывает строки внутри SAVEPOINT, деля их пополам при ошибке в данных.
+
+        Args:
+            table_name: имя таблицы
+            rows: список кортежей
+        """
+        if not rows:
+            return
+        curs = self.saver.curs
+        curs.execute('SAVEPOINT batch;')
+        try:
+            self.saver.save(table_name, rows)
+        except POISON_ERRORS as error:
+            curs.execute('ROLLBACK TO SAVEPOINT batch;')
+            curs.execute('RELEASE SAVEPOINT batch;')
+            if len(rows) == 1:
+                self._reject(table_name, rows[0], error)
+                return
+            middle = len(rows) // 2
+            self._write_rows(table_name, rows[:middle])
+            self._write_rows(table_name, rows[middle:])
+            return
+        curs.execute('RELEASE SAVEPOINT batch;')
+
+    def _reject(self, table_name: str, row: tuple, error: Exception) -> None:
+        self._rejected_ids.add((table_name, row[0]))
+        self._rejected += 1
+        logger.warning('Rejected row %s in %s: %s', row[0], table_name, error)
+        with open(self.policy.reject_path, 'a') as reject_file:
+            reject_file.write(json.dumps(
+                {'table': table_name, 'row': row, 'error': str(error).strip()}, default=str,
+            ) + '\n')
+        if self.metrics:
+            self.metrics.record_error(table_name, STAGE_LOAD)
@@ -0,0 +1,149 @@
+"""Приведение значений из SQLite к типам Postgres во время выгрузки."""
+
+import datetime
+import uuid
+from functools import lru_cache, partial
+from operator import attrgetter, itemgetter
+from typing import Callable, Iterable
+
+from sqlite_to_postgres.tables import Table
+
+UUID_CACHE_SIZE = 2 ** 18
+
+
+def parse_uuid(value):
+    """
+    Превращает строку из SQLite в объект UUID.
+
+    Args:
+        value: строка, UUID или None
+
+    Returns:
+        uuid.UUID или None
+    """
+    if value is None or isinstance(value, uuid.UUID):
+        return value
+    return uuid.UUID(value)
+
+
+def parse_timestamp(value):
+    """
+    Превращает строку из SQLite в datetime с часовым поясом, без пояса считается UTC.
+
+    Args:
+        value: строка в формате ISO 8601, datetime или None
+
+    Returns:
+        datetime.datetime или None
+    """
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def parse_date(value):
+    """
+    Превращает строку из SQLite в date.
+
+    Args:
+        value: строка в формате ISO 8601, date или None
+
+    Returns:
+        datetime.date или None
+    """
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value)
+
+
+def parse_timestamps(values: Iterable) -> list:
+    """
+    Превращает колонку меток времени одной пачки в datetime с часовым поясом.
+
+    Колонка разбирается через map в C без вызова функции Python на каждое значение,
+    пояс UTC добавляется только меткам без пояса. Если в колонке есть NULL или уже
+    разобранные значения, она разбирается по одному значению через parse_timestamp.
+
+    Args:
+        values: колонка пачки - строки в формате ISO 8601, datetime или None
+
+    Returns:
+        list: значения колонки в том же порядке
+    """
+    values = list(values)
+    try:
+        parsed = list(map(datetime.datetime.fromisoformat, values))
+    except TypeError:
+        return list(map(parse_timestamp, values))
+    if None in map(attrgetter('tzinfo'), parsed):
+        parsed = [
+            moment.replace(tzinfo=datetime.timezone.utc) if moment.tzinfo is None else moment for moment in parsed
+        ]
+    return parsed
+
+
+class TypeConverter(object):
+    """
+    Создаёт для таблиц функции преобразования пачек строк курсора в кортежи значений Postgres.
+
+    Пачка преобразуется по колонкам: UUID внешних ключей берутся из ограниченного
+    LRU кеша, поэтому одинаковые значения в таблицах связей становятся одним
+    объектом, а метки времени разбираются всей колонкой функцией parse_timestamps.
+    Колонки читаются и собираются обратно в кортежи через map и zip без вызова
+    функции Python на каждую строку.
+    """
+
+    def __init__(self, uuid_cache_size: int = UUID_CACHE_SIZE):
+        """
+        Init метод.
+
+        Args:
+            uuid_cache_size: размер кеша UUID
+        """
+        self.uuid_cache_size = uuid_cache_size
+        self.parsers = {
+            'uuid': partial(map, lru_cache(maxsize=uuid_cache_size)(parse_uuid)),
+            'timestamp': parse_timestamps,
+            'date': partial(map, parse_date),
+            'text': None,
+            'float': None,
+        }
+
+    def __reduce__(self) -> tuple:
+        """
+        Передаёт в другой процесс только настройки: кеш в каждом процессе свой.
+
+        Returns:
+            tuple: класс и аргументы для создания копии
+        """
+        return self.__class__, (self.uuid_cache_size,)
+
+    def make_batch_converter(self, table: Table, offset: int = 1) -> Callable[[list], list]:
+        """
+        Создаёт функцию преобразования пачки строк курсора для конкретной таблицы.
+
+        Args:
+            table: описание таблицы
+            offset: номер первой колонки таблицы в строке курсора (перед ней идёт rowid)
+
+        Returns:
+            Callable: функция список строк курсора -> список кортежей в порядке колонок Postgres
+        """
+        # Первичный ключ уникален, кеш для него бесполезен: он передаётся строкой как есть.
+        steps = [
+            (position, self.parsers[column_type])
+            for position, column_type in enumerate(table.column_types)
+            if position and self.parsers[column_type] is not None
+        ]
+        getters = [itemgetter(index) for index in range(offset, offset + len(table.columns))]
+
+        def convert(data: list) -> list:
+            columns = [map(getter, data) for getter in getters]
+            for position, parser in steps:
+                columns[position] = parser(columns[position])
+            return list(zip(*columns))
+
+        return convert
@@ -3,6 +3,7 @@
 import datetime
 import uuid
 from dataclasses import dataclass, field
+from typing import Optional
 
 
 @dataclass(frozen=True)
@@ -59,3 +60,17 @@ class GenreFilmwork:
     id: uuid.UUID = field(default_factory=uuid.uuid4)
     genre_id: uuid.UUID = field(default_factory=uuid.uuid4)
     film_work_id: uuid.UUID = field(default_factory=uuid.uuid4)
+
+
+@dataclass(frozen=True)
+class Batch:
+    """
+    Пачка объектов, прочитанных из одной таблицы, и rowid последней строки в ней.
+
+    При выгрузке изменений high_water_mark содержит значение колонки версии
+    последней строки в том виде, в котором оно хранится в SQLite.
+    """
+
+    rows: list
+    last_rowid: int
+    high_water_mark: Optional[str] = None
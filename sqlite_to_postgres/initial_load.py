@@ -0,0 +1,163 @@
+"""Режим первичной загрузки: индексы и внешние ключи создаются после переноса данных."""
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Callable, Optional
+
+from psycopg2.extensions import connection as _connection
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = 'initial_load_schema.json'
+DEFAULT_REBUILD_WORKERS = 4
+
+# Уникальные индексы не трогаются: на них опирается ON CONFLICT и защита от дублей.
+INDEXES_QUERY = '''
+SELECT index_class.relname, pg_get_indexdef(pg_index.indexrelid)
+FROM pg_index
+JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+WHERE pg_index.indrelid = %s::regclass
+  AND NOT pg_index.indisunique
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE pg_constraint.conindid = pg_index.indexrelid)
+ORDER BY index_class.relname;
+'''
+
+FOREIGN_KEYS_QUERY = '''
+SELECT conname, pg_get_constraintdef(oid)
+FROM pg_constraint
+WHERE conrelid = %s::regclass AND contype = 'f'
+ORDER BY conname;
+'''
+
+
+class DeferredSchema(object):
+    """
+    Снимает вторичные индексы и внешние ключи с целевых таблиц на время загрузки.
+
+    Определения сохраняются в файл до удаления, поэтому после сбоя схему можно
+    восстановить повторным запуском restore. Индексы пересоздаются параллельно
+    на нескольких соединениях, внешние ключи добавляются как NOT VALID и затем
+    проверяются командой VALIDATE CONSTRAINT. После восстановления определения
+    сравниваются с исходными.
+    """
+
+    def __init__(self, pg_conn: _connection, tables: list, state_path: str = STATE_PATH) -> None:
+        """
+        Init метод.
+
+        Args:
+            pg_conn: соединение с Postgres
+            tables: имена целевых таблиц
+            state_path: файл для сохранения снятых определений
+        """
+        self.pg_conn = pg_conn
+        self.tables = tables
+        self.state_path = state_path
+
+    def capture(self) -> dict:
+        """
+        Читает текущие определения вторичных индексов и внешних ключей.
+
+        Returns:
+            dict: {'indexes': [[таблица, имя, определение]], 'foreign_keys': [[таблица, имя, определение]]}
+        """
+        state = {'indexes': [], 'foreign_keys': []}
+        with self.pg_conn.cursor() as curs:
+            for table in self.tables:
+                curs.execute(INDEXES_QUERY, (table,))
+                state['indexes'].extend([table, name, definition] for name, definition in curs.fetchall())
+                curs.execute(FOREIGN_KEYS_QUERY, (table,))
+                state['foreign_keys'].extend([table, name, definition] for name, definition in curs.fetchall())
+        return state
+
+    def drop(self) -> None:
+        """
+        Сохраняет определения и удаляет вторичные индексы и внешние ключи.
+
+        Если файл состояния уже есть, прерванная первичная загрузка продолжается
+        и схема не меняется.
+
+        Raises:
+            RuntimeError: целевые таблицы не пусты
+        """
+        if os.path.exists(self.state_path):
+            logger.info('Resuming initial load, schema state is kept in %s', self.state_path)
+            return
+        with self.pg_conn.cursor() as curs:
+            for table in self.tables:
+                curs.execute('SELECT EXISTS (SELECT 1 FROM {table});'.format(table=table))
+                if curs.fetchone()[0]:
+                    raise RuntimeError('Initial load requires empty tables, {table} has rows'.format(table=table))
+        state = self.capture()
+        with open(self.state_path, 'w') as state_file:
+            json.dump(state, state_file, indent=2)
+        with self.pg_conn.cursor() as curs:
+            for table, name, _ in state['foreign_keys']:
+                curs.execute('ALTER TABLE {table} DROP CONSTRAINT {name};'.format(table=table, name=name))
+            for _, name, _ in state['indexes']:
+                curs.execute('DROP INDEX {name};'.format(name=name))
+        self.pg_conn.commit()
+        logger.info('Dropped %s indexes and %s foreign keys', len(state['indexes']), len(state['foreign_keys']))
+
+    def restore(self, connect: Optional[Callable[[], _connection]] = None,
+                workers: int = DEFAULT_REBUILD_WORKERS) -> None:
+        """
+        Пересоздаёт индексы и внешние ключи из сохранённого состояния.
+
+        Args:
+            connect: функция открытия дополнительных соединений; без неё всё выполняется на pg_conn
+            workers: количество параллельных соединений
+
+        Raises:
+            RuntimeError: восстановленная схема отличается от исходной
+        """
+        with open(self.state_path) as state_file:
+            state = json.load(state_file)
+        existing = self.capture()
+        # Повторный запуск после сбоя пропускает то, что уже восстановлено.
+        existing_indexes = {name for _, name, _ in existing['indexes']}
+        existing_foreign_keys = {name for _, name, _ in existing['foreign_keys']}
+        indexes = [item for item in state['indexes'] if item[1] not in existing_indexes]
+        foreign_keys = [item for item in state['foreign_keys'] if item[1] not in existing_foreign_keys]
+
+        statements = [definition + ';' for _, _, definition in indexes]
+        self._execute_all(statements, connect, workers)
+        with self.pg_conn.cursor() as curs:
+            for table, name, definition in foreign_keys:
+                curs.execute('ALTER TABLE {table} ADD CONSTRAINT {name} {definition} NOT VALID;'.format(
+                    table=table, name=name, definition=definition,
+                ))
+        self.pg_conn.commit()
+        # Проверка уже проверенного ключа ничего не делает, поэтому проверяются все ключи из состояния.
+        statements = [
+            'ALTER TABLE {table} VALIDATE CONSTRAINT {name};'.format(table=table, name=name)
+            for table, name, _ in state['foreign_keys']
+        ]
+        self._execute_all(statements, connect, workers)
+
+        if self.capture() != state:
+            raise RuntimeError('Restored indexes and constraints differ from {path}'.format(path=self.state_path))
+        os.remove(self.state_path)
+        logger.info('Restored %s indexes and %s foreign keys', len(indexes), len(foreign_keys))
+
+    def _execute_all(self, statements: list, connect: Optional[Callable[[], _connection]], workers: int) -> None:
+        if not statements:
+            return
+        if connect is None or workers <= 1:
+            with self.pg_conn.cursor() as curs:
+                for statement in statements:
+                    curs.execute(statement)
+            self.pg_conn.commit()
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda statement: _execute_on_new_connection(connect, statement), statements))
+
+
+def _execute_on_new_connection(connect: Callable[[], _connection], statement: str) -> None:
+    with closing(connect()) as pg_conn:
+        pg_conn.autocommit = True
+        with pg_conn.cursor() as curs:
+            curs.execute(statement)
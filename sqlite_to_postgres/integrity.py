@@ -0,0 +1,260 @@
+"""Проверка ссылок таблиц связей на родительские строки до записи в Postgres."""
+
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+from dataclasses import replace
+from typing import Iterator, Optional, Union
+
+from sqlite_to_postgres.data_types import Batch
+from sqlite_to_postgres.metrics import STAGE_VALIDATE, PipelineMetrics
+from sqlite_to_postgres.tables import TABLES_BY_NAME
+
+logger = logging.getLogger(__name__)
+
+REJECT_PATH = 'orphaned_rows.jsonl'
+KEY_SIZE = 16
+# Ключи раскладываются по корзинам по первым двум байтам: у UUID4 они распределены равномерно.
+BUCKET_BITS = 16
+BUCKET_SHIFT = 64 - BUCKET_BITS
+FETCH_SIZE = 10000
+
+
+def uuid_bytes(value: Union[str, uuid.UUID]) -> bytes:
+    """
+    Переводит UUID в 16 байт.
+
+    Args:
+        value: UUID или его строковое представление
+
+    Returns:
+        bytes: 16 байт UUID
+
+    Raises:
+        ValueError: строка не является UUID
+    """
+    if value.__class__ is uuid.UUID:
+        return value.bytes
+    raw = bytes.fromhex(value.replace('-', ''))
+    if len(raw) != KEY_SIZE:
+        raise ValueError('Invalid UUID: {value}'.format(value=value))
+    return raw
+
+
+def split_key(raw: bytes) -> tuple:
+    """
+    Делит 16 байт UUID на старшие и младшие 8 байт.
+
+    Args:
+        raw: 16 байт UUID
+
+    Returns:
+        tuple: два беззнаковых 64-битных числа в порядке байтов UUID
+    """
+    return int.from_bytes(raw[:8], 'big'), int.from_bytes(raw[8:], 'big')
+
+
+class UuidKeySet(object):
+    """
+    Множество UUID по 16 байт на ключ.
+
+    Старшие и младшие 8 байт ключей хранятся в двух массивах array('Q') своей
+    корзины без объектов Python на каждый ключ, поэтому десятки миллионов
+    ключей занимают сотни мегабайт, а не гигабайты. Корзина сортируется при
+    первой проверке после добавления ключей, и поиск - bisect по старшим
+    половинам, то есть O(log размера корзины) на стороне C.
+    """
+
+    def __init__(self) -> None:
+        """Init метод."""
+        self._buckets: list = [None] * (1 << BUCKET_BITS)
+        self._unsorted: set = set()
+        self._size = 0
+
+    def add(self, value: Union[str, uuid.UUID]) -> None:
+        """
+        Добавляет ключ. Повторы не проверяются: первичные ключи уникальны.
+
+        Args:
+            value: UUID или его строковое представление
+        """
+        high, low = split_key(uuid_bytes(value))
+        index = high >> BUCKET_SHIFT
+        bucket = self._buckets[index]
+        if bucket is None:
+            bucket = self._buckets[index] = (array('Q'), array('Q'))
+        bucket[0].append(high)
+        bucket[1].append(low)
+        self._unsorted.add(index)
+        self._size += 1
+
+    def __contains__(self, value: Union[str, uuid.UUID]) -> bool:
+        """
+        Проверяет наличие ключа.
+
+        Args:
+            value: UUID или его строковое представление
+
+        Returns:
+            bool: ключ есть в множестве; для некорректного UUID - False
+        """
+        try:
+            high, low = split_key(uuid_bytes(value))
+        except (ValueError, AttributeError):
+            return False
+        index = high >> BUCKET_SHIFT
+        if self._buckets[index] is None:
+            return False
+        if index in self._unsorted:
+            self._sort(index)
+        highs, lows = self._buckets[index]
+        position = bisect_left(highs, high)
+        # Старшие половины разных ключей почти никогда не совпадают, но это не гарантировано.
+        while position < len(highs) and highs[position] == high:
+            if lows[position] == low:
+                return True
+            position += 1
+        return False
+
+    def __len__(self) -> int:
+        """
+        Количество ключей.
+
+        Returns:
+            int: количество ключей
+        """
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Объём, занятый ключами.
+
+        Returns:
+            int: байт без учёта служебных структур корзин
+        """
+        return self._size * KEY_SIZE
+
+    def _sort(self, index: int) -> None:
+        highs, lows = self._buckets[index]
+        keys = sorted(zip(highs, lows))
+        self._buckets[index] = (array('Q', [high for high, _ in keys]), array('Q', [low for _, low in keys]))
+        self._unsorted.discard(index)
+
+
+class ReferentialIntegrityFilter(object):
+    """
+    Отсеивает строки таблиц связей, ссылающиеся на отсутствующие родительские строки.
+
+    Множества id родительских таблиц строятся по SQLite при первой проверке
+    зависимой таблицы, поэтому фильтр работает и при продолжении переноса,
+    когда родительские таблицы в этом запуске не читались. Внешний ключ на
+    таблицу X называется X_id. Отсеянные строки пишутся в reject_path.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        reject_path: str = REJECT_PATH,
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> None:
+        """
+        Init метод.
+
+        Args:
+            connection: соединение с SQLite
+            reject_path: файл отчёта об отсеянных строках
+            metrics: сборщик метрик этапа validate
+        """
+        self.connection = connection
+        self.reject_path = reject_path
+        self.metrics = metrics
+        self.rejected = 0
+        self._keys: dict = {}
+
+    def keys(self, table: str) -> UuidKeySet:
+        """
+        Возвращает множество id таблицы, читая его из SQLite при первом обращении.
+
+        Args:
+            table: имя таблицы
+
+        Returns:
+            UuidKeySet: id всех строк таблицы
+        """
+        key_set = self._keys.get(table)
+        if key_set is None:
+            started = time.perf_counter()
+            key_set = self._keys[table] = UuidKeySet()
+            curs = self.connection.cursor()
+            curs.row_factory = None
+            try:
+                curs.execute('SELECT id FROM {table};'.format(table=table))
+                while data := curs.fetchmany(FETCH_SIZE):
+                    for (row_id,) in data:
+                        key_set.add(row_id)
+            finally:
+                curs.close()
+            logger.info(
+                'Loaded %s %s ids (%s bytes) in %.1fs',
+                len(key_set), table, key_set.nbytes, time.perf_counter() - started,
+            )
+        return key_set
+
+    def filter(self, table: str, batch: Batch) -> Batch:
+        """
+        Убирает из пачки строки с висячими ссылками.
+
+        Args:
+            table: имя таблицы из TABLES
+            batch: пачка кортежей в порядке колонок Postgres
+
+        Returns:
+            Batch: пачка без отсеянных строк с той же позицией выгрузки
+        """
+        parents = TABLES_BY_NAME[table].depends_on
+        if not parents:
+            return batch
+        started = time.perf_counter()
+        columns = TABLES_BY_NAME[table].columns
+        checks = [(columns.index('{parent}_id'.format(parent=parent)), self.keys(parent)) for parent in parents]
+        rows = []
+        for row in batch.rows:
+            for index, key_set in checks:
+                if row[index] not in key_set:
+                    break
+            else:
+                rows.append(row)
+                continue
+            self._reject(table, row, {
+                columns[index]: row[index] for index, key_set in checks if row[index] not in key_set
+            })
+        if self.metrics:
+            self.metrics.observe(table, STAGE_VALIDATE, len(batch.rows), time.perf_counter() - started)
+        return replace(batch, rows=rows) if len(rows) != len(batch.rows) else batch
+
+    def filter_batches(self, table: str, batches: Iterator[Batch]) -> Iterator[Batch]:
+        """
+        Применяет filter к каждой пачке итератора.
+
+        Args:
+            table: имя таблицы из TABLES
+            batches: итератор пачек
+
+        Yields:
+            Batch: проверенные пачки
+        """
+        for batch in batches:
+            yield self.filter(table, batch)
+
+    def _reject(self, table: str, row: tuple, missing: dict) -> None:
+        self.rejected += 1
+        logger.warning('Orphaned row %s in %s: %s', row[0], table, missing)
+        with open(self.reject_path, 'a') as reject_file:
+            reject_file.write(json.dumps({'table': table, 'row': row, 'missing': missing}, default=str) + '\n')
+        if self.metrics:
+            self.metrics.record_error(table, STAGE_VALIDATE)
@@ -1,36 +1,135 @@
 """Перенос данных из SQLite в Postgres."""
 
+import os
 import sqlite3
+from typing import Callable, Optional
 
 import psycopg2
 from psycopg2.extensions import connection as _connection
 from psycopg2.extras import DictCursor
 
-from postgres_saver import PostgresSaver
+from commit_policy import BatchCommitter, CommitPolicy
+from converters import TypeConverter
+from initial_load import DeferredSchema
+from integrity import ReferentialIntegrityFilter
+from metrics import PipelineMetrics
+from pipeline import PREFETCH_DEPTH, prefetch
+from postgres_saver import register_adapters
 from sqlite_extractor import SQLiteExtractor
+from summary import refresh_deferred_summaries
+from tables import TABLES
 
+SQLITE_PATH = 'db.sqlite'
+METRICS_JSON_PATH = 'migration_metrics.json'
+METRICS_PROMETHEUS_PATH = 'migration_metrics.prom'
+DSL = {'dbname': 'movies_database', 'user': 'app', 'password': '123qwe', 'host': '127.0.0.1', 'port': 5432}
 
-def load_from_sqlite(connection: sqlite3.Connection, pg_conn: _connection) -> None:
+
+def load_table(
+    sqlite_extractor: SQLiteExtractor,
+    committer: BatchCommitter,
+    table_name: str,
+    prefetch_depth: int = PREFETCH_DEPTH,
+    integrity: Optional[ReferentialIntegrityFilter] = None,
+) -> None:
+    """
+    Переносит одну таблицу пачками.
+
+    В памяти одновременно находится не больше commit_every незафиксированных пачек,
+    а запись в Postgres начинается сразу после чтения первой. Если включены
+    контрольные точки, выгрузка продолжается с последней зафиксированной пачки.
+    При синхронизации выгружаются только строки, изменённые после прошлого запуска.
+    С prefetch_depth чтение идёт в отдельном потоке параллельно с записью.
+    Строки связей с висячими ссылками отсеиваются фильтром integrity до отправки в Postgres.
+
+    Args:
+        sqlite_extractor: объект чтения из SQLite
+        committer: объект записи пачек в Postgres с политикой фиксации
+        table_name: имя таблицы из TABLES
+        prefetch_depth: сколько прочитанных пачек может ждать записи; 0 - читать и писать по очереди
+        integrity: фильтр ссылок на родительские таблицы
+    """
+    if committer.sync:
+        batches = sqlite_extractor.iter_changes(table_name, committer.high_water_mark(table_name))
+    else:
+        batches = sqlite_extractor.iter_table(table_name, committer.checkpoint(table_name))
+    if integrity:
+        batches = integrity.filter_batches(table_name, batches)
+    if prefetch_depth:
+        batches = prefetch(batches, table_name, prefetch_depth, committer.metrics)
+    for batch in batches:
+        committer.write(table_name, batch)
+    committer.commit()
+
+
+def load_from_sqlite(
+    connection: sqlite3.Connection,
+    pg_conn: _connection,
+    resume: bool = False,
+    metrics: Optional[PipelineMetrics] = None,
+    convert_types: bool = False,
+    policy: CommitPolicy = CommitPolicy(),
+    reconnect: Optional[Callable[[], _connection]] = None,
+    initial_load: bool = False,
+    sync: bool = False,
+    prefetch_depth: int = PREFETCH_DEPTH,
+    check_integrity: bool = True,
+) -> None:
     """
     Основной метод загрузки данных из SQLite в Postgres.
 
     Args:
         connection: соединение с SQLite
         pg_conn: соединение с Postgres
+        resume: продолжить перенос с сохранённых контрольных точек
+        metrics: сборщик метрик этапов переноса
+        convert_types: приводить значения к UUID и datetime при выгрузке
+        policy: политика фиксации транзакций и повторов
+        reconnect: функция открытия нового соединения с Postgres после обрыва,
+            при первичной загрузке через неё же открываются соединения для пересоздания индексов
+        initial_load: первичная загрузка в пустые таблицы - вторичные индексы и внешние ключи
+            снимаются на время переноса и пересоздаются после него
+        sync: перенести только изменения после прошлой синхронизации, обновляя строки более новыми версиями
+        prefetch_depth: размер очереди между потоками чтения и записи; 0 - без отдельного потока,
+            иначе (и по умолчанию) connection должно быть открыто с check_same_thread=False
+        check_integrity: отсеивать строки связей с висячими ссылками в файл отчёта до записи в Postgres
     """
-    postgres_saver = PostgresSaver(pg_conn)
-    sqlite_extractor = SQLiteExtractor(connection)
+    deferred_schema = DeferredSchema(pg_conn, [table.name for table in TABLES]) if initial_load else None
+    if deferred_schema:
+        deferred_schema.drop()
+    committer = BatchCommitter(pg_conn, policy, metrics=metrics, resume=resume, reconnect=reconnect, sync=sync)
+    type_converter = None
+    if convert_types:
+        type_converter = TypeConverter()
+        register_adapters()
+    sqlite_extractor = SQLiteExtractor(connection, metrics=metrics, type_converter=type_converter)
+
+    integrity = ReferentialIntegrityFilter(connection, metrics=metrics) if check_integrity else None
+
+    for table in TABLES:
+        load_table(sqlite_extractor, committer, table.name, prefetch_depth, integrity)
+    if deferred_schema:
+        deferred_schema.pg_conn = committer.pg_conn
+        deferred_schema.restore(reconnect)
+    refresh_deferred_summaries(committer.pg_conn)
+
 
-    postgres_saver.save_movies(sqlite_extractor.get_movies())
-    postgres_saver.save_genres(sqlite_extractor.get_genres())
-    postgres_saver.save_persons(sqlite_extractor.get_persons())
-    postgres_saver.save_genres_film_works(sqlite_extractor.get_genres_film_works())
-    postgres_saver.save_persons_film_works(sqlite_extractor.get_persons_film_works())
+def connect_postgres() -> _connection:
+    """
+    Открывает соединение с Postgres по настройкам DSL.
+
+    Returns:
+        _connection: соединение
+    """
+    return psycopg2.connect(**DSL, cursor_factory=DictCursor)
 
 
-    # sqlite_data = sqlite_extractor.extract_movies()
-    # postgres_saver.save_all_data(sqlite_data)
 if __name__ == '__main__':
-    dsl = {'dbname': 'movies_database', 'user': 'app', 'password': '123qwe', 'host': '127.0.0.1', 'port': 5432}
-    with sqlite3.connect('db.sqlite') as sqlite_conn, psycopg2.connect(**dsl, cursor_factory=DictCursor) as pg_conn:
-        load_from_sqlite(sqlite_conn, pg_conn)
+    with sqlite3.connect(SQLITE_PATH, check_same_thread=False) as sqlite_conn, connect_postgres() as pg_conn:
+        pipeline_metrics = PipelineMetrics()
+        load_from_sqlite(
+            sqlite_conn, pg_conn, resume=True, metrics=pipeline_metrics, reconnect=connect_postgres,
+            sync=os.environ.get('SYNC_CHANGES') == '1',
+        )
+    pipeline_metrics.write_json(METRICS_JSON_PATH)
+    pipeline_metrics.write_prometheus(METRICS_PROMETHEUS_PATH)
@@ -0,0 +1,247 @@
+"""Метрики этапов переноса данных: скорость, задержки пачек и расход памяти."""
+
+import bisect
+import json
+import resource
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+
+STAGE_EXTRACT = 'extract'
+STAGE_TRANSFORM = 'transform'
+STAGE_VALIDATE = 'validate'
+STAGE_LOAD = 'load'
+STAGE_QUEUE = 'queue'
+
+# Верхние границы корзин гистограммы задержки пачки в секундах.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass
+class StageMetrics:
+    """Накопленные метрики одного этапа переноса одной таблицы."""
+
+    rows: int = 0
+    batches: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+    wait_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    tracemalloc_peak_bytes: int = 0
+    stall_seconds: float = 0.0
+    queue_depth_total: int = 0
+    peak_queue_depth: int = 0
+    latency_buckets: list = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    @property
+    def rows_per_second(self) -> float:
+        """
+        Скорость этапа без учёта времени ожидания.
+
+        Returns:
+            float: строк в секунду
+        """
+        return self.rows / self.busy_seconds if self.busy_seconds else 0.0
+
+    @property
+    def mean_queue_depth(self) -> float:
+        """
+        Средняя глубина очереди в момент выдачи пачки.
+
+        Returns:
+            float: пачек в очереди
+        """
+        return self.queue_depth_total / self.batches if self.batches else 0.0
+
+
+class PipelineMetrics(object):
+    """
+    Собирает метрики этапов extract, transform и load для каждой таблицы.
+
+    Запись одной пачки стоит пары сравнений и одного системного вызова getrusage,
+    поэтому метрики можно не выключать в рабочих запусках. Отслеживание
+    выделений через tracemalloc заметно замедляет перенос и включается отдельно.
+    """
+
+    def __init__(self, trace_memory: bool = False) -> None:
+        """
+        Init метод.
+
+        Args:
+            trace_memory: отслеживать пик выделенной памяти через tracemalloc
+        """
+        self.trace_memory = trace_memory
+        self.stages: dict = {}
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, table: str, stage: str) -> StageMetrics:
+        """
+        Возвращает метрики этапа, создавая их при первом обращении.
+
+        Args:
+            table: имя таблицы
+            stage: имя этапа
+
+        Returns:
+            StageMetrics: метрики этапа
+        """
+        key = (table, stage)
+        metrics = self.stages.get(key)
+        if metrics is None:
+            metrics = self.stages.setdefault(key, StageMetrics())
+        return metrics
+
+    def observe(self, table: str, stage: str, rows: int, seconds: float, wait_seconds: float = 0.0) -> None:
+        """
+        Учитывает одну обработанную пачку.
+
+        Args:
+            table: имя таблицы
+            stage: имя этапа
+            rows: количество строк в пачке
+            seconds: время обработки пачки
+            wait_seconds: время, которое этап ждал эту пачку
+        """
+        metrics = self.stage(table, stage)
+        metrics.rows += rows
+        metrics.batches += 1
+        metrics.busy_seconds += seconds
+        metrics.wait_seconds += wait_seconds
+        metrics.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        # ru_maxrss в Linux измеряется в килобайтах.
+        metrics.peak_rss_bytes = max(metrics.peak_rss_bytes, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+        if self.trace_memory:
+            metrics.tracemalloc_peak_bytes = max(metrics.tracemalloc_peak_bytes, tracemalloc.get_traced_memory()[1])
+
+    def observe_queue(self, table: str, rows: int, depth: int, stall_seconds: float, wait_seconds: float) -> None:
+        """
+        Учитывает пачку, переданную через очередь между чтением и записью.
+
+        Args:
+            table: имя таблицы
+            rows: количество строк в пачке
+            depth: количество пачек, оставшихся в очереди после выдачи этой
+            stall_seconds: время, которое чтение ждало места в заполненной очереди
+            wait_seconds: время, которое запись ждала пачку в пустой очереди
+        """
+        metrics = self.stage(table, STAGE_QUEUE)
+        metrics.rows += rows
+        metrics.batches += 1
+        metrics.stall_seconds += stall_seconds
+        metrics.wait_seconds += wait_seconds
+        metrics.queue_depth_total += depth
+        metrics.peak_queue_depth = max(metrics.peak_queue_depth, depth)
+
+    def record_error(self, table: str, stage: str) -> None:
+        """
+        Учитывает ошибку этапа.
+
+        Args:
+            table: имя таблицы
+            stage: имя этапа
+        """
+        self.stage(table, stage).errors += 1
+
+    def merge(self, other: 'PipelineMetrics') -> None:
+        """
+        Добавляет метрики, собранные в другом процессе.
+
+        Args:
+            other: метрики другого процесса
+        """
+        for (table, stage), theirs in other.stages.items():
+            ours = self.stage(table, stage)
+            ours.rows += theirs.rows
+            ours.batches += theirs.batches
+            ours.errors += theirs.errors
+            ours.busy_seconds += theirs.busy_seconds
+            ours.wait_seconds += theirs.wait_seconds
+            ours.stall_seconds += theirs.stall_seconds
+            ours.queue_depth_total += theirs.queue_depth_total
+            ours.peak_queue_depth = max(ours.peak_queue_depth, theirs.peak_queue_depth)
+            ours.peak_rss_bytes = max(ours.peak_rss_bytes, theirs.peak_rss_bytes)
+            ours.tracemalloc_peak_bytes = max(ours.tracemalloc_peak_bytes, theirs.tracemalloc_peak_bytes)
+            ours.latency_buckets = [mine + other_count for mine, other_count in zip(ours.latency_buckets,
+                                                                                     theirs.latency_buckets)]
+
+    def summary(self) -> dict:
+        """
+        Собирает метрики в словарь, пригодный для сериализации в JSON.
+
+        Returns:
+            dict: {имя таблицы: {имя этапа: метрики}}
+        """
+        result: dict = {}
+        for (table, stage), metrics in sorted(self.stages.items()):
+            stage_summary = asdict(metrics)
+            stage_summary['rows_per_second'] = metrics.rows_per_second
+            stage_summary['mean_queue_depth'] = metrics.mean_queue_depth
+            stage_summary['latency_buckets'] = dict(zip(
+                [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], metrics.latency_buckets,
+            ))
+            result.setdefault(table, {})[stage] = stage_summary
+        return result
+
+    def write_json(self, path: str) -> None:
+        """
+        Сохраняет сводку метрик в JSON файл.
+
+        Args:
+            path: путь к файлу
+        """
+        with open(path, 'w') as metrics_file:
+            json.dump({'generated_at': time.time(), 'tables': self.summary()}, metrics_file, indent=2)
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Сохраняет метрики в текстовом формате Prometheus.
+
+        Args:
+            path: путь к файлу
+        """
+        counters = (
+            ('migration_rows_total', 'counter', 'Rows processed by the stage.', 'rows'),
+            ('migration_batches_total', 'counter', 'Batches processed by the stage.', 'batches'),
+            ('migration_errors_total', 'counter', 'Errors raised in the stage.', 'errors'),
+            ('migration_busy_seconds_total', 'counter', 'Time spent processing batches.', 'busy_seconds'),
+            ('migration_wait_seconds_total', 'counter', 'Time spent waiting for input.', 'wait_seconds'),
+            ('migration_stall_seconds_total', 'counter', 'Time the reader was blocked by a full queue.',
+             'stall_seconds'),
+            ('migration_queue_depth_mean', 'gauge', 'Mean batches queued between read and write.',
+             'mean_queue_depth'),
+            ('migration_queue_depth_peak', 'gauge', 'Peak batches queued between read and write.',
+             'peak_queue_depth'),
+            ('migration_rows_per_second', 'gauge', 'Stage throughput excluding waits.', 'rows_per_second'),
+            ('migration_peak_rss_bytes', 'gauge', 'Process RSS high-water mark.', 'peak_rss_bytes'),
+            ('migration_tracemalloc_peak_bytes', 'gauge', 'tracemalloc peak.', 'tracemalloc_peak_bytes'),
+        )
+        lines = []
+        for name, metric_type, description, attribute in counters:
+            lines.append('# HELP {name} {description}'.format(name=name, description=description))
+            lines.append('# TYPE {name} {type}'.format(name=name, type=metric_type))
+            for (table, stage), metrics in sorted(self.stages.items()):
+                lines.append('{name}{{{labels}}} {value}'.format(
+                    name=name, labels=_labels(table, stage), value=getattr(metrics, attribute),
+                ))
+        lines.append('# HELP migration_batch_seconds Batch processing latency.')
+        lines.append('# TYPE migration_batch_seconds histogram')
+        for (table, stage), metrics in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (None,), metrics.latency_buckets):
+                cumulative += count
+                lines.append('migration_batch_seconds_bucket{{{labels},le="{le}"}} {value}'.format(
+                    labels=_labels(table, stage), le='+Inf' if bound is None else bound, value=cumulative,
+                ))
+            lines.append('migration_batch_seconds_sum{{{labels}}} {value}'.format(
+                labels=_labels(table, stage), value=metrics.busy_seconds,
+            ))
+            lines.append('migration_batch_seconds_count{{{labels}}} {value}'.format(
+                labels=_labels(table, stage), value=metrics.batches,
+            ))
+        with open(path, 'w') as metrics_file:
+            metrics_file.write('\n'.join(lines) + '\n')
+
+
+def _labels(table: str, stage: str) -> str:
+    return 'table="{table}",stage="{stage}"'.format(table=table, stage=stage)
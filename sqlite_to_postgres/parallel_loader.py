@@ -0,0 +1,162 @@
+"""Параллельный перенос независимых таблиц из SQLite в Postgres."""
+
+import os
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import closing
+from functools import partial
+
+import psycopg2
+
+from checkpoint import PostgresCheckpointStore, PostgresHighWaterMarkStore
+from commit_policy import BatchCommitter, CommitPolicy
+from initial_load import DeferredSchema
+from integrity import ReferentialIntegrityFilter
+from load_data import (DSL, METRICS_JSON_PATH, METRICS_PROMETHEUS_PATH,
+                       SQLITE_PATH, load_table)
+from metrics import PipelineMetrics
+from pipeline import PREFETCH_DEPTH
+from postgres_saver import LOAD_METHOD_COPY
+from sqlite_extractor import SQLiteExtractor
+from summary import refresh_deferred_summaries
+from tables import TABLES
+
+DEFAULT_WORKERS = 3
+
+
+def load_table_in_worker(
+    table_name: str,
+    sqlite_path: str,
+    dsl: dict,
+    load_method: str,
+    resume: bool,
+    policy: CommitPolicy,
+    sync: bool = False,
+    prefetch_depth: int = PREFETCH_DEPTH,
+    check_integrity: bool = True,
+) -> tuple:
+    """
+    Переносит одну таблицу в отдельном процессе.
+
+    Каждый процесс открывает собственные соединения с SQLite и Postgres
+    и фиксирует транзакции по политике policy, а после загрузки всей таблицы - обязательно.
+
+    Args:
+        table_name: имя таблицы
+        sqlite_path: путь к файлу SQLite
+        dsl: параметры подключения к Postgres
+        load_method: способ записи пачек в Postgres
+        resume: продолжить перенос с сохранённой контрольной точки
+        policy: политика фиксации транзакций и повторов
+        sync: перенести только изменения после прошлой синхронизации
+        prefetch_depth: размер очереди между потоками чтения и записи; 0 - без отдельного потока
+        check_integrity: отсеивать строки связей с висячими ссылками до записи в Postgres
+
+    Returns:
+        tuple: имя загруженной таблицы и метрики её переноса
+    """
+    metrics = PipelineMetrics()
+    connect = partial(psycopg2.connect, **dsl)
+    with closing(sqlite3.connect(sqlite_path, check_same_thread=False)) as sqlite_conn:
+        committer = BatchCommitter(connect(), policy, load_method, metrics, resume, reconnect=connect, sync=sync)
+        try:
+            integrity = ReferentialIntegrityFilter(sqlite_conn, metrics=metrics) if check_integrity else None
+            load_table(
+                SQLiteExtractor(sqlite_conn, metrics=metrics), committer, table_name, prefetch_depth, integrity,
+            )
+        finally:
+            committer.pg_conn.close()
+    return table_name, metrics
+
+
+def load_parallel(
+    sqlite_path: str,
+    dsl: dict,
+    workers: int = DEFAULT_WORKERS,
+    load_method: str = LOAD_METHOD_COPY,
+    resume: bool = False,
+    policy: CommitPolicy = CommitPolicy(),
+    initial_load: bool = False,
+    sync: bool = False,
+    prefetch_depth: int = PREFETCH_DEPTH,
+    check_integrity: bool = True,
+) -> PipelineMetrics:
+    """
+    Переносит все таблицы, запуская каждую сразу после загрузки её родительских таблиц.
+
+    Процессы откладывают пересчёт сводок кинопроизведений, и после загрузки
+    сводки затронутых кинопроизведений пересчитываются одним проходом.
+
+    Фильтр ссылок строится в каждом процессе заново, поэтому id film_work читаются
+    из SQLite дважды - для genre_film_work и person_film_work. Каждое чтение - это
+    один просмотр первичного ключа, а множество занимает 16 байт на id в памяти
+    каждого из двух процессов.
+
+    Args:
+        sqlite_path: путь к файлу SQLite
+        dsl: параметры подключения к Postgres
+        workers: количество процессов
+        load_method: способ записи пачек в Postgres
+        resume: продолжить перенос с сохранённых контрольных точек
+        policy: политика фиксации транзакций и повторов
+        initial_load: снять вторичные индексы и внешние ключи на время переноса и пересоздать их
+            на workers соединениях после него
+        sync: перенести только изменения после прошлой синхронизации
+        prefetch_depth: размер очереди между потоками чтения и записи в каждом процессе; 0 - без отдельного потока
+        check_integrity: отсеивать строки связей с висячими ссылками до записи в Postgres
+
+    Returns:
+        PipelineMetrics: метрики, собранные всеми процессами
+
+    Raises:
+        RuntimeError: зависимости таблиц не могут быть удовлетворены
+    """
+    connect = partial(psycopg2.connect, **dsl)
+    table_names = [table.name for table in TABLES]
+    with closing(connect()) as pg_conn:
+        # Таблицы контрольных точек и отметок создаются заранее, чтобы процессы не создавали их наперегонки.
+        if resume:
+            PostgresCheckpointStore(pg_conn)
+        if sync:
+            PostgresHighWaterMarkStore(pg_conn)
+        if initial_load:
+            DeferredSchema(pg_conn, table_names).drop()
+    metrics = PipelineMetrics()
+    pending = {table.name: table.depends_on for table in TABLES}
+    loaded = set()
+    running: dict[Future, str] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            ready = [table for table, parents in pending.items() if loaded.issuperset(parents)]
+            for table_name in ready:
+                del pending[table_name]
+                future = executor.submit(
+                    load_table_in_worker, table_name, sqlite_path, dsl, load_method, resume, policy, sync,
+                    prefetch_depth, check_integrity,
+                )
+                running[future] = table_name
+            if not running:
+                raise RuntimeError('Unresolvable table dependencies: {tables}'.format(tables=', '.join(pending)))
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                del running[future]
+                table_name, table_metrics = future.result()
+                loaded.add(table_name)
+                metrics.merge(table_metrics)
+    with closing(connect()) as pg_conn:
+        if initial_load:
+            DeferredSchema(pg_conn, table_names).restore(connect, workers)
+        refresh_deferred_summaries(pg_conn)
+    return metrics
+
+
+if __name__ == '__main__':
+    pipeline_metrics = load_parallel(
+        SQLITE_PATH,
+        DSL,
+        workers=int(os.environ.get('LOAD_WORKERS', DEFAULT_WORKERS)),
+        resume=True,
+        sync=os.environ.get('SYNC_CHANGES') == '1',
+    )
+    pipeline_metrics.write_json(METRICS_JSON_PATH)
+    pipeline_metrics.write_prometheus(METRICS_PROMETHEUS_PATH)
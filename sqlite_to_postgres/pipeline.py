@@ -0,0 +1,100 @@
+"""Конвейерное выполнение: чтение из SQLite и запись в Postgres в разных потоках."""
+
+import queue
+import threading
+import time
+from typing import Iterator, Optional
+
+from sqlite_to_postgres.data_types import Batch
+from sqlite_to_postgres.metrics import PipelineMetrics
+
+PREFETCH_DEPTH = 2
+# Как часто поток чтения проверяет, не остановлена ли запись, пока очередь заполнена.
+PUT_TIMEOUT = 0.1
+
+
+class _Failure(object):
+    """Исключение потока чтения, передаваемое через очередь в поток записи."""
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+_DONE = object()
+
+
+def prefetch(
+    batches: Iterator[Batch],
+    table: str,
+    depth: int = PREFETCH_DEPTH,
+    metrics: Optional[PipelineMetrics] = None,
+) -> Iterator[Batch]:
+    """
+    Читает пачки в отдельном потоке, опережая потребителя не больше чем на depth пачек.
+
+    Пока запись в Postgres ждёт ответа сервера, поток чтения готовит следующие пачки.
+    Когда запись отстаёт, очередь заполняется и чтение останавливается. sqlite3
+    и psycopg2 отпускают GIL на время обращения к БД, поэтому потоки действительно
+    работают параллельно. Соединение SQLite должно быть открыто с check_same_thread=False.
+
+    Ошибка чтения поднимается в потоке потребителя; если потребитель прекращает
+    итерацию, поток чтения завершается, не дочитывая таблицу.
+
+    Args:
+        batches: итератор пачек, например SQLiteExtractor.iter_table
+        table: имя таблицы для метрик
+        depth: размер очереди в пачках
+        metrics: сборщик метрик; глубина очереди и простои пишутся в этап queue
+
+    Yields:
+        Batch: пачки в исходном порядке
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stopping = threading.Event()
+
+    def put(item: object) -> float:
+        started = time.perf_counter()
+        while not stopping.is_set():
+            try:
+                buffer.put(item, timeout=PUT_TIMEOUT)
+            except queue.Full:
+                continue
+            break
+        return time.perf_counter() - started
+
+    def read() -> None:
+        # Простой чтения известен только после put, поэтому он передаётся со следующей пачкой.
+        stall = 0.0
+        try:
+            for batch in batches:
+                stall = put((batch, stall))
+                if stopping.is_set():
+                    return
+        except BaseException as error:
+            put(_Failure(error))
+            return
+        finally:
+            # Генератор закрывается в потоке, который его читал, вместе с курсором SQLite.
+            close = getattr(batches, 'close', None)
+            if close:
+                close()
+        put(_DONE)
+
+    reader = threading.Thread(target=read, name='prefetch-{table}'.format(table=table), daemon=True)
+    reader.start()
+    try:
+        while True:
+            started = time.perf_counter()
+            item = buffer.get()
+            waited = time.perf_counter() - started
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            batch, stall = item
+            if metrics:
+                metrics.observe_queue(table, len(batch.rows), buffer.qsize(), stall, waited)
+            yield batch
+    finally:
+        stopping.set()
+        reader.join()
@@ -1,77 +1,289 @@
 """Импорт данных из sqlite в postgresql."""
 
+import io
+import time
+import uuid
+from functools import lru_cache, partial
+from operator import attrgetter
+from typing import BinaryIO, Callable, Optional, TextIO, Union
+
+from psycopg2.extensions import AsIs, register_adapter
 from psycopg2.extensions import connection as _connection
 from psycopg2.extras import execute_values
 
+from sqlite_to_postgres.converters import UUID_CACHE_SIZE
+from sqlite_to_postgres.metrics import STAGE_LOAD, PipelineMetrics
+from sqlite_to_postgres.tables import TABLES, TABLES_BY_NAME, Table
+
+LOAD_METHOD_VALUES = 'values'
+LOAD_METHOD_COPY = 'copy'
+COPY_FORMAT_TEXT = "FORMAT text, DELIMITER '{separator}'"
+COPY_FORMAT_CSV = 'FORMAT csv'
+FORMAT_CACHE_SIZE = 2 ** 16
+ON_CONFLICT_DO_NOTHING = 'ON CONFLICT DO NOTHING'
+ON_CONFLICT_UPSERT = 'ON CONFLICT (id) DO UPDATE SET {assignments} WHERE {condition}'
+NEWER_VERSION_CONDITION = '{table}.{version} IS NULL OR excluded.{version} > {table}.{version}'
+CHANGED_ROW_CONDITION = '({target}) IS DISTINCT FROM ({excluded})'
+
+
+def make_upsert_clause(table: Table, only_newer: bool = True) -> str:
+    """
+    Создаёт ON CONFLICT, обновляющий существующую строку.
+
+    Args:
+        table: описание таблицы
+        only_newer: обновлять только более новой версией по колонке версии;
+            иначе строка обновляется при любом отличии значений
+
+    Returns:
+        str: выражение ON CONFLICT для INSERT
+    """
+    columns = table.columns[1:]
+    if only_newer:
+        condition = NEWER_VERSION_CONDITION.format(table=table.name, version=table.version_column)
+    else:
+        condition = CHANGED_ROW_CONDITION.format(
+            target=', '.join('{table}.{column}'.format(table=table.name, column=column) for column in columns),
+            excluded=', '.join('excluded.{column}'.format(column=column) for column in columns),
+        )
+    return ON_CONFLICT_UPSERT.format(
+        assignments=', '.join('{column} = excluded.{column}'.format(column=column) for column in columns),
+        condition=condition,
+    )
+
+
+@lru_cache(maxsize=UUID_CACHE_SIZE)
+def _quote_uuid(value: uuid.UUID) -> AsIs:
+    return AsIs("'{value}'::uuid".format(value=value))
+
+
+def register_adapters() -> None:
+    """
+    Регистрирует адаптер psycopg2 для UUID, полученных через TypeConverter.
+
+    Значение уже проверено и приведено к каноническому виду при выгрузке, поэтому
+    адаптер не экранирует строку, а готовый литерал кешируется: повторяющиеся
+    внешние ключи интернированы и попадают в кеш. Адаптер глобален для процесса,
+    поэтому регистрируется только при включённом приведении типов.
+    """
+    register_adapter(uuid.UUID, _quote_uuid)
+
+
+class CopyEncoder(object):
+    """Сериализует пачки кортежей в текстовый формат COPY."""
+
+    def __init__(self, separator: str) -> None:
+        """
+        Init метод.
+
+        Args:
+            separator: разделитель колонок
+        """
+        self.separator = separator
+        self._escape = str.maketrans({
+            '\\': '\\\\',
+            '\n': '\\n',
+            '\r': '\\r',
+            separator: '\\' + separator,
+        })
+        # Строковое представление UUID, дат и чисел не требует экранирования,
+        # а интернированные при выгрузке значения повторяются и попадают в кеш.
+        self._format_plain = lru_cache(maxsize=FORMAT_CACHE_SIZE, typed=True)(str)
+
+    def encode(self, data_list: list) -> io.StringIO:
+        """
+        Сериализует пачку.
+
+        Args:
+            data_list: список кортежей со значениями
+
+        Returns:
+            io.StringIO: буфер, готовый для передачи в COPY FROM STDIN
+        """
+        escape = self._escape
+        format_plain = self._format_plain
+        lines = []
+        for row in data_list:
+            lines.append(self.separator.join(
+                '\\N' if value is None
+                else value.translate(escape) if value.__class__ is str
+                else format_plain(value)
+                for value in row
+            ))
+        lines.append('')
+        return io.StringIO('\n'.join(lines))
+
 
 class PostgresSaver(object):
     """Класс отвечает за сохранение данных в postgresql."""
 
-    def __init__(self, pg_conn: _connection) -> None:
+    def __init__(
+        self,
+        pg_conn: _connection,
+        load_method: str = LOAD_METHOD_COPY,
+        metrics: Optional[PipelineMetrics] = None,
+        upsert: bool = False,
+        only_newer: bool = True,
+    ) -> None:
         """
         Init метод.
 
         Args:
             pg_conn: Соединение с БД
+            load_method: способ записи пачки - COPY через промежуточную таблицу или INSERT ... VALUES
+            metrics: сборщик метрик этапа load
+            upsert: обновлять существующие строки; иначе они пропускаются
+            only_newer: в режиме upsert обновлять строку, только если версия в пачке новее сохранённой
+
+        Raises:
+            ValueError: передан неизвестный способ записи
         """
+        if load_method not in {LOAD_METHOD_VALUES, LOAD_METHOD_COPY}:
+            raise ValueError('Unknown load method: {method}'.format(method=load_method))
         self.pg_conn = pg_conn
         self.curs = self.pg_conn.cursor()
         self.csv_separator = '|'
+        self.load_method = load_method
+        self.metrics = metrics
+        self._last_saved: dict = {}
+        self._copy_encoder = CopyEncoder(self.csv_separator)
+        self._on_conflict = {
+            table.name: make_upsert_clause(table, only_newer) if upsert else ON_CONFLICT_DO_NOTHING
+            for table in TABLES
+        }
+
+    def save(self, table: str, data_list: list) -> None:
+        """
+        Сохраняет пачку кортежей в порядке колонок Postgres из реестра TABLES.
+
+        Args:
+            table: имя таблицы
+            data_list: список кортежей со значениями
+        """
+        self._save_data(table, TABLES_BY_NAME[table].columns, data_list)
 
-    def save_movies(self, movies: list) -> None:
-        movies_array = []
-        for movie in movies:
-            data_tuple = (
-                movie.id, movie.title, movie.description, movie.creation_date, movie.rating, movie.type, movie.created,
-                movie.modified)
-            movies_array.append(data_tuple)
-        sql_query = f'INSERT INTO film_work (id, title, description, creation_date, rating, type, created, modified) VALUES %s ON CONFLICT DO NOTHING;'
-
-        self._insert_data(sql_query, movies_array)
-
-    def save_genres(self, genres: list) -> None:
-        genres_array = []
-        for genre in genres:
-            data_tuple = (
-                genre.id, genre.name, genre.description, genre.created,
-                genre.modified)
-            genres_array.append(data_tuple)
-        sql_query = f'INSERT INTO genre (id, name, description, created, modified) VALUES %s ON CONFLICT DO NOTHING;'
-
-        self._insert_data(sql_query, genres_array)
-
-    def save_persons(self, persons: list) -> None:
-        persons_array = []
-        for person in persons:
-            data_tuple = (
-                person.id, person.full_name, person.created, person.modified)
-            persons_array.append(data_tuple)
-        sql_query = f'INSERT INTO person (id, full_name, created, modified) VALUES %s ON CONFLICT DO NOTHING;'
-
-        self._insert_data(sql_query, persons_array)
-
-    def save_genres_film_works(self, genres_film_works: list) -> None:
-        genres_film_works_array = []
-        for genre_film_work in genres_film_works:
-            data_tuple = (
-                genre_film_work.id, genre_film_work.genre_id, genre_film_work.film_work_id, genre_film_work.created)
-            genres_film_works_array.append(data_tuple)
-        sql_query = f'INSERT INTO genre_film_work (id, genre_id, film_work_id, created) VALUES %s ON CONFLICT DO NOTHING;'
-
-        self._insert_data(sql_query, genres_film_works_array)
-
-    def save_persons_film_works(self, persons_film_works: list) -> None:
-        persons_film_works_array = []
-        for person_film_work in persons_film_works:
-            data_tuple = (
-                person_film_work.id, person_film_work.person_id, person_film_work.film_work_id, person_film_work.role,
-                person_film_work.created)
-            persons_film_works_array.append(data_tuple)
-        sql_query = f'INSERT INTO person_film_work (id, person_id, film_work_id, role, created) VALUES %s ON CONFLICT (id) DO NOTHING;'
-
-        self._insert_data(sql_query, persons_film_works_array)
+    def save_objects(self, table: str, objects: list) -> None:
+        """
+        Сохраняет пачку объектов dataclass.
+
+        Args:
+            table: имя таблицы
+            objects: список объектов модели таблицы
+        """
+        columns = TABLES_BY_NAME[table].columns
+        self._save_data(table, columns, list(map(attrgetter(*columns), objects)))
+
+    def save_csv(self, table: str, buffer: BinaryIO, rows: int) -> None:
+        """
+        Сохраняет готовый CSV без заголовка в порядке колонок Postgres из реестра TABLES.
+
+        Строки не разбираются в Python: буфер целиком передаётся в COPY.
+
+        Args:
+            table: имя таблицы
+            buffer: файлоподобный объект с CSV
+            rows: количество строк в буфере для метрик
+        """
+        self._measure(table, rows, partial(
+            self._copy_buffer, table, TABLES_BY_NAME[table].columns, buffer, COPY_FORMAT_CSV,
+        ))
+
+    def _save_data(self, table: str, columns: tuple, data_list: list) -> None:
+        """
+        Записывает пачку строк выбранным способом.
+
+        Повторная запись уже существующих строк игнорируется при обоих способах записи,
+        а в режиме upsert такие строки обновляются.
+
+        Args:
+            table: имя таблицы
+            columns: имена колонок в порядке значений в строке
+            data_list: список кортежей со значениями
+        """
+        if not data_list:
+            return
+        if self.load_method == LOAD_METHOD_COPY:
+            write = partial(self._copy_data, table, columns, data_list)
+        else:
+            sql_query = 'INSERT INTO {table} ({columns}) VALUES %s {on_conflict};'.format(
+                table=table, columns=', '.join(columns), on_conflict=self._on_conflict[table],
+            )
+            write = partial(self._insert_data, sql_query, data_list)
+        self._measure(table, len(data_list), write)
+
+    def _measure(self, table: str, rows: int, write: Callable[[], None]) -> None:
+        """
+        Выполняет запись, учитывая её время и ошибки в метриках этапа load.
+
+        Args:
+            table: имя таблицы
+            rows: количество записываемых строк
+            write: функция записи
+        """
+        started = time.perf_counter()
+        try:
+            write()
+        except Exception:
+            if self.metrics:
+                self.metrics.record_error(table, STAGE_LOAD)
+            raise
+        finished = time.perf_counter()
+        if self.metrics:
+            # Ожидание - время между окончанием записи предыдущей пачки таблицы и началом текущей.
+            last_saved = self._last_saved.get(table, started)
+            self.metrics.observe(table, STAGE_LOAD, rows, finished - started, started - last_saved)
+        self._last_saved[table] = finished
 
     def _insert_data(self, query: str, data_list: list) -> None:
         execute_values(
-            self.curs, query, data_list, template=None
+            self.curs, query, data_list, template=None, page_size=len(data_list),
+        )
+
+    def _copy_data(self, table: str, columns: tuple, data_list: list) -> None:
+        """
+        Сериализует пачку в текстовый формат COPY и загружает её.
+
+        Args:
+            table: имя таблицы
+            columns: имена колонок в порядке значений в строке
+            data_list: список кортежей со значениями
+        """
+        self._copy_buffer(
+            table,
+            columns,
+            self._copy_encoder.encode(data_list),
+            COPY_FORMAT_TEXT.format(separator=self.csv_separator),
+        )
+
+    def _copy_buffer(self, table: str, columns: tuple, buffer: Union[TextIO, BinaryIO], copy_format: str) -> None:
+        """
+        Загружает буфер через COPY во временную таблицу и переносит его одним INSERT ... SELECT.
+
+        Временная таблица живёт до конца сессии и очищается перед каждой пачкой,
+        поэтому повторное создание не требуется.
+
+        Args:
+            table: имя таблицы
+            columns: имена колонок в порядке значений в строке
+            buffer: файлоподобный объект с данными в формате copy_format
+            copy_format: параметры COPY, описывающие формат буфера
+        """
+        staging_table = 'staging_{table}'.format(table=table)
+        column_list = ', '.join(columns)
+        self.curs.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS);'.format(
+                staging=staging_table, table=table,
+            ),
+        )
+        self.curs.execute('TRUNCATE {staging};'.format(staging=staging_table))
+        self.curs.copy_expert(
+            'COPY {staging} ({columns}) FROM STDIN WITH ({copy_format});'.format(
+                staging=staging_table, columns=column_list, copy_format=copy_format,
+            ),
+            buffer,
+        )
+        self.curs.execute(
+            'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} {on_conflict};'.format(
+                table=table, columns=column_list, staging=staging_table, on_conflict=self._on_conflict[table],
+            ),
         )
@@ -0,0 +1,173 @@
+"""Параллельная выгрузка данных из sqlite БД по диапазонам rowid."""
+
+import sqlite3
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import closing
+from pathlib import Path
+from typing import Iterator, Optional
+
+from sqlite_to_postgres.converters import TypeConverter
+from sqlite_to_postgres.data_types import Batch
+from sqlite_to_postgres.sqlite_extractor import (BATCH_SIZE, MAX_ROWID,
+                                                 SQLiteExtractor)
+
+DEFAULT_SHARD_WORKERS = 4
+DEFAULT_SHARD_SIZE = 100000
+
+
+def connect_read_only(db_path: str, immutable: bool = False) -> sqlite3.Connection:
+    """
+    Открывает соединение с SQLite только для чтения.
+
+    Соединение можно передать другому потоку: pipeline.prefetch читает пачки
+    в своём потоке, а соединение одновременно использует только он.
+
+    Args:
+        db_path: путь к файлу БД
+        immutable: файл не меняется во время чтения, блокировки можно не брать
+
+    Returns:
+        sqlite3.Connection: соединение с БД
+    """
+    uri = '{path}?mode=ro'.format(path=Path(db_path).resolve().as_uri())
+    if immutable:
+        uri = '{uri}&immutable=1'.format(uri=uri)
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+
+def split_rowid_ranges(min_rowid: int, max_rowid: int, shard_size: int) -> list:
+    """
+    Делит диапазон rowid на непрерывные непересекающиеся части.
+
+    Каждая часть задаётся полуинтервалом (after_rowid, until_rowid], поэтому
+    строки на границах попадают ровно в одну часть.
+
+    Args:
+        min_rowid: минимальный rowid таблицы
+        max_rowid: максимальный rowid таблицы
+        shard_size: ширина одной части в rowid
+
+    Returns:
+        list: список пар (after_rowid, until_rowid)
+    """
+    if min_rowid is None:
+        return []
+    ranges = []
+    after_rowid = min_rowid - 1
+    while after_rowid < max_rowid:
+        until_rowid = min(after_rowid + shard_size, max_rowid)
+        ranges.append((after_rowid, until_rowid))
+        after_rowid = until_rowid
+    return ranges
+
+
+def read_shard(
+    db_path: str,
+    table: str,
+    after_rowid: int,
+    until_rowid: int,
+    batch_size: int,
+    immutable: bool,
+    type_converter: Optional[TypeConverter] = None,
+) -> list:
+    """
+    Читает одну часть таблицы в отдельном процессе через собственное соединение.
+
+    Args:
+        db_path: путь к файлу БД
+        table: имя таблицы
+        after_rowid: rowid, после которого начинается часть
+        until_rowid: rowid, на котором часть заканчивается
+        batch_size: размер пачки
+        immutable: файл не меняется во время чтения
+        type_converter: приводит значения к типам Postgres; в процесс передаются только его настройки
+
+    Returns:
+        list: пачки объектов в порядке rowid
+    """
+    with closing(connect_read_only(db_path, immutable)) as connection:
+        extractor = SQLiteExtractor(connection, batch_size, type_converter=type_converter)
+        return list(extractor.iter_table(table, after_rowid, until_rowid))
+
+
+class ShardedSQLiteExtractor(SQLiteExtractor):
+    """
+    Выгружает таблицы параллельно несколькими процессами.
+
+    Таблица делится на диапазоны rowid, каждый диапазон читается отдельным
+    процессом через своё соединение только для чтения. Одновременно в работе
+    находится не больше двух диапазонов на процесс, поэтому расход памяти
+    зависит от shard_size, а не от размера таблицы.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        workers: int = DEFAULT_SHARD_WORKERS,
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        batch_size: int = BATCH_SIZE,
+        ordered: bool = True,
+        immutable: bool = False,
+        type_converter: Optional[TypeConverter] = None,
+    ) -> None:
+        """
+        Init метод.
+
+        Args:
+            db_path: путь к файлу БД
+            workers: количество процессов чтения
+            shard_size: ширина одного диапазона в rowid
+            batch_size: количество строк в пачке
+            ordered: отдавать пачки в порядке rowid; без этого пачки отдаются по мере готовности,
+                и rowid последней пачки нельзя использовать как контрольную точку
+            immutable: файл не меняется во время чтения
+            type_converter: приводит значения к типам Postgres; без него значения передаются как есть
+        """
+        super().__init__(connect_read_only(db_path, immutable), batch_size, type_converter=type_converter)
+        self.db_path = db_path
+        self.workers = workers
+        self.shard_size = shard_size
+        self.ordered = ordered
+        self.immutable = immutable
+
+    def iter_table(self, table: str, after_rowid: int = 0, until_rowid: int = MAX_ROWID) -> Iterator[Batch]:
+        """
+        Выгружает таблицу пачками, читая её диапазоны параллельно.
+
+        Args:
+            table: имя таблицы
+            after_rowid: rowid, после которого начинается выгрузка
+            until_rowid: rowid, на котором выгрузка заканчивается
+
+        Yields:
+            Batch: пачка объектов размером не больше batch_size
+        """
+        min_rowid, max_rowid = self.get_rowid_bounds(table)
+        if min_rowid is None:
+            return
+        ranges = iter(split_rowid_ranges(
+            max(min_rowid, after_rowid + 1), min(max_rowid, until_rowid), self.shard_size,
+        ))
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = deque()
+
+            def submit_next() -> None:
+                shard = next(ranges, None)
+                if shard is not None:
+                    in_flight.append(executor.submit(
+                        read_shard, self.db_path, table, *shard, self.batch_size, self.immutable, self.type_converter,
+                    ))
+
+            for _ in range(self.workers * 2):
+                submit_next()
+            while in_flight:
+                if self.ordered:
+                    finished = [in_flight.popleft()]
+                else:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        in_flight.remove(future)
+                for future in finished:
+                    submit_next()
+                    yield from future.result()
@@ -0,0 +1,338 @@
+"""
+Колоночный снимок таблиц для переноса одного каталога в несколько окружений.
+
+Каждая таблица выгружается в сжатые файлы Arrow IPC по chunk_rows строк,
+рядом лежит manifest.json с количеством строк и sha256 каждого файла.
+Снимок не зависит от исходного файла SQLite и загружается в Postgres без
+разбора строк в Python: файл отображается в память и передаётся в COPY как CSV.
+
+Требуется pyarrow.
+
+Запуск:
+    python snapshot.py export snapshot/          # выгрузка из SQLITE_PATH
+    python snapshot.py verify snapshot/          # поиск повреждённых или недокачанных файлов
+    python snapshot.py import snapshot/          # загрузка в Postgres
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import uuid
+from contextlib import closing
+from typing import Optional
+
+from psycopg2.extensions import connection as _connection
+
+from checkpoint import PostgresCheckpointStore
+from load_data import SQLITE_PATH, connect_postgres
+from metrics import PipelineMetrics
+from postgres_saver import PostgresSaver
+from sqlite_extractor import SQLiteExtractor
+from summary import defer_summaries, refresh_deferred_summaries
+from tables import TABLES, Table
+
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+SNAPSHOT_FORMAT = 'arrow-ipc'
+SNAPSHOT_VERSION = 1
+CHUNK_ROWS = 100000
+COMPRESSION = 'zstd'
+
+
+def _require_pyarrow() -> None:
+    if pyarrow is None:
+        raise ImportError('Snapshots require pyarrow: pip install pyarrow')
+
+
+def _arrow_schema(table: Table) -> 'pyarrow.Schema':
+    # Даты, время и UUID хранятся строками SQLite: Postgres приводит их сам при COPY.
+    return pyarrow.schema([
+        (column, pyarrow.float64() if column_type == 'float' else pyarrow.string())
+        for column, column_type in zip(table.columns, table.column_types)
+    ])
+
+
+def read_manifest(path: str) -> Optional[dict]:
+    """
+    Читает описание снимка.
+
+    Args:
+        path: каталог снимка
+
+    Returns:
+        Optional[dict]: описание или None, если снимок ещё не начат
+    """
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def file_checksum(path: str) -> Optional[str]:
+    """
+    Считает sha256 файла, не копируя его в память процесса.
+
+    Args:
+        path: путь к файлу
+
+    Returns:
+        Optional[str]: hex-строка или None, если файла нет
+    """
+    _require_pyarrow()
+    if not os.path.exists(path):
+        return None
+    with pyarrow.memory_map(path) as source:
+        return hashlib.sha256(memoryview(source.read_buffer())).hexdigest()
+
+
+def verify_snapshot(path: str) -> list:
+    """
+    Ищет файлы снимка, которые отсутствуют или не совпадают с контрольной суммой.
+
+    Args:
+        path: каталог снимка
+
+    Returns:
+        list: пути к повреждённым файлам относительно каталога снимка
+
+    Raises:
+        ValueError: в каталоге нет описания снимка
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise ValueError('{path} has no {manifest}'.format(path=path, manifest=MANIFEST_NAME))
+    return [
+        chunk['file']
+        for entry in manifest['tables'].values()
+        for chunk in entry['chunks']
+        if file_checksum(os.path.join(path, chunk['file'])) != chunk['sha256']
+    ]
+
+
+class SnapshotExporter(object):
+    """
+    Выгружает таблицы из SQLite в каталог снимка.
+
+    Описание снимка перезаписывается после каждого файла, поэтому прерванная
+    выгрузка продолжается с последнего целого файла: его rowid служит началом
+    следующего, а файлы с несовпадающей суммой выгружаются заново.
+    """
+
+    def __init__(
+        self,
+        sqlite_extractor: SQLiteExtractor,
+        path: str,
+        chunk_rows: int = CHUNK_ROWS,
+        compression: str = COMPRESSION,
+    ) -> None:
+        """
+        Init метод.
+
+        Args:
+            sqlite_extractor: объект чтения из SQLite
+            path: каталог снимка
+            chunk_rows: количество строк в одном файле
+            compression: кодек сжатия буферов Arrow IPC (zstd или lz4)
+        """
+        _require_pyarrow()
+        self.sqlite_extractor = sqlite_extractor
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+        self.manifest = read_manifest(path) or {
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'id': str(uuid.uuid4()),
+            'compression': compression,
+            'tables': {},
+        }
+
+    def export(self) -> dict:
+        """
+        Выгружает все таблицы из TABLES.
+
+        Returns:
+            dict: описание снимка
+        """
+        for table in TABLES:
+            self.export_table(table)
+        return self.manifest
+
+    def export_table(self, table: Table) -> None:
+        """
+        Выгружает одну таблицу, продолжая с последнего целого файла.
+
+        Args:
+            table: описание таблицы
+        """
+        entry = self.manifest['tables'].setdefault(
+            table.name, {'columns': list(table.columns), 'chunks': [], 'complete': False},
+        )
+        chunks = entry['chunks']
+        for index, chunk in enumerate(chunks):
+            if file_checksum(os.path.join(self.path, chunk['file'])) != chunk['sha256']:
+                logger.warning('Chunk %s is damaged, exporting %s from it again', chunk['file'], table.name)
+                del chunks[index:]
+                entry['complete'] = False
+                break
+        if entry['complete']:
+            return
+        os.makedirs(os.path.join(self.path, table.name), exist_ok=True)
+        schema = _arrow_schema(table)
+        after_rowid = chunks[-1]['last_rowid'] if chunks else 0
+        rows: list = []
+        for batch in self.sqlite_extractor.iter_table(table.name, after_rowid):
+            rows.extend(batch.rows)
+            if len(rows) >= self.chunk_rows:
+                self._write_chunk(table, schema, rows, batch.last_rowid)
+                rows = []
+        if rows:
+            self._write_chunk(table, schema, rows, batch.last_rowid)
+        entry['complete'] = True
+        self._save_manifest()
+
+    def _write_chunk(self, table: Table, schema: 'pyarrow.Schema', rows: list, last_rowid: int) -> None:
+        chunks = self.manifest['tables'][table.name]['chunks']
+        record_batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(values, field.type) for values, field in zip(zip(*rows), schema)], schema=schema,
+        )
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_file(sink, schema, options=self.options) as writer:
+            writer.write_batch(record_batch)
+        data = sink.getvalue()
+        file_name = os.path.join(table.name, '{index:06d}.arrow'.format(index=len(chunks)))
+        file_path = os.path.join(self.path, file_name)
+        with open(file_path + '.tmp', 'wb') as chunk_file:
+            chunk_file.write(data)
+        os.replace(file_path + '.tmp', file_path)
+        chunks.append({
+            'file': file_name,
+            'rows': len(rows),
+            'last_rowid': last_rowid,
+            'sha256': hashlib.sha256(memoryview(data)).hexdigest(),
+        })
+        self._save_manifest()
+
+    def _save_manifest(self) -> None:
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+
+class SnapshotImporter(object):
+    """
+    Загружает снимок в Postgres по одному файлу в транзакции.
+
+    Файл отображается в память, проверяется по контрольной сумме и передаётся
+    в COPY в формате CSV, который формирует pyarrow. После каждого файла
+    в migration_checkpoint фиксируется его rowid под ключом таблица@id снимка,
+    поэтому повторный импорт того же снимка продолжается с первого незагруженного файла.
+    Сводки кинопроизведений пересчитываются один раз после импорта всех таблиц.
+    """
+
+    def __init__(self, pg_conn: _connection, path: str, metrics: Optional[PipelineMetrics] = None) -> None:
+        """
+        Init метод.
+
+        Args:
+            pg_conn: соединение с Postgres
+            path: каталог снимка
+            metrics: сборщик метрик этапа load
+        """
+        _require_pyarrow()
+        self.pg_conn = pg_conn
+        self.path = path
+        self.manifest = read_manifest(path)
+        if self.manifest is None or self.manifest.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError('{path} is not a snapshot'.format(path=path))
+        self.saver = PostgresSaver(pg_conn, metrics=metrics)
+        self.checkpoints = PostgresCheckpointStore(pg_conn)
+        defer_summaries(pg_conn)
+        self.csv_options = pyarrow.csv.WriteOptions(include_header=False)
+
+    def import_all(self) -> None:
+        """
+        Загружает все таблицы снимка в порядке TABLES.
+
+        Raises:
+            ValueError: выгрузка таблицы не завершена или файл повреждён
+        """
+        for table in TABLES:
+            entry = self.manifest['tables'].get(table.name)
+            if entry is None or not entry['complete']:
+                raise ValueError('Snapshot export of {table} is not complete'.format(table=table.name))
+            self.import_table(table.name, entry['chunks'])
+        refresh_deferred_summaries(self.pg_conn)
+
+    def import_table(self, table_name: str, chunks: list) -> None:
+        """
+        Загружает файлы одной таблицы, пропуская уже загруженные.
+
+        Args:
+            table_name: имя таблицы
+            chunks: описания файлов таблицы из manifest.json
+
+        Raises:
+            ValueError: файл отсутствует или не совпадает с контрольной суммой
+        """
+        checkpoint = '{table}@{snapshot}'.format(table=table_name, snapshot=self.manifest['id'])
+        loaded_rowid = self.checkpoints.get(checkpoint)
+        for chunk in chunks:
+            if chunk['last_rowid'] <= loaded_rowid:
+                continue
+            file_path = os.path.join(self.path, chunk['file'])
+            if file_checksum(file_path) != chunk['sha256']:
+                raise ValueError('{file} is missing or damaged, transfer it again'.format(file=chunk['file']))
+            with pyarrow.memory_map(file_path) as source:
+                arrow_table = pyarrow.ipc.open_file(source).read_all()
+            sink = pyarrow.BufferOutputStream()
+            pyarrow.csv.write_csv(arrow_table, sink, self.csv_options)
+            self.saver.save_csv(table_name, pyarrow.BufferReader(sink.getvalue()), arrow_table.num_rows)
+            self.checkpoints.commit(checkpoint, chunk['last_rowid'])
+            logger.info('Imported %s (%s rows)', chunk['file'], arrow_table.num_rows)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Разбирает аргументы командной строки.
+
+    Returns:
+        argparse.Namespace: аргументы
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('export', 'verify', 'import'))
+    parser.add_argument('path')
+    parser.add_argument('--sqlite-path', default=SQLITE_PATH)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--compression', default=COMPRESSION)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.command == 'export':
+        with closing(sqlite3.connect(args.sqlite_path)) as sqlite_conn:
+            SnapshotExporter(SQLiteExtractor(sqlite_conn), args.path, args.chunk_rows, args.compression).export()
+    elif args.command == 'verify':
+        damaged = verify_snapshot(args.path)
+        for file_name in damaged:
+            print(file_name)
+        sys.exit(1 if damaged else 0)
+    else:
+        with closing(connect_postgres()) as pg_conn:
+            SnapshotImporter(pg_conn, args.path).import_all()
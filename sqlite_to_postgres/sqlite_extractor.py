@@ -1,150 +1,246 @@
 """Экспорт данных из sqlite БД."""
 
+import logging
 import sqlite3
-import traceback
-from typing import Generator
+import time
+from functools import partial
+from operator import itemgetter
+from typing import Generator, Iterator, Optional
 
-from sqlite_to_postgres.data_types import (Genre, GenreFilmwork, Movie, Person,
-                                           PersonFilmwork)
+from sqlite_to_postgres.converters import TypeConverter
+from sqlite_to_postgres.data_types import Batch
+from sqlite_to_postgres.metrics import (STAGE_EXTRACT, STAGE_TRANSFORM,
+                                        PipelineMetrics)
+from sqlite_to_postgres.tables import TABLES, TABLES_BY_NAME
 
+logger = logging.getLogger(__name__)
 
-class SQLiteExtractor(object):
-    """Класс отвечает за выгрузку данных из sqlite."""
+BATCH_SIZE = 1000
+MAX_ROWID = 2 ** 63 - 1
+ID_CHUNK_SIZE = 500
+BATCH_QUERY = 'SELECT rowid, {columns} FROM {table} WHERE rowid > ? AND rowid <= ? ORDER BY rowid;'
+# Колонка версии повторяется в конце строки, чтобы отметка не зависела от приведения типов.
+CHANGES_QUERY = (
+    'SELECT rowid, {columns}, {version} FROM {table} WHERE ? IS NULL OR {version} >= ? ORDER BY {version}, rowid;'
+)
+
+
+def _strip_rowid(getter: itemgetter, data: list) -> list:
+    return list(map(getter, data))
 
-    def __init__(self, connection: sqlite3.Connection) -> None:
+
+class SQLiteExtractor(object):
+    """
+    Класс отвечает за выгрузку данных из sqlite.
+
+    Строки выгружаются кортежами в порядке колонок Postgres из реестра TABLES,
+    объекты dataclass создаются только по запросу через iter_objects и get_*.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        batch_size: int = BATCH_SIZE,
+        metrics: Optional[PipelineMetrics] = None,
+        type_converter: Optional[TypeConverter] = None,
+    ) -> None:
         """
         Init метод.
 
         Args:
             connection: соединение с БД
+            batch_size: количество строк, читаемых из БД за один раз
+            metrics: сборщик метрик этапов extract и transform
+            type_converter: приводит значения к типам Postgres; без него значения передаются как есть
         """
         self.connection = connection
-        self.connection.row_factory = sqlite3.Row
-        self.curs = self.connection.cursor()
-
-    def _collect_movies(self, generator: Generator) -> list:
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self._queries = {
+            table.name: BATCH_QUERY.format(table=table.name, columns=', '.join(table.sqlite_columns))
+            for table in TABLES
+        }
+        self._changes_queries = {
+            table.name: CHANGES_QUERY.format(
+                table=table.name, columns=', '.join(table.sqlite_columns), version=table.sqlite_version_column,
+            )
+            for table in TABLES
+        }
+        self.type_converter = type_converter
+        if type_converter:
+            self._converters = {table.name: type_converter.make_batch_converter(table) for table in TABLES}
+        else:
+            # Отбрасывает rowid из начала строки: itemgetter возвращает кортеж без лишних аллокаций.
+            self._converters = {
+                table.name: partial(_strip_rowid, itemgetter(*range(1, len(table.columns) + 1))) for table in TABLES
+            }
+
+    def _get_batches(self, table: str, query: str, params: tuple = ()) -> Generator:
         """
-        Переделывает ответ от БД в объекты класса Movie и объединяет их в список.
+        Создаёт генератор пачек строк на основе полученного sql запроса.
+
+        Для каждого запроса используется отдельный курсор, поэтому несколько
+        генераторов могут читать данные одновременно. Время между выдачей пачки
+        и запросом следующей учитывается как ожидание следующих этапов.
 
         Args:
-            generator: генератор полученный на основе sql запроса
+            table: имя таблицы для метрик
+            query: sql запрос
+            params: параметры sql запроса
 
-        Returns:
-            list: список объектов класса Movie
+        Return:
+            Generator: генератор списков кортежей размером не больше batch_size
         """
-        movies = []
-        for row in generator:
-            movie_id = row['id']
-            title = row['title']
-            description = row['description']
-            creation_date = row['creation_date']
-            rating = row['rating']
-            movie_type = row['type']
-            created_at = row['created_at']
-            updated_at = row['updated_at']
-            movie = Movie(title, description, creation_date, movie_type, created_at, updated_at, rating, movie_id)
-            movies.append(movie)
-        return movies
-
-    def _collect_genres(self, generator: Generator) -> list:
+        metrics = self.metrics
+        curs = self.connection.cursor()
+        curs.row_factory = None
+        waited = 0.0
+        try:
+            started = time.perf_counter()
+            curs.execute(query, params)
+            while data := curs.fetchmany(self.batch_size):
+                if metrics:
+                    metrics.observe(table, STAGE_EXTRACT, len(data), time.perf_counter() - started, waited)
+                yielded = time.perf_counter()
+                yield data
+                started = time.perf_counter()
+                waited = started - yielded
+        except Exception:
+            if metrics:
+                metrics.record_error(table, STAGE_EXTRACT)
+            logger.exception('Failed to read table %s', table)
+            raise
+        finally:
+            curs.close()
+
+    def iter_table(self, table: str, after_rowid: int = 0, until_rowid: int = MAX_ROWID) -> Iterator[Batch]:
         """
-        Переделывает ответ от БД в объекты класса Genre и объединяет их в список.
+        Выгружает таблицу пачками кортежей, не накапливая её целиком в памяти.
+
+        Строки читаются в порядке rowid из диапазона (after_rowid, until_rowid],
+        что позволяет продолжить выгрузку с места последней сохранённой пачки
+        или разбить таблицу на непересекающиеся части.
 
         Args:
-            generator: генератор полученный на основе sql запроса
+            table: имя таблицы из TABLES
+            after_rowid: rowid, после которого начинается выгрузка
+            until_rowid: rowid, на котором выгрузка заканчивается
 
-        Returns:
-            list: список объектов класса Genre
+        Yields:
+            Batch: пачка кортежей в порядке колонок Postgres
+        """
+        converter = self._converters[table]
+        metrics = self.metrics
+        for data in self._get_batches(table, self._queries[table], (after_rowid, until_rowid)):
+            started = time.perf_counter()
+            rows = converter(data)
+            if metrics:
+                metrics.observe(table, STAGE_TRANSFORM, len(rows), time.perf_counter() - started)
+            yield Batch(rows, data[-1][0])
+
+    def iter_changes(self, table: str, high_water_mark: Optional[str] = None) -> Iterator[Batch]:
         """
-        genres = []
-        for row in generator:
-            genre_id = row['id']
-            name = row['name']
-            description = row['description']
-            created_at = row['created_at']
-            updated_at = row['updated_at']
-            genre = Genre(name, description, created_at, updated_at, genre_id)
-            genres.append(genre)
-        return genres
+        Выгружает строки, изменённые начиная с отметки high_water_mark.
+
+        Строки читаются в порядке колонки версии, поэтому отметка последней строки
+        пачки ограничивает снизу всё, что ещё не выгружено. Строки с версией, равной
+        отметке, выгружаются повторно: после сбоя посреди строк с одинаковой версией
+        ни одна из них не теряется, а повторная запись в Postgres ничего не меняет.
+        Без индекса по колонке версии SQLite просматривает таблицу целиком, но
+        в Postgres передаются только изменённые строки.
+
+        Args:
+            table: имя таблицы из TABLES
+            high_water_mark: значение колонки версии, сохранённое прошлой синхронизацией;
+                без неё выгружается вся таблица
 
-    def _collect_persons(self, generator: Generator) -> list:
+        Yields:
+            Batch: пачка кортежей в порядке колонок Postgres с отметкой последней строки
         """
-        Переделывает ответ от БД в объекты класса Person и объединяет их в список.
+        converter = self._converters[table]
+        metrics = self.metrics
+        params = (high_water_mark, high_water_mark)
+        for data in self._get_batches(table, self._changes_queries[table], params):
+            started = time.perf_counter()
+            rows = converter(data)
+            if metrics:
+                metrics.observe(table, STAGE_TRANSFORM, len(rows), time.perf_counter() - started)
+            yield Batch(rows, data[-1][0], data[-1][-1])
+
+    def get_rows(self, table: str, ids: list) -> list:
+        """
+        Читает текущее состояние строк по их id.
 
         Args:
-            generator: генератор полученный на основе sql запроса
+            table: имя таблицы из TABLES
+            ids: список id; отсутствующие в таблице id пропускаются
 
         Returns:
-            list: список объектов класса Person
+            list: список кортежей в порядке колонок Postgres
         """
-        persons = []
-        for row in generator:
-            person_id = row['id']
-            full_name = row['full_name']
-            created_at = row['created_at']
-            updated_at = row['updated_at']
-            genre = Person(full_name, created_at, updated_at, person_id)
-            persons.append(genre)
-        return persons
-
-    def _collect_genres_filmworks(self, generator: Generator) -> list:
+        converter = self._converters[table]
+        columns = ', '.join(TABLES_BY_NAME[table].sqlite_columns)
+        rows = []
+        curs = self.connection.cursor()
+        curs.row_factory = None
+        try:
+            # Ограничение SQLite на количество параметров запроса в старых версиях - 999.
+            for start in range(0, len(ids), ID_CHUNK_SIZE):
+                chunk = ids[start:start + ID_CHUNK_SIZE]
+                curs.execute(
+                    'SELECT rowid, {columns} FROM {table} WHERE id IN ({params}) ORDER BY rowid;'.format(
+                        columns=columns, table=table, params=', '.join('?' * len(chunk)),
+                    ),
+                    chunk,
+                )
+                rows.extend(converter(curs.fetchall()))
+        finally:
+            curs.close()
+        return rows
+
+    def iter_objects(self, table: str, after_rowid: int = 0) -> Iterator[Batch]:
         """
-        Переделывает ответ от БД в объекты класса GenreFilmwork и объединяет их в список.
+        Выгружает таблицу пачками объектов dataclass.
 
         Args:
-            generator: генератор полученный на основе sql запроса
+            table: имя таблицы из TABLES
+            after_rowid: rowid, после которого начинается выгрузка
 
-        Returns:
-            list: список объектов класса GenreFilmwork
+        Yields:
+            Batch: пачка объектов модели таблицы
         """
-        genres_filmworks = []
-        for row in generator:
-            relation_id = row['id']
-            genre_id = row['genre_id']
-            filmwork_id = row['film_work_id']
-            created = row['created_at']
-            genre = GenreFilmwork(created, relation_id, genre_id, filmwork_id)
-            genres_filmworks.append(genre)
-        return genres_filmworks
+        factory = TABLES_BY_NAME[table].make_model_factory()
+        for batch in self.iter_table(table, after_rowid):
+            yield Batch(list(map(factory, batch.rows)), batch.last_rowid)
 
-    def _collect_persons_filmworks(self, generator: Generator) -> list:
+    def get_rowid_bounds(self, table: str) -> tuple:
         """
-        Переделывает ответ от БД в объекты класса PersonFilmwork и объединяет их в список.
+        Возвращает минимальный и максимальный rowid таблицы.
 
         Args:
-            generator: генератор полученный на основе sql запроса
+            table: имя таблицы
 
         Returns:
-            list: список объектов класса PersonFilmwork
+            tuple: пара (min, max) или (None, None) для пустой таблицы
         """
-        persons_film_works = []
-        for row in generator:
-            relation_id = row['id']
-            person_id = row['person_id']
-            film_work_id = row['film_work_id']
-            role = row['role']
-            created = row['created_at']
-            genre = PersonFilmwork(role, created, relation_id, person_id, film_work_id)
-            persons_film_works.append(genre)
-        return persons_film_works
+        curs = self.connection.cursor()
+        try:
+            curs.execute('SELECT MIN(rowid), MAX(rowid) FROM {table};'.format(table=table))
+            return tuple(curs.fetchone())
+        finally:
+            curs.close()
 
-    def _get_generator(self, query: str) -> Generator:
+    def get_objects(self, table: str) -> list:
         """
-        Создаёт объект генератора на основе полученного sql запроса.
+        Управляет процессом создания списка объектов модели таблицы.
 
         Args:
-            query: sql запрос
+            table: имя таблицы из TABLES
 
-        Return:
-            Generator: генератор полученный в результате выполнения sql запроса
+        Returns:
+            list: список объектов модели таблицы
         """
-        try:
-            self.curs.execute(query)
-            while data := self.curs.fetchmany(1000):
-                for part in data:
-                    yield part
-        except Exception:
-            print('ERROR - {error}'.format(error=traceback.format_exc()))
+        return [obj for batch in self.iter_objects(table) for obj in batch.rows]
 
     def get_movies(self) -> list:
         """
@@ -153,9 +249,7 @@ class SQLiteExtractor(object):
         Returns:
             list: список объектов класса Movie
         """
-        query = 'SELECT * FROM film_work;'
-        gen = self._get_generator(query)
-        return self._collect_movies(gen)
+        return self.get_objects('film_work')
 
     def get_persons(self) -> list:
         """
@@ -164,9 +258,7 @@ class SQLiteExtractor(object):
         Returns:
             list: список объектов класса Person
         """
-        query = 'SELECT * FROM person;'
-        gen = self._get_generator(query)
-        return self._collect_persons(gen)
+        return self.get_objects('person')
 
     def get_genres(self) -> list:
         """
@@ -175,9 +267,7 @@ class SQLiteExtractor(object):
         Returns:
             list: список объектов класса Genre
         """
-        query = 'SELECT * FROM genre;'
-        gen = self._get_generator(query)
-        return self._collect_genres(gen)
+        return self.get_objects('genre')
 
     def get_genres_film_works(self) -> list:
         """
@@ -186,9 +276,7 @@ class SQLiteExtractor(object):
         Returns:
             list: список объектов класса GenreFilmwork
         """
-        query = 'SELECT * FROM genre_film_work;'
-        gen = self._get_generator(query)
-        return self._collect_genres_filmworks(gen)
+        return self.get_objects('genre_film_work')
 
     def get_persons_film_works(self) -> list:
         """
@@ -197,9 +285,7 @@ class SQLiteExtractor(object):
         Returns:
             list: список объектов класса PersonFilmwork
         """
-        query = 'SELECT * FROM person_film_work;'
-        gen = self._get_generator(query)
-        return self._collect_persons_filmworks(gen)
+        return self.get_objects('person_film_work')
 
     def extract_all_data(self) -> dict:
         """
@@ -0,0 +1,53 @@
+"""Отложенный пересчёт сводок кинопроизведений (content.film_work_summary) при загрузке."""
+
+import logging
+import time
+
+from psycopg2.extensions import connection as _connection
+
+logger = logging.getLogger(__name__)
+
+# Пока параметр сессии равен deferred, триггеры сводки (миграция movies 0004) только
+# запоминают затронутые кинопроизведения в content.film_work_summary_pending.
+DEFER_SUMMARIES_QUERY = "SET movies.film_work_summary TO 'deferred';"
+HAS_PENDING_QUERY = "SELECT to_regprocedure('content.refresh_pending_film_work_summaries()') IS NOT NULL;"
+REFRESH_PENDING_QUERY = 'SELECT content.refresh_pending_film_work_summaries();'
+
+
+def defer_summaries(pg_conn: _connection) -> None:
+    """
+    Откладывает пересчёт сводок до refresh_deferred_summaries для всей сессии.
+
+    Загрузчики пишут таблицы связей параллельно и фиксируют по несколько пачек
+    в транзакции. Немедленный пересчёт блокирует строки film_work до фиксации,
+    и два процесса, затрагивающие одни и те же кинопроизведения в разном порядке,
+    могли бы взаимно заблокироваться. Кроме того, сводка пересчитывалась бы после
+    каждой пачки. Без схемы сводок параметр ничего не меняет.
+
+    Args:
+        pg_conn: соединение загрузчика
+    """
+    with pg_conn.cursor() as curs:
+        curs.execute(DEFER_SUMMARIES_QUERY)
+    pg_conn.commit()
+
+
+def refresh_deferred_summaries(pg_conn: _connection) -> None:
+    """
+    Пересчитывает одним проходом сводки кинопроизведений, отложенные загрузкой.
+
+    Отложенные id хранятся в Postgres и фиксируются вместе с данными, поэтому
+    после сбоя загрузки их пересчитает следующий запуск. Если схема сводок
+    не установлена, ничего не делает.
+
+    Args:
+        pg_conn: соединение с Postgres
+    """
+    started = time.perf_counter()
+    with pg_conn.cursor() as curs:
+        curs.execute(HAS_PENDING_QUERY)
+        if not curs.fetchone()[0]:
+            return
+        curs.execute(REFRESH_PENDING_QUERY)
+    pg_conn.commit()
+    logger.info('Refreshed film work summaries in %.1fs', time.perf_counter() - started)
@@ -0,0 +1,96 @@
+"""Описание переносимых таблиц."""
+
+from dataclasses import dataclass, fields
+from operator import itemgetter
+from typing import Callable
+
+from sqlite_to_postgres.data_types import (Genre, GenreFilmwork, Movie, Person,
+                                           PersonFilmwork)
+
+COLUMN_TYPES = ('uuid', 'text', 'float', 'date', 'timestamp')
+
+
+@dataclass(frozen=True)
+class Table:
+    """
+    Описание одной таблицы: соответствие колонок SQLite и Postgres и типизированная модель.
+
+    Колонки перечислены в порядке Postgres, строки на всём пути переноса
+    представлены кортежами в этом же порядке. Первой всегда идёт колонка id.
+    В column_types для каждой колонки указан один из типов COLUMN_TYPES.
+    По колонке version_column определяется, какая из двух версий строки новее.
+    """
+
+    name: str
+    columns: tuple
+    sqlite_columns: tuple
+    column_types: tuple
+    model: type
+    depends_on: tuple = ()
+    version_column: str = 'modified'
+
+    @property
+    def sqlite_version_column(self) -> str:
+        """
+        Имя колонки версии в SQLite.
+
+        Returns:
+            str: имя колонки
+        """
+        return self.sqlite_columns[self.columns.index(self.version_column)]
+
+    def make_model_factory(self) -> Callable[[tuple], object]:
+        """
+        Создаёт функцию, превращающую кортеж строки в объект модели.
+
+        Returns:
+            Callable: функция кортеж -> объект self.model
+        """
+        model = self.model
+        getter = itemgetter(*(self.columns.index(field.name) for field in fields(model)))
+        return lambda row: model(*getter(row))
+
+
+TABLES = (
+    Table(
+        name='film_work',
+        columns=('id', 'title', 'description', 'creation_date', 'rating', 'type', 'created', 'modified'),
+        sqlite_columns=('id', 'title', 'description', 'creation_date', 'rating', 'type', 'created_at', 'updated_at'),
+        column_types=('uuid', 'text', 'text', 'date', 'float', 'text', 'timestamp', 'timestamp'),
+        model=Movie,
+    ),
+    Table(
+        name='genre',
+        columns=('id', 'name', 'description', 'created', 'modified'),
+        sqlite_columns=('id', 'name', 'description', 'created_at', 'updated_at'),
+        column_types=('uuid', 'text', 'text', 'timestamp', 'timestamp'),
+        model=Genre,
+    ),
+    Table(
+        name='person',
+        columns=('id', 'full_name', 'created', 'modified'),
+        sqlite_columns=('id', 'full_name', 'created_at', 'updated_at'),
+        column_types=('uuid', 'text', 'timestamp', 'timestamp'),
+        model=Person,
+    ),
+    Table(
+        name='genre_film_work',
+        columns=('id', 'genre_id', 'film_work_id', 'created'),
+        sqlite_columns=('id', 'genre_id', 'film_work_id', 'created_at'),
+        column_types=('uuid', 'uuid', 'uuid', 'timestamp'),
+        model=GenreFilmwork,
+        depends_on=('genre', 'film_work'),
+        version_column='created',
+    ),
+    Table(
+        name='person_film_work',
+        columns=('id', 'person_id', 'film_work_id', 'role', 'created'),
+        sqlite_columns=('id', 'person_id', 'film_work_id', 'role', 'created_at'),
+        column_types=('uuid', 'uuid', 'uuid', 'text', 'timestamp'),
+        model=PersonFilmwork,
+        depends_on=('person', 'film_work'),
+        version_column='created',
+    ),
+)
+
+TABLES_BY_NAME = {table.name: table for table in TABLES}
@@ -0,0 +1,46 @@
+"""Общие настройки и фикстуры модульных тестов."""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+from fakes import GENRE_DDL
+
+from sqlite_to_postgres.benchmarks.dataset import DatasetGenerator
+
+# Скрипты переноса (load_data, cdc) импортируют соседние модули без имени пакета.
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+
+@pytest.fixture
+def target_path(tmp_path) -> str:
+    """
+    Файл SQLite с таблицей genre в колонках Postgres.
+
+    Args:
+        tmp_path: временный каталог
+
+    Returns:
+        str: путь к файлу
+    """
+    path = str(tmp_path / 'target.sqlite')
+    with sqlite3.connect(path) as connection:
+        connection.execute(GENRE_DDL.format(created='created TEXT', modified='modified TEXT'))
+    return path
+
+
+@pytest.fixture
+def source_path(tmp_path) -> str:
+    """
+    Небольшая синтетическая БД SQLite со всеми переносимыми таблицами.
+
+    Args:
+        tmp_path: временный каталог
+
+    Returns:
+        str: путь к файлу
+    """
+    path = str(tmp_path / 'source.sqlite')
+    DatasetGenerator(films=50, genres=5, persons=40).generate(path)
+    return path
@@ -0,0 +1,198 @@
+"""Заменители Postgres на sqlite3 и данные для модульных тестов переноса."""
+
+import sqlite3
+
+import psycopg2
+
+GENRE_DDL = 'CREATE TABLE genre (id TEXT PRIMARY KEY, name TEXT NOT NULL, description TEXT, {created}, {modified});'
+TIMESTAMP = '2021-06-16 20:14:09.221855+00:00'
+
+
+class SQLiteCursor(object):
+    """Курсор sqlite3 с плейсхолдерами psycopg2; SET пропускаются."""
+
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        """
+        Init метод.
+
+        Args:
+            connection: соединение sqlite3 в режиме autocommit
+        """
+        self.connection = connection
+        self.curs = connection.cursor()
+
+    def __enter__(self) -> 'SQLiteCursor':
+        """
+        Вход в контекст.
+
+        Returns:
+            SQLiteCursor: курсор
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """
+        Закрывает курсор.
+
+        Args:
+            exc_info: исключение контекста
+        """
+        self.close()
+
+    def execute(self, query: str, params=()) -> None:
+        """
+        Выполняет запрос, открывая транзакцию, как это делает psycopg2.
+
+        Args:
+            query: запрос с плейсхолдерами %s
+            params: параметры
+        """
+        if query.startswith('SET '):
+            return
+        if not self.connection.in_transaction:
+            self.curs.execute('BEGIN;')
+        self.curs.execute(query.replace('%s', '?'), params)
+
+    def fetchall(self) -> list:
+        """
+        Возвращает строки результата.
+
+        Returns:
+            list: строки
+        """
+        return self.curs.fetchall()
+
+    def close(self) -> None:
+        """Закрывает курсор."""
+        self.curs.close()
+
+
+class SQLiteConnection(object):
+    """
+    Соединение sqlite3 с той частью интерфейса psycopg2, которой пользуются BatchCommitter и ConsistencyVerifier.
+
+    transient_errors и rollback_errors задают, сколько следующих записей и откатов завершатся ошибкой.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Init метод.
+
+        Args:
+            path: путь к файлу БД
+        """
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.closed = 0
+        self.transient_errors = 0
+        self.rollback_errors = 0
+
+    def cursor(self) -> SQLiteCursor:
+        """
+        Открывает курсор.
+
+        Returns:
+            SQLiteCursor: курсор
+        """
+        return SQLiteCursor(self.connection)
+
+    def commit(self) -> None:
+        """Фиксирует транзакцию."""
+        self.connection.commit()
+
+    def rollback(self) -> None:
+        """
+        Откатывает транзакцию.
+
+        Raises:
+            InterfaceError: откат должен завершиться ошибкой
+        """
+        if self.rollback_errors:
+            self.rollback_errors -= 1
+            raise psycopg2.InterfaceError('connection already closed')
+        self.connection.rollback()
+
+    def close(self) -> None:
+        """Закрывает соединение."""
+        self.connection.close()
+        self.closed = 1
+
+
+class SQLiteSaver(object):
+    """Пишет строки в SQLite вместо Postgres, превращая ошибки sqlite3 в ошибки psycopg2."""
+
+    def __init__(
+        self, pg_conn: SQLiteConnection, load_method: str, metrics=None, upsert: bool = False, only_newer: bool = True,
+    ) -> None:
+        """
+        Init метод.
+
+        Args:
+            pg_conn: соединение
+            load_method: способ записи, не используется
+            metrics: сборщик метрик, не используется
+            upsert: обновлять существующие строки, не используется
+            only_newer: обновлять только более новыми версиями, не используется
+        """
+        self.pg_conn = pg_conn
+        self.curs = pg_conn.cursor()
+
+    def save(self, table_name: str, rows: list) -> None:
+        """
+        Записывает строки.
+
+        Args:
+            table_name: имя таблицы
+            rows: список кортежей
+
+        Raises:
+            OperationalError: соединение должно оборваться
+            IntegrityError: строка нарушает ограничение таблицы
+        """
+        if self.pg_conn.transient_errors:
+            self.pg_conn.transient_errors -= 1
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        for row in rows:
+            try:
+                self.curs.execute('INSERT INTO {table} VALUES ({params});'.format(
+                    table=table_name, params=', '.join(['%s'] * len(row)),
+                ), row)
+            except sqlite3.IntegrityError as error:
+                raise psycopg2.IntegrityError(str(error))
+
+
+def make_genres(start: int, count: int, bad: tuple = ()) -> list:
+    """
+    Создаёт строки жанров; строки с номерами из bad нарушают NOT NULL.
+
+    Args:
+        start: номер первой строки
+        count: количество строк
+        bad: номера плохих строк
+
+    Returns:
+        list: список кортежей в порядке колонок genre
+    """
+    return [
+        (
+            '00000000-0000-0000-0000-{index:012d}'.format(index=index),
+            None if index in bad else 'Genre {index}'.format(index=index),
+            '',
+            TIMESTAMP,
+            TIMESTAMP,
+        )
+        for index in range(start, start + count)
+    ]
+
+
+def count_genres(path: str) -> int:
+    """
+    Считает зафиксированные строки genre.
+
+    Args:
+        path: путь к файлу БД
+
+    Returns:
+        int: количество строк
+    """
+    with sqlite3.connect(path) as connection:
+        return connection.execute('SELECT count(*) FROM genre;').fetchone()[0]
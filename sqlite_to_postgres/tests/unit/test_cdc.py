@@ -0,0 +1,78 @@
+"""Тесты применения журнала изменений SQLite к Postgres."""
+
+import sqlite3
+from contextlib import closing
+
+import cdc
+from cdc import ChangeDataCapture, collapse_changes, install_triggers
+from commit_policy import CommitPolicy
+from fakes import SQLiteConnection, SQLiteSaver, count_genres
+
+
+class MemoryPositionStore(object):
+    """Позиция журнала в памяти вместо таблицы cdc_position."""
+
+    def __init__(self, pg_conn: SQLiteConnection) -> None:
+        """
+        Init метод.
+
+        Args:
+            pg_conn: соединение, не используется
+        """
+        self.positions: dict = {}
+
+    def get(self, changelog: str) -> int:
+        """
+        Возвращает номер последней применённой записи журнала.
+
+        Args:
+            changelog: имя таблицы журнала
+
+        Returns:
+            int: номер записи или 0
+        """
+        return self.positions.get(changelog, 0)
+
+    def save(self, changelog: str, last_seq: int) -> None:
+        """
+        Запоминает позицию.
+
+        Args:
+            changelog: имя таблицы журнала
+            last_seq: номер последней записи пачки
+        """
+        self.positions[changelog] = last_seq
+
+
+def test_collapse_changes() -> None:
+    """От записей журнала остаётся последняя операция над каждой строкой."""
+    changes = [
+        (1, 'genre', 'a', 'I', ''),
+        (2, 'genre', 'a', 'U', ''),
+        (3, 'genre', 'b', 'I', ''),
+        (4, 'genre', 'b', 'D', ''),
+        (5, 'person', 'c', 'D', ''),
+        (6, 'person', 'c', 'I', ''),
+    ]
+    upserts, deletes = collapse_changes(changes)
+    assert dict(upserts) == {'genre': ['a'], 'person': ['c']}
+    assert dict(deletes) == {'genre': ['b']}
+
+
+def test_reset_closes_old_connection(monkeypatch, tmp_path, source_path, target_path) -> None:
+    """Если откат не удался, старое соединение закрывается перед открытием нового."""
+    monkeypatch.setattr(cdc, 'PostgresSaver', SQLiteSaver)
+    monkeypatch.setattr(cdc, 'ChangelogPositionStore', MemoryPositionStore)
+    with closing(sqlite3.connect(source_path)) as connection:
+        install_triggers(connection)
+        with connection:
+            connection.execute("UPDATE genre SET name = 'Renamed' WHERE rowid = 1;")
+        pg_conn = SQLiteConnection(target_path)
+        policy = CommitPolicy(backoff_seconds=0, reject_path=str(tmp_path / 'rejected.jsonl'))
+        capture = ChangeDataCapture(connection, pg_conn, policy=policy, reconnect=lambda: SQLiteConnection(target_path))
+        pg_conn.transient_errors = 1
+        pg_conn.rollback_errors = 1
+        assert capture.apply_once() == 1
+    assert pg_conn.closed
+    assert capture.pg_conn is not pg_conn
+    assert count_genres(target_path) == 1
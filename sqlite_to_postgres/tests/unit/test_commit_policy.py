@@ -0,0 +1,80 @@
+"""Тесты записи пачек с повторами, делением пачек и отказами."""
+
+import json
+
+import pytest
+from fakes import SQLiteConnection, SQLiteSaver, count_genres, make_genres
+
+from sqlite_to_postgres import commit_policy
+from sqlite_to_postgres.commit_policy import BatchCommitter, CommitPolicy
+from sqlite_to_postgres.data_types import Batch
+
+
+@pytest.fixture
+def committer_factory(monkeypatch, tmp_path):
+    """
+    Создаёт BatchCommitter, который пишет в SQLite без задержек между повторами.
+
+    Args:
+        monkeypatch: фикстура pytest
+        tmp_path: временный каталог
+
+    Returns:
+        Callable: функция (соединение, reconnect) -> BatchCommitter
+    """
+    monkeypatch.setattr(commit_policy, 'PostgresSaver', SQLiteSaver)
+    policy = CommitPolicy(backoff_seconds=0, reject_path=str(tmp_path / 'rejected.jsonl'))
+    return lambda pg_conn, reconnect=None: BatchCommitter(pg_conn, policy, reconnect=reconnect)
+
+
+def read_rejects(committer: BatchCommitter) -> list:
+    """
+    Читает файл отказов.
+
+    Args:
+        committer: объект записи
+
+    Returns:
+        list: id отвергнутых строк
+    """
+    with open(committer.policy.reject_path) as reject_file:
+        return [json.loads(line)['row'][0] for line in reject_file]
+
+
+def test_bisection_rejects_only_bad_rows(committer_factory, target_path) -> None:
+    """Пачка с плохими строками делится, пока они не найдутся; остальные строки сохраняются."""
+    committer = committer_factory(SQLiteConnection(target_path))
+    rows = make_genres(0, 10, bad=(3, 7))
+    committer.write('genre', Batch(rows, 10))
+    committer.commit()
+    assert committer.rejected == 2
+    assert read_rejects(committer) == [rows[3][0], rows[7][0]]
+    assert count_genres(target_path) == 8
+
+
+def test_retry_does_not_reject_twice(committer_factory, target_path) -> None:
+    """Повтор транзакции после обрыва пропускает уже отвергнутые строки."""
+    pg_conn = SQLiteConnection(target_path)
+    committer = committer_factory(pg_conn)
+    first = make_genres(0, 4, bad=(1,))
+    committer.write('genre', Batch(first, 4))
+    pg_conn.transient_errors = 1
+    committer.write('genre', Batch(make_genres(4, 4), 8))
+    committer.commit()
+    assert committer.rejected == 1
+    assert read_rejects(committer) == [first[1][0]]
+    assert count_genres(target_path) == 7
+
+
+def test_reconnect_closes_old_connection(committer_factory, target_path) -> None:
+    """Если откат не удался, старое соединение закрывается перед открытием нового."""
+    pg_conn = SQLiteConnection(target_path)
+    committer = committer_factory(pg_conn, reconnect=lambda: SQLiteConnection(target_path))
+    committer.write('genre', Batch(make_genres(0, 4), 4))
+    pg_conn.transient_errors = 1
+    pg_conn.rollback_errors = 1
+    committer.write('genre', Batch(make_genres(4, 4), 8))
+    committer.commit()
+    assert pg_conn.closed
+    assert committer.pg_conn is not pg_conn
+    assert count_genres(target_path) == 8
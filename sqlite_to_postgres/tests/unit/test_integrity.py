@@ -0,0 +1,62 @@
+"""Тесты проверки ссылок таблиц связей на родительские строки."""
+
+import json
+import sqlite3
+import uuid
+from contextlib import closing
+
+from sqlite_to_postgres.integrity import ReferentialIntegrityFilter, UuidKeySet
+from sqlite_to_postgres.sqlite_extractor import SQLiteExtractor
+
+
+def test_uuid_key_set_membership() -> None:
+    """Есть только добавленные ключи, в том числе добавленные после первой проверки."""
+    keys = [uuid.UUID(int=index << 64 | index) for index in range(100)] + [uuid.uuid4() for _ in range(1000)]
+    key_set = UuidKeySet()
+    for key in keys[:-1]:
+        key_set.add(str(key))
+    assert all(key in key_set for key in keys[:-1])
+    assert keys[-1] not in key_set
+    key_set.add(keys[-1])
+    assert keys[-1] in key_set
+    assert len(key_set) == len(keys)
+    assert 'not a uuid' not in key_set
+    assert None not in key_set
+
+
+def test_uuid_key_set_same_high_half() -> None:
+    """Ключи с одинаковыми старшими 8 байтами различаются по младшим."""
+    key_set = UuidKeySet()
+    for low in (3, 1, 2):
+        key_set.add(uuid.UUID(int=7 << 64 | low))
+    assert all(uuid.UUID(int=7 << 64 | low) in key_set for low in (1, 2, 3))
+    assert uuid.UUID(int=7 << 64 | 4) not in key_set
+    assert uuid.UUID(int=7 << 64) not in key_set
+
+
+def test_filter_rejects_orphans(tmp_path, source_path) -> None:
+    """Строки связей с отсутствующими родителями убираются из пачек и пишутся в отчёт."""
+    orphans = [str(uuid.uuid4()) for _ in range(2)]
+    with closing(sqlite3.connect(source_path)) as connection:
+        person_id, film_work_id = connection.execute('SELECT person_id, film_work_id FROM person_film_work;').fetchone()
+        with connection:
+            connection.executemany('INSERT INTO person_film_work VALUES (?, ?, ?, ?, ?);', [
+                (orphans[0], film_work_id, str(uuid.uuid4()), 'actor', None),
+                (orphans[1], str(uuid.uuid4()), person_id, 'actor', None),
+            ])
+        total = connection.execute('SELECT count(*) FROM person_film_work;').fetchone()[0]
+        report_path = tmp_path / 'orphaned_rows.jsonl'
+        integrity = ReferentialIntegrityFilter(connection, reject_path=str(report_path))
+        batches = integrity.filter_batches(
+            'person_film_work', SQLiteExtractor(connection, batch_size=50).iter_table('person_film_work'),
+        )
+        ids = [row[0] for batch in batches for row in batch.rows]
+
+    assert len(ids) == total - 2
+    assert not set(orphans) & set(ids)
+    assert integrity.rejected == 2
+    report = [json.loads(line) for line in report_path.read_text().splitlines()]
+    assert [(entry['row'][0], list(entry['missing'])) for entry in report] == [
+        (orphans[0], ['person_id']),
+        (orphans[1], ['film_work_id']),
+    ]
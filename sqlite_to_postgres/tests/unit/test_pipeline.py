@@ -0,0 +1,54 @@
+"""Тесты чтения пачек в отдельном потоке."""
+
+import sqlite3
+import threading
+
+import pytest
+
+from sqlite_to_postgres.data_types import Batch
+from sqlite_to_postgres.pipeline import prefetch
+from sqlite_to_postgres.sharded_extractor import ShardedSQLiteExtractor
+
+
+def test_prefetch_keeps_order() -> None:
+    """Пачки отдаются в исходном порядке."""
+    batches = [Batch([(index,)], index) for index in range(10)]
+    assert list(prefetch(iter(batches), 'genre', depth=2)) == batches
+
+
+def test_prefetch_raises_reader_error() -> None:
+    """Ошибка чтения поднимается у потребителя после уже прочитанных пачек."""
+    def read():
+        yield Batch([(1,)], 1)
+        raise sqlite3.OperationalError('disk I/O error')
+
+    batches = prefetch(read(), 'genre', depth=2)
+    assert next(batches).last_rowid == 1
+    with pytest.raises(sqlite3.OperationalError):
+        next(batches)
+
+
+def test_prefetch_stops_reader() -> None:
+    """Если потребитель прекращает итерацию, поток чтения закрывает генератор и завершается."""
+    closed = threading.Event()
+
+    def read():
+        try:
+            index = 0
+            while True:
+                index += 1
+                yield Batch([(index,)], index)
+        finally:
+            closed.set()
+
+    batches = prefetch(read(), 'genre', depth=2)
+    next(batches)
+    batches.close()
+    assert closed.is_set()
+
+
+def test_prefetch_sharded_extractor(source_path) -> None:
+    """Параллельное чтение работает в потоке prefetch, хотя соединение открыто в главном потоке."""
+    extractor = ShardedSQLiteExtractor(source_path, workers=2, shard_size=20)
+    expected = list(extractor.iter_table('film_work'))
+    assert list(prefetch(extractor.iter_table('film_work'), 'film_work', depth=2)) == expected
@@ -0,0 +1,27 @@
+"""Тесты параллельного чтения SQLite по диапазонам rowid."""
+
+import sqlite3
+from contextlib import closing
+
+from sqlite_to_postgres.sharded_extractor import ShardedSQLiteExtractor, split_rowid_ranges
+from sqlite_to_postgres.sqlite_extractor import SQLiteExtractor
+
+
+def test_split_rowid_ranges() -> None:
+    """Диапазоны покрывают rowid от минимального до максимального ровно один раз."""
+    assert split_rowid_ranges(1, 10, 4) == [(0, 4), (4, 8), (8, 10)]
+    assert split_rowid_ranges(5, 5, 100) == [(4, 5)]
+    assert split_rowid_ranges(None, None, 100) == []
+    ranges = split_rowid_ranges(7, 1000, 33)
+    covered = [rowid for after_rowid, until_rowid in ranges for rowid in range(after_rowid + 1, until_rowid + 1)]
+    assert covered == list(range(7, 1001))
+
+
+def test_sharded_extractor_matches_single_cursor(source_path) -> None:
+    """Параллельное чтение отдаёт те же строки в том же порядке, что и одно соединение."""
+    with closing(sqlite3.connect(source_path)) as connection:
+        expected = [row for batch in SQLiteExtractor(connection).iter_table('person_film_work') for row in batch.rows]
+    extractor = ShardedSQLiteExtractor(source_path, workers=2, shard_size=37, batch_size=10)
+    batches = list(extractor.iter_table('person_film_work'))
+    assert [row for batch in batches for row in batch.rows] == expected
+    assert [batch.last_rowid for batch in batches] == sorted(batch.last_rowid for batch in batches)
@@ -0,0 +1,59 @@
+"""Тесты проверки целостности данных после переноса."""
+
+import sqlite3
+
+from fakes import GENRE_DDL, SQLiteConnection, SQLiteCursor, make_genres
+
+from sqlite_to_postgres.verifier import ConsistencyVerifier
+
+
+def test_verifier_reports_differences(tmp_path, target_path) -> None:
+    """Проверка по частям находит отсутствующие, лишние и отличающиеся строки, в том числе после последнего id."""
+    rows = make_genres(0, 7)
+    source = sqlite3.connect(str(tmp_path / 'source.sqlite'))
+    source.execute(GENRE_DDL.format(created='created_at TEXT', modified='updated_at TEXT'))
+    source.executemany('INSERT INTO genre VALUES (?, ?, ?, ?, ?);', rows[:5])
+    with sqlite3.connect(target_path) as target:
+        changed = (rows[1][0], 'Renamed', *rows[1][2:])
+        target.executemany('INSERT INTO genre VALUES (?, ?, ?, ?, ?);', [rows[0], changed, *rows[3:]])
+
+    report = ConsistencyVerifier(source, SQLiteConnection(target_path), chunk_size=2).verify_table('genre')
+    assert (report['source_rows'], report['target_rows']) == (5, 6)
+    assert (report['missing'], report['extra'], report['mismatched']) == (1, 2, 1)
+    assert report['samples']['missing'] == [rows[2][0]]
+    assert sorted(report['samples']['extra']) == [rows[5][0], rows[6][0]]
+    assert report['samples']['mismatched'] == [{'id': rows[1][0], 'columns': ['name']}]
+
+
+def test_verifier_pages_target_of_empty_source(tmp_path, target_path) -> None:
+    """Все строки Postgres при пустой таблице SQLite считаются лишними."""
+    source = sqlite3.connect(str(tmp_path / 'source.sqlite'))
+    source.execute(GENRE_DDL.format(created='created_at TEXT', modified='updated_at TEXT'))
+    with sqlite3.connect(target_path) as target:
+        target.executemany('INSERT INTO genre VALUES (?, ?, ?, ?, ?);', make_genres(0, 5))
+
+    report = ConsistencyVerifier(source, SQLiteConnection(target_path), chunk_size=2).verify_table('genre')
+    assert (report['source_rows'], report['target_rows'], report['extra']) == (0, 5, 5)
+    assert not report['ok']
+
+
+def test_verifier_pages_target_inside_chunk(tmp_path, target_path, monkeypatch) -> None:
+    """Лишние строки Postgres внутри диапазона части читаются страницами не больше chunk_size."""
+    rows = make_genres(0, 10)
+    source = sqlite3.connect(str(tmp_path / 'source.sqlite'))
+    source.execute(GENRE_DDL.format(created='created_at TEXT', modified='updated_at TEXT'))
+    source.executemany('INSERT INTO genre VALUES (?, ?, ?, ?, ?);', [rows[0], rows[9]])
+    with sqlite3.connect(target_path) as target:
+        target.executemany('INSERT INTO genre VALUES (?, ?, ?, ?, ?);', rows)
+    fetched = []
+    fetchall = SQLiteCursor.fetchall
+
+    def record_fetchall(curs: SQLiteCursor) -> list:
+        fetched.append(fetchall(curs))
+        return fetched[-1]
+
+    monkeypatch.setattr(SQLiteCursor, 'fetchall', record_fetchall)
+
+    report = ConsistencyVerifier(source, SQLiteConnection(target_path), chunk_size=3).verify_table('genre')
+    assert (report['source_rows'], report['target_rows'], report['extra'], report['missing']) == (2, 10, 8, 0)
+    assert max(map(len, fetched)) == 3
@@ -0,0 +1,172 @@
+"""Проверка целостности данных после переноса из SQLite в Postgres."""
+
+import sqlite3
+from typing import Callable, Iterator, Optional
+
+from psycopg2.extensions import connection as _connection
+
+from sqlite_to_postgres.converters import (parse_date, parse_timestamp,
+                                           parse_uuid)
+from sqlite_to_postgres.tables import TABLES, TABLES_BY_NAME
+
+CHUNK_SIZE = 10000
+MAX_SAMPLES = 100
+
+# Приводят значения из SQLite и из Postgres к одинаковым типам Python.
+NORMALIZERS = {
+    'uuid': parse_uuid,
+    'text': lambda value: value,
+    'float': lambda value: None if value is None else float(value),
+    'date': parse_date,
+    'timestamp': parse_timestamp,
+}
+
+
+class ConsistencyVerifier(object):
+    """
+    Сравнивает таблицы SQLite и Postgres частями по диапазонам id.
+
+    Каждая часть читается из SQLite одним запросом, а тот же диапазон id из
+    Postgres - страницами по chunk_size строк, сравниваются все перенесённые
+    колонки. В памяти одновременно находятся одна часть SQLite и одна страница
+    Postgres, даже если в диапазоне много лишних строк Postgres, в отчёт
+    попадают количества расхождений и не больше max_samples примеров каждого вида.
+    Диапазоны строятся по id в SQLite, поэтому id должны храниться в каноническом
+    виде (строчные буквы), чтобы порядок совпадал с порядком uuid в Postgres.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        pg_conn: _connection,
+        chunk_size: int = CHUNK_SIZE,
+        max_samples: int = MAX_SAMPLES,
+    ) -> None:
+        """
+        Init метод.
+
+        Args:
+            connection: соединение с SQLite
+            pg_conn: соединение с Postgres
+            chunk_size: количество строк SQLite в одной части
+            max_samples: максимальное количество примеров каждого вида расхождений в отчёте
+        """
+        self.connection = connection
+        self.pg_conn = pg_conn
+        self.chunk_size = chunk_size
+        self.max_samples = max_samples
+
+    def verify(self) -> dict:
+        """
+        Проверяет все таблицы из реестра.
+
+        Returns:
+            dict: отчёт вида {'ok': bool, 'tables': {имя таблицы: отчёт по таблице}}
+        """
+        tables = {table.name: self.verify_table(table.name) for table in TABLES}
+        return {
+            'ok': all(report['ok'] for report in tables.values()),
+            'tables': tables,
+        }
+
+    def verify_table(self, table_name: str) -> dict:
+        """
+        Проверяет одну таблицу.
+
+        Args:
+            table_name: имя таблицы из TABLES
+
+        Returns:
+            dict: количество проверенных строк, отсутствующих в Postgres (missing),
+                лишних в Postgres (extra) и отличающихся (mismatched) строк с примерами
+        """
+        table = TABLES_BY_NAME[table_name]
+        normalize = self._make_normalizer(table.column_types)
+        report = {
+            'source_rows': 0,
+            'target_rows': 0,
+            'missing': 0,
+            'extra': 0,
+            'mismatched': 0,
+            'samples': {'missing': [], 'extra': [], 'mismatched': []},
+        }
+        sqlite_curs = self.connection.cursor()
+        sqlite_curs.row_factory = None
+        pg_curs = self.pg_conn.cursor()
+        source_query = 'SELECT {columns} FROM {table} WHERE id > ? ORDER BY id LIMIT ?;'.format(
+            columns=', '.join(table.sqlite_columns), table=table.name,
+        )
+        lower = None
+        while True:
+            sqlite_curs.execute(source_query, ('' if lower is None else lower, self.chunk_size))
+            source_rows = sqlite_curs.fetchall()
+            if source_rows:
+                upper = source_rows[-1][0]
+                target_rows = self._iter_target(pg_curs, table, lower, upper)
+                self._compare(table.columns, map(normalize, source_rows), map(normalize, target_rows), report)
+                lower = upper
+            if len(source_rows) < self.chunk_size:
+                break
+        # Строки Postgres после последнего id SQLite - лишние.
+        self._compare(table.columns, (), map(normalize, self._iter_target(pg_curs, table, lower)), report)
+        sqlite_curs.close()
+        pg_curs.close()
+        report['ok'] = not (report['missing'] or report['extra'] or report['mismatched'])
+        return report
+
+    def _iter_target(self, pg_curs, table, lower: Optional[str], upper: Optional[str] = None) -> Iterator[tuple]:
+        while True:
+            pg_curs.execute(*self._target_query(table, lower, upper))
+            rows = pg_curs.fetchall()
+            yield from rows
+            if len(rows) < self.chunk_size:
+                return
+            lower = str(rows[-1][0])
+
+    def _target_query(self, table, lower: Optional[str], upper: Optional[str] = None) -> tuple:
+        conditions = []
+        params: list = []
+        if lower is not None:
+            conditions.append('id > %s')
+            params.append(lower)
+        if upper is not None:
+            conditions.append('id <= %s')
+            params.append(upper)
+        query = 'SELECT {columns} FROM {table}{where} ORDER BY id LIMIT %s;'.format(
+            columns=', '.join(table.columns),
+            table=table.name,
+            where=' WHERE {0}'.format(' AND '.join(conditions)) if conditions else '',
+        )
+        params.append(self.chunk_size)
+        return query, params
+
+    def _make_normalizer(self, column_types: tuple) -> Callable[[tuple], tuple]:
+        normalizers = tuple(NORMALIZERS[column_type] for column_type in column_types)
+        return lambda row: tuple(normalizer(value) for normalizer, value in zip(normalizers, row))
+
+    def _compare(self, columns: tuple, source_rows, target_rows, report: dict) -> None:
+        # Строки Postgres перебираются по одной, поэтому в памяти остаётся только часть SQLite.
+        source = {row[0]: row for row in source_rows}
+        report['source_rows'] += len(source)
+        samples = report['samples']
+        for target_row in target_rows:
+            report['target_rows'] += 1
+            source_row = source.pop(target_row[0], None)
+            if source_row is None:
+                report['extra'] += 1
+                self._add_sample(samples['extra'], str(target_row[0]))
+                continue
+            differences = [
+                column for column, source_value, target_value in zip(columns, source_row, target_row)
+                if source_value != target_value
+            ]
+            if differences:
+                report['mismatched'] += 1
+                self._add_sample(samples['mismatched'], {'id': str(target_row[0]), 'columns': differences})
+        for row_id in source:
+            report['missing'] += 1
+            self._add_sample(samples['missing'], str(row_id))
+
+    def _add_sample(self, samples: list, sample) -> None:
+        if len(samples) < self.max_samples:
+            samples.append(sample)